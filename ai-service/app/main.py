@@ -1,20 +1,47 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, Header, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import numpy as np
 import uvicorn
 import os
 from dotenv import load_dotenv
 from typing import List, Optional
-import shutil
+import asyncio
+import functools
+import json
+import hashlib
+import logging
+import multiprocessing
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 from app.services.feature_extractor import FeatureExtractor
 from app.services.similarity_search import SimilaritySearch
+from app.services.ann_index import create_ann_index
+from app.services.quantization import ScalarQuantizer
+from app.services.inference_batcher import InferenceBatcher
+from app.services.embedding_store import EmbeddingStore
+from app.services.neighbor_table import NeighborTable
+from app.services.shard_pool import ShardPool
+from app.services.dedup_index import DuplicateIndex
 from app.utils.image_processor import ImageProcessor
 from app.utils.backend_client import BackendClient
+from app.utils.executors import BoundedExecutor, ExecutorSaturatedError
+from app.utils.lru_cache import LRUCache
+from app.utils.rwlock import ReadWriteLock
+from app.utils.metrics import REGISTRY, STAGE_SECONDS, Registry, counter, gauge, histogram
+from app.utils.vector_codec import RAW_MEDIA_TYPE, encode_vector, encode_vector_base64, negotiate
 
 load_dotenv()
 
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Apsara Closet AI Service",
     description="AI-powered visual search for fashion products",
@@ -31,24 +58,397 @@ app.add_middleware(
 )
 
 # Initialize services
-feature_extractor = FeatureExtractor()
-similarity_search = SimilaritySearch()
-image_processor = ImageProcessor()
+feature_extractor = FeatureExtractor.from_env()
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none").lower()  # none, float16, int8
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", 1))  # search worker processes, 1 = search in-process
+shard_pool = ShardPool(
+    INDEX_SHARDS,
+    timeout=float(os.getenv("INDEX_SHARD_TIMEOUT", 5))  # seconds before a worker is replaced
+) if INDEX_SHARDS > 1 else None
+INDEX_DEDUP = os.getenv("INDEX_DEDUP", "false").lower() == "true"  # collapse near-duplicate products
+# Index snapshots; with quantization the float32 rows are also read from here instead of RAM
+embedding_store = EmbeddingStore(os.getenv("EMBEDDING_STORE_DIR", "data/embeddings"))
+similarity_search = SimilaritySearch(
+    ann_index=create_ann_index(
+        os.getenv("INDEX_BACKEND", "exact"),
+        nlist=int(os.getenv("IVF_NLIST", 256)),
+        nprobe=int(os.getenv("IVF_NPROBE", 16))
+    ),
+    quantizer=ScalarQuantizer(INDEX_QUANTIZATION) if INDEX_QUANTIZATION != "none" else None,
+    rerank_factor=int(os.getenv("INDEX_RERANK_FACTOR", 4)),
+    aggregation=os.getenv("INDEX_AGGREGATION", "max"),  # max, mean (of the best INDEX_TOP_M images)
+    top_m=int(os.getenv("INDEX_TOP_M", 3)),
+    shards=shard_pool,
+    dedup=DuplicateIndex(
+        similarity=float(os.getenv("DEDUP_SIMILARITY", 0.97)),
+        max_distance=int(os.getenv("DEDUP_HASH_DISTANCE", 3))
+    ) if INDEX_DEDUP else None,
+    color_weight=float(os.getenv("COLOR_RERANK_WEIGHT", 0.3)),  # 0 disables the colour re-rank
+    color_candidates=int(os.getenv("COLOR_RERANK_CANDIDATES", 200)),
+    store=embedding_store
+)
+image_processor = ImageProcessor(
+    fast_mode=os.getenv("IMAGE_DECODE_MODE", "quality").lower() == "fast",
+    max_pixels=int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))
+)
 backend_client = BackendClient()
 
+# CPU-bound stages run off the event loop: PIL decoding in worker processes,
+# TensorFlow inference in threads (TF releases the GIL). Workers are spawned,
+# not forked, so they never inherit TensorFlow's threads and locks. A pool
+# whose worker died is replaced on the next job (or readiness probe)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", os.cpu_count() or 1))
+image_pool = functools.partial(
+    ProcessPoolExecutor, max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+)
+image_executor = BoundedExecutor(
+    image_pool(),
+    max_pending=int(os.getenv("IMAGE_QUEUE_DEPTH", IMAGE_WORKERS * 4)),
+    name="Image processing",
+    factory=image_pool
+)
+inference_batcher = InferenceBatcher(
+    feature_extractor,
+    max_batch_size=int(os.getenv("INFERENCE_BATCH_SIZE", 16)),
+    max_wait_ms=float(os.getenv("INFERENCE_BATCH_WAIT_MS", 5)),
+    max_queue_size=int(os.getenv("INFERENCE_QUEUE_DEPTH", 64)),
+    executor=ThreadPoolExecutor(max_workers=int(os.getenv("INFERENCE_THREADS", 1)))
+)
+
+# Prometheus metrics, served on /metrics. Live values (queues, index size,
+# cache counters) are read when scraped instead of being updated in place
+REQUESTS = counter("ai_requests_total", "HTTP requests by route and status", ["endpoint", "status"])
+REQUEST_SECONDS = histogram("ai_request_duration_seconds", "HTTP request latency by route", ["endpoint"])
+gauge("ai_inference_queue_depth", "Requests waiting for the model", function=lambda: inference_batcher.queue_depth)
+gauge("ai_image_executor_pending", "Uploads queued or being decoded", function=lambda: image_executor.pending)
+counter(
+    "ai_image_executor_restarts_total", "Image worker pools replaced after a worker died",
+    function=lambda: image_executor.restarts
+)
+gauge("ai_index_vectors", "Image vectors in the catalog index", function=lambda: similarity_search.size)
+gauge("ai_index_products", "Products in the catalog index", function=lambda: similarity_search.product_count)
+gauge(
+    "ai_index_memory_bytes", "Bytes allocated per catalog index array", ["array"],
+    function=lambda: {(name,): size for name, size in similarity_search.memory_usage().items() if name != "total"}
+)
+gauge("ai_neighbor_table_products", "Products with precomputed neighbours", function=lambda: neighbor_table.size)
+
+def _cache_stat(field: str):
+    return lambda: {
+        ("embeddings",): embedding_cache.stats()[field],
+        ("results",): result_cache.stats()[field],
+    }
+
+for _field in ("hits", "misses", "evictions"):
+    counter(f"ai_cache_{_field}_total", f"Query cache {_field}", ["cache"], function=_cache_stat(_field))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them per route template (not per raw path)"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUESTS.inc(endpoint=endpoint, status=str(status))
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
 # Directories
 UPLOAD_DIR = Path("uploads")
-TEMP_DIR = Path("temp")
 UPLOAD_DIR.mkdir(exist_ok=True)
-TEMP_DIR.mkdir(exist_ok=True)
+
+# Uploads are decoded from memory; reject anything bigger than this
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", 20)) * 1024 * 1024
+
+# Batch extraction (catalog ingestion)
+EXTRACT_BATCH_SIZE = int(os.getenv("EXTRACT_BATCH_SIZE", 32))  # images per model call
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", 1000))  # images per request
+# Batch uploads are held in memory until processed; cap their total size per request
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_MB", 200)) * 1024 * 1024
+
+# Query caches: (embedding, colour histogram) by upload content hash, and final results per index version
+embedding_cache = LRUCache(
+    capacity=int(float(os.getenv("EMBEDDING_CACHE_MB", 64)) * 1024 * 1024),
+    sizeof=lambda entry: entry[0].nbytes + entry[1].nbytes
+)
+result_cache = LRUCache(capacity=int(os.getenv("RESULT_CACHE_SIZE", 1000)))
+
+# Catalog index
+CATALOG_FETCH_LIMIT = int(os.getenv("CATALOG_FETCH_LIMIT", 100000))
+# Full re-fetch (also catches hard-deleted products the change feed can't see)
+INDEX_REFRESH_INTERVAL = int(os.getenv("INDEX_REFRESH_INTERVAL", 3600))  # seconds, 0 disables
+# Incremental sync from the backend change feed
+INDEX_SYNC_INTERVAL = float(os.getenv("INDEX_SYNC_INTERVAL", 5))  # seconds, 0 disables
+INDEX_SYNC_OVERLAP = float(os.getenv("INDEX_SYNC_OVERLAP", 5))  # re-read window for late commits
+# Searches read the index concurrently (in executor threads); syncs write it
+index_lock = ReadWriteLock()
+# One sync at a time; a sync fetches from the backend unlocked and only takes
+# index_lock for writing while it applies what it fetched
+sync_lock = asyncio.Lock()
+sync_cursor: Optional[str] = None  # change-feed watermark (backend timestamp)
+# Index changes are snapshotted at most this often (0 = after every change);
+# a restart replays anything newer from the change feed
+INDEX_SNAPSHOT_INTERVAL = float(os.getenv("INDEX_SNAPSHOT_INTERVAL", 300))
+# `rows_version` of the index rows in the live snapshot (None = no snapshot yet)
+snapshot_state = {"dirty": False, "rows_version": None}
+
+# Precomputed "more like this" neighbours for /similar/{product_id}
+NEIGHBOR_TABLE_K = int(os.getenv("NEIGHBOR_TABLE_K", 20))  # neighbours per product, 0 disables
+neighbor_table = NeighborTable(
+    k=max(NEIGHBOR_TABLE_K, 1),
+    path=os.getenv("NEIGHBOR_TABLE_PATH", "data/neighbors/table.npz")
+)
+neighbor_state = {"task": None, "pending": False}
+
+def restore_index() -> bool:
+    """Load the index from the latest on-disk snapshot (memory-mapped)"""
+    global sync_cursor
+    snapshot = embedding_store.load(
+        feature_extractor.model_name,
+        feature_extractor.model_version,
+        feature_extractor.feature_size
+    )
+    if snapshot is None:
+        return False
+    similarity_search.load_index(*snapshot)
+    sync_cursor = (embedding_store.read_manifest() or {}).get("sync_cursor")
+    snapshot_state["rows_version"] = similarity_search.rows_version
+    return True
+
+async def snapshot_index():
+    """Persist the current index to the embedding store (caller holds index_lock)"""
+    rows_version = similarity_search.rows_version
+    await asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(embedding_store.save, reuse_rows=snapshot_state["rows_version"] == rows_version),
+        similarity_search.matrix[:similarity_search.size],
+        list(similarity_search.product_ids),
+        dict(similarity_search.products),
+        feature_extractor.model_name,
+        feature_extractor.model_version,
+        {"sync_cursor": sync_cursor},
+        similarity_search.histograms[:similarity_search.size] if similarity_search.histograms is not None else None
+    )
+    snapshot_state.update(dirty=False, rows_version=rows_version)
+
+async def request_snapshot():
+    """Snapshot a changed index, now or at the next scheduled snapshot (caller holds index_lock)"""
+    snapshot_state["dirty"] = True
+    if INDEX_SNAPSHOT_INTERVAL <= 0 or snapshot_state["rows_version"] is None:
+        await snapshot_index()
+
+async def save_pending_snapshot():
+    """Scheduled job: snapshot the index if it changed since the last snapshot"""
+    if not snapshot_state["dirty"]:
+        return
+    async with index_lock.read():
+        await snapshot_index()
+
+async def _apply_changes(apply, cursor: Optional[str]):
+    """
+    Run `apply()` on the index under the write lock and move the cursor (caller holds sync_lock)
+    
+    Returns:
+        (stats returned by apply, whether the index changed)
+    """
+    global sync_cursor
+    async with index_lock.write():
+        version = similarity_search.version
+        stats = await asyncio.get_running_loop().run_in_executor(None, apply)
+        if cursor is not None:
+            sync_cursor = cursor
+        changed = similarity_search.version != version
+        if changed:
+            result_cache.clear()
+    
+    if changed:
+        async with index_lock.read():
+            await request_snapshot()
+        schedule_neighbor_update()
+    return stats, changed
+
+async def _full_refresh():
+    """Fetch the whole catalog and sync the index to it (caller holds sync_lock)"""
+    # Take the cursor first so changes made during the full fetch are picked up next sync
+    with STAGE_SECONDS.time(stage="change_feed"):
+        changes = await backend_client.get_feature_changes()
+    
+    with STAGE_SECONDS.time(stage="catalog_fetch"):
+        products = await backend_client.get_products_with_features(limit=CATALOG_FETCH_LIMIT)
+    if not products and similarity_search.size > 0:
+        # Backend unreachable or empty response - keep serving the current index
+        logger.warning("⚠️  Catalog fetch returned nothing, keeping current index")
+        return {"upserted": 0, "removed": 0}
+    
+    stats, _ = await _apply_changes(
+        functools.partial(similarity_search.sync_products, products),
+        changes["cursor"] if changes is not None else None
+    )
+    return stats
+
+async def refresh_index():
+    """Pull the catalog from the backend and sync it into the resident index"""
+    async with sync_lock:
+        return await _full_refresh()
+
+def _overlapped(cursor: str) -> str:
+    """Step a cursor back by INDEX_SYNC_OVERLAP (upserts are idempotent)"""
+    timestamp = datetime.fromisoformat(cursor.replace("Z", "+00:00"))
+    return (timestamp - timedelta(seconds=INDEX_SYNC_OVERLAP)).isoformat()
+
+async def sync_index_changes():
+    """Apply catalog changes since the last sync (full refresh if there's no cursor)"""
+    async with sync_lock:
+        if sync_cursor is None:
+            return await _full_refresh()
+        
+        with STAGE_SECONDS.time(stage="change_feed"):
+            changes = await backend_client.get_feature_changes(since=_overlapped(sync_cursor))
+        if changes is None:
+            return {"upserted": 0, "removed": 0}
+        if changes["has_more"]:
+            # Too far behind for the feed - start over from a full fetch
+            return await _full_refresh()
+        
+        stats, changed = await _apply_changes(lambda: {
+            "upserted": similarity_search.upsert_products(changes["products"]),
+            "removed": similarity_search.remove_products(changes["removed"]),
+        }, changes["cursor"])
+        if changed:
+            logger.info("📚 Index synced from change feed: %d upserted, %d removed", stats["upserted"], stats["removed"])
+        return stats
+
+def neighbor_table_meta() -> dict:
+    """Settings a saved neighbour table must match to be reused"""
+    return {
+        "model_name": feature_extractor.model_name,
+        "model_version": feature_extractor.model_version,
+        "aggregation": similarity_search.aggregation,
+        "top_m": similarity_search.top_m,
+        "threshold": similarity_search.similarity_threshold,
+        "dedup": INDEX_DEDUP,
+    }
+
+async def update_neighbor_table():
+    """Recompute the neighbour rows affected by index changes, in chunks"""
+    loop = asyncio.get_running_loop()
+    while True:
+        neighbor_state["pending"] = False
+        async with index_lock.read():
+            pending = await loop.run_in_executor(None, neighbor_table.plan, similarity_search)
+        
+        # The index is only locked per chunk, so syncs can run during a full build
+        for start in range(0, len(pending), neighbor_table.chunk_size):
+            async with index_lock.read():
+                await loop.run_in_executor(
+                    None, neighbor_table.compute, similarity_search, pending[start:start + neighbor_table.chunk_size]
+                )
+        if pending:
+            logger.info("📚 Neighbour table updated: %d products recomputed", len(pending))
+            await loop.run_in_executor(None, neighbor_table.save, neighbor_table_meta())
+        
+        if not neighbor_state["pending"]:
+            return
+
+def schedule_neighbor_update():
+    """Start a neighbour table update, or queue another pass if one is running"""
+    if NEIGHBOR_TABLE_K <= 0:
+        return
+    task = neighbor_state["task"]
+    if task is not None and not task.done():
+        neighbor_state["pending"] = True
+        return
+    neighbor_state["task"] = asyncio.create_task(update_neighbor_table())
+
+async def run_periodically(interval: float, job, name: str):
+    """Run an index maintenance job forever, every interval seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except Exception as e:
+            logger.error("❌ %s failed: %s", name, e)
+
+# Startup progress: the server answers (is live) as soon as it starts; it is
+# ready once the model is loaded and warmed up and the index is loaded
+service_state = {
+    "started_at": time.monotonic(),
+    "model_ready": False,
+    "index_ready": False,
+    "ready_seconds": None,
+    "error": None,
+}
+
+def require_ready(index: bool = False):
+    """Reject requests that arrive before the model (and index) are ready"""
+    if service_state["model_ready"] and (service_state["index_ready"] or not index):
+        return
+    raise HTTPException(status_code=503, detail="Service is starting up", headers={"Retry-After": "5"})
+
+async def load_model():
+    """Load and warm up the model off the event loop"""
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    await loop.run_in_executor(None, feature_extractor.load_model)
+    await loop.run_in_executor(None, feature_extractor.warm_up, (1, inference_batcher.max_batch_size))
+    # Spawned decode workers take a while to start; start them before the first upload
+    await image_executor.map(int, range(IMAGE_WORKERS))
+    service_state["model_ready"] = True
+    logger.info("✅ Model ready in %.1fs", time.monotonic() - started)
+
+async def load_index():
+    """Load the catalog index, then start keeping it in sync"""
+    if restore_index():
+        # Serve from the snapshot right away; catch up with the backend in the background
+        asyncio.create_task(sync_index_changes())
+    else:
+        await refresh_index()
+    service_state["index_ready"] = True
+    if NEIGHBOR_TABLE_K > 0:
+        neighbor_table.load(neighbor_table_meta())
+        schedule_neighbor_update()
+    if INDEX_SYNC_INTERVAL > 0:
+        asyncio.create_task(run_periodically(INDEX_SYNC_INTERVAL, sync_index_changes, "Index sync"))
+    if INDEX_REFRESH_INTERVAL > 0:
+        asyncio.create_task(run_periodically(INDEX_REFRESH_INTERVAL, refresh_index, "Index refresh"))
+    if INDEX_SNAPSHOT_INTERVAL > 0:
+        asyncio.create_task(run_periodically(INDEX_SNAPSHOT_INTERVAL, save_pending_snapshot, "Index snapshot"))
+
+async def prepare_service():
+    """Load the model and the index concurrently"""
+    try:
+        await asyncio.gather(load_model(), load_index())
+        service_state["ready_seconds"] = round(time.monotonic() - service_state["started_at"], 2)
+        logger.info("✅ AI Service ready in %ss", service_state["ready_seconds"])
+    except Exception as e:
+        # Stays not-ready, and /health/live fails so the process gets restarted
+        service_state["error"] = str(e)
+        logger.exception("❌ AI Service failed to start: %s", e)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize on startup"""
-    print("🚀 AI Service starting...")
-    print("📦 Loading AI model...")
-    feature_extractor.load_model()
-    print("✅ AI Service ready!")
+    logger.info("🚀 AI Service starting...")
+    await backend_client.start()
+    inference_batcher.start()
+    if shard_pool is not None:
+        shard_pool.start()
+    logger.info("📦 Loading AI model and catalog index...")
+    asyncio.create_task(prepare_service())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release resources on shutdown"""
+    await inference_batcher.stop()
+    inference_batcher.executor.shutdown(wait=False, cancel_futures=True)
+    image_executor.shutdown()
+    if shard_pool is not None:
+        shard_pool.close()
+    await backend_client.close()
 
 @app.get("/")
 async def root():
@@ -59,8 +459,17 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "visual_search": "/visual-search",
+            "visual_search_batch": "/visual-search/batch",
+            "similar": "/similar/{product_id}",
             "extract_features": "/extract-features",
+            "extract_features_batch": "/extract-features/batch",
+            "refresh_index": "/index/refresh",
+            "snapshot_index": "/index/snapshot",
+            "duplicates": "/admin/duplicates",
+            "metrics": "/metrics",
         }
     }
 
@@ -68,58 +477,206 @@ async def root():
 async def health_check():
     """Detailed health check"""
     return {
-        "status": "healthy",
+        "status": "healthy" if service_state["error"] is None else "failed",
+        "ready": service_state["model_ready"] and service_state["index_ready"],
+        "ready_seconds": service_state["ready_seconds"],
+        "startup_error": service_state["error"],
         "model_loaded": feature_extractor.model is not None,
         "model_name": feature_extractor.model_name,
+        "inference_backend": feature_extractor.backend,
+        "indexed_products": similarity_search.product_count,
+        "indexed_vectors": similarity_search.size,
+        "index_memory_bytes": similarity_search.memory_usage(),
+        "image_workers": {
+            "broken": image_executor.broken,
+            "restarts": image_executor.restarts,
+        },
+        "neighbor_table_products": neighbor_table.size,
+        "caches": {
+            "embeddings": embedding_cache.stats(),
+            "results": result_cache.stats(),
+        },
+    }
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is serving and startup hasn't failed"""
+    if service_state["error"] is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": service_state["error"]})
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: model warmed up, catalog index loaded and image workers usable"""
+    # A broken pool is replaced here too, so an idle instance recovers without traffic
+    workers_ready = image_executor.restart_if_broken()
+    ready = service_state["model_ready"] and service_state["index_ready"] and workers_ready
+    content = {
+        "ready": ready,
+        "model_ready": service_state["model_ready"],
+        "index_ready": service_state["index_ready"],
+        "image_workers_ready": workers_ready,
+        "ready_seconds": service_state["ready_seconds"],
+    }
+    return content if ready else JSONResponse(status_code=503, content=content)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(REGISTRY.render(), media_type=Registry.CONTENT_TYPE)
+
+@app.post("/index/refresh")
+async def refresh_index_endpoint():
+    """Re-sync the resident catalog index with the backend"""
+    stats = await refresh_index()
+    return {
+        "message": "Index refreshed",
+        "indexed_products": similarity_search.product_count,
+        **stats
     }
 
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Validate an uploaded image and read its bytes into memory
+    
+    Starlette already spools large uploads to a temporary file, so nothing is
+    written to disk here; the bytes go straight to the decoder.
+    """
+    # Validate file - be more flexible with content type
+    if file.content_type and not file.content_type.startswith('image/'):
+        # Try to validate by file extension instead
+        allowed_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.gif']
+        file_ext = Path(file.filename or "").suffix.lower()
+        if file_ext not in allowed_extensions:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Invalid file type. Expected image, got: {file.content_type}"
+            )
+        else:
+            logger.debug("Content-type is %s, but filename suggests image", file.content_type)
+    
+    with STAGE_SECONDS.time(stage="upload_read"):
+        contents = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(contents) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+        )
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file")
+    
+    return contents
+
+async def read_batch_uploads(files: List[UploadFile]) -> list:
+    """
+    Read the uploads of a batch request: bytes, or the HTTPException rejecting the file
+    
+    A rejected file fails on its own, but the request as a whole is rejected
+    with 413 once its uploads add up to more than MAX_BATCH_UPLOAD_BYTES.
+    """
+    uploads = []
+    total = 0
+    for file in files:
+        try:
+            contents = await read_upload(file)
+        except HTTPException as e:
+            uploads.append(e)
+            continue
+        total += len(contents)
+        if total > MAX_BATCH_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Uploads too large. Maximum is {MAX_BATCH_UPLOAD_BYTES // (1024 * 1024)} MB per request"
+            )
+        uploads.append(contents)
+    return uploads
+
+@app.post("/index/snapshot")
+async def snapshot_index_endpoint():
+    """Write the resident catalog index to the embedding store"""
+    async with index_lock.read():
+        await snapshot_index()
+    return {
+        "message": "Index snapshot saved",
+        "indexed_products": similarity_search.product_count,
+        "manifest": embedding_store.read_manifest()
+    }
+
+def embedding_key(contents: bytes) -> str:
+    """Cache key for the embedding of an upload"""
+    digest = hashlib.blake2b(contents, digest_size=16).hexdigest()
+    return (
+        f"{digest}:{feature_extractor.model_name}:{feature_extractor.model_version}:"
+        f"{'fast' if image_processor.fast_mode else 'quality'}"
+    )
+
+def color_histograms(arrays: list) -> list:
+    """Colour histogram per processed image (run off the event loop)"""
+    return [image_processor.color_histogram(array) for array in arrays]
+
+async def embed_upload(contents: bytes):
+    """
+    Decode and embed an upload, reusing the embedding of identical bytes
+    
+    The cache key covers the content hash plus everything that changes the
+    embedding (model name/version and preprocessing mode). The colour
+    histogram is computed in a thread while the model runs.
+    
+    Returns:
+        (feature vector, colour histogram, cache key)
+    """
+    key = embedding_key(contents)
+    entry = embedding_cache.get(key)
+    if entry is None:
+        with STAGE_SECONDS.time(stage="decode"):
+            processed_image = await image_executor.run(image_processor.process_image, contents)
+        with STAGE_SECONDS.time(stage="inference"):
+            features, color_histogram = await asyncio.gather(
+                inference_batcher.extract(processed_image),
+                asyncio.get_running_loop().run_in_executor(None, image_processor.color_histogram, processed_image)
+            )
+        for array in (features, color_histogram):
+            array.setflags(write=False)  # shared between requests from now on
+        entry = (features, color_histogram)
+        embedding_cache.put(key, entry)
+    
+    return entry[0], entry[1], key
+
 @app.post("/visual-search")
 async def visual_search(
     file: UploadFile = File(...),
     limit: int = 10,
-    category: Optional[str] = None
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False
 ):
     """
     Visual search endpoint - Upload image and find similar products
     Uses REAL AI feature extraction and cosine similarity
-    """
-    temp_path = None
     
+    Filters are applied inside the index: `category` takes one or more
+    comma-separated category IDs, plus an optional price range and `in_stock`.
+    """
+    categories = tuple(sorted({c.strip() for c in (category or "").split(",") if c.strip()}))
+    require_ready(index=True)
     try:
-        # Validate file - be more flexible with content type
-        if file.content_type and not file.content_type.startswith('image/'):
-            # Try to validate by file extension instead
-            allowed_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.gif']
-            file_ext = Path(file.filename).suffix.lower()
-            if file_ext not in allowed_extensions:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Invalid file type. Expected image, got: {file.content_type}"
-                )
-            else:
-                print(f"⚠️  Content-type is {file.content_type}, but filename suggests image")
+        contents = await read_upload(file)
         
-        # Save uploaded file temporarily
-        temp_path = TEMP_DIR / file.filename
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        logger.debug("📸 Processing query image: %s", file.filename)
         
-        print(f"📸 Processing query image: {file.filename}")
+        # Process and extract features from query image (cached by content hash)
+        query_features, query_histogram, query_key = await embed_upload(contents)
         
-        # Process and extract features from query image
-        processed_image = image_processor.process_image(str(temp_path))
-        query_features = feature_extractor.extract_features(processed_image)
-        
-        print(f"✅ Extracted features: {len(query_features)} dimensions")
-        print(f"   Feature range: [{query_features.min():.3f}, {query_features.max():.3f}]")
-        
-        # Get products WITH their stored feature vectors
-        products = await backend_client.get_products_with_features(
-            category=category,
-            limit=100  # Get more products for better matching
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "✅ Extracted features: %d dimensions, range [%.3f, %.3f]",
+                len(query_features), query_features.min(), query_features.max()
+            )
         
-        if not products:
+        # Index may be empty if the backend was down at startup; the
+        # scheduled sync keeps retrying the catalog fetch in the background
+        if similarity_search.size == 0:
             return JSONResponse(
                 content={
                     "message": "No products with features available. Please extract features first.",
@@ -129,29 +686,41 @@ async def visual_search(
                 status_code=200
             )
         
-        print(f"🔍 Comparing with {len(products)} products...")
-        
-        # Find similar products using REAL cosine similarity
-        similar_products = similarity_search.find_similar(
-            query_features=query_features,
-            products=products,
-            top_k=limit
+        logger.debug(
+            "🔍 Comparing with %d indexed products (%d images)", similarity_search.product_count, similarity_search.size
         )
         
-        # Clean up temp file
-        if temp_path and temp_path.exists():
-            temp_path.unlink()
+        # Find similar products using REAL cosine similarity against the resident index,
+        # off the event loop. Results are cached per index version, so any index change invalidates them
+        async with index_lock.read():
+            result_key = (query_key, categories, min_price, max_price, in_stock, limit, similarity_search.version)
+            similar_products = result_cache.get(result_key)
+            if similar_products is None:
+                with STAGE_SECONDS.time(stage="scoring"):
+                    similar_products = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                        similarity_search.search,
+                        query_features=query_features,
+                        top_k=limit,
+                        categories=categories,
+                        min_price=min_price,
+                        max_price=max_price,
+                        in_stock=in_stock,
+                        query_histogram=query_histogram
+                    ))
+                result_cache.put(result_key, similar_products)
         
         if similar_products:
-            print(f"✨ Found {len(similar_products)} similar products")
-            print(f"   Best match: {similar_products[0]['name']} ({similar_products[0]['match_percentage']}% similarity)")
+            logger.debug(
+                "✨ Found %d similar products, best match: %s (%s%% similarity)",
+                len(similar_products), similar_products[0]["name"], similar_products[0]["match_percentage"]
+            )
         else:
-            print("⚠️  No similar products found above threshold")
+            logger.debug("No similar products found above threshold")
         
         return {
             "message": "Visual search completed",
             "query_image": file.filename,
-            "total_products_compared": len(products),
+            "total_products_compared": similarity_search.product_count,
             "results": similar_products,
             "search_stats": {
                 "feature_vector_size": len(query_features),
@@ -160,47 +729,233 @@ async def visual_search(
             }
         }
         
+    except ExecutorSaturatedError as e:
+        # Backpressure: shed load instead of queueing without bound
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error in visual search: {str(e)}")
-        # Clean up temp file if exists
-        if temp_path and temp_path.exists():
-            temp_path.unlink()
+        logger.exception("❌ Error in visual search: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def embed_uploads(uploads: List[bytes]) -> list:
+    """
+    Embed many uploads through cached vectors and batched model calls
+    
+    Bulk work goes through the executors directly, like the batch extraction
+    endpoint, so a large request queues instead of being rejected.
+    
+    Returns:
+        (feature vector, colour histogram) or exception per upload, in order
+    """
+    keys = [embedding_key(contents) for contents in uploads]
+    embedded = [embedding_cache.get(key) for key in keys]
+    missing = [i for i, entry in enumerate(embedded) if entry is None]
+    
+    loop = asyncio.get_running_loop()
+    for start in range(0, len(missing), EXTRACT_BATCH_SIZE):
+        chunk = missing[start:start + EXTRACT_BATCH_SIZE]
+        with STAGE_SECONDS.time(stage="decode"):
+            decoded = await image_executor.map(image_processor.process_image, [uploads[i] for i in chunk])
+        
+        ok = [(i, array) for i, array in zip(chunk, decoded) if not isinstance(array, Exception)]
+        for i, array in zip(chunk, decoded):
+            if isinstance(array, Exception):
+                embedded[i] = array
+        if not ok:
+            continue
+        
+        with STAGE_SECONDS.time(stage="inference"):
+            features, histograms = await asyncio.gather(
+                loop.run_in_executor(
+                    inference_batcher.executor,
+                    feature_extractor.extract_features_batch,
+                    [array for _, array in ok]
+                ),
+                loop.run_in_executor(None, color_histograms, [array for _, array in ok])
+            )
+        for (i, _), vector, color_histogram in zip(ok, features, histograms):
+            vector.setflags(write=False)
+            color_histogram.setflags(write=False)
+            embedding_cache.put(keys[i], (vector, color_histogram))
+            embedded[i] = (vector, color_histogram)
+    
+    return embedded
+
+@app.post("/visual-search/batch")
+async def visual_search_batch(
+    files: List[UploadFile] = File([]),
+    product_ids: List[str] = Form([]),
+    limit: int = 10,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False
+):
+    """
+    Find similar products for many query images and/or indexed products at once
+    
+    All queries are scored together with blocked matrix products against the
+    catalog. `results` has one entry per query, uploads first and then
+    `product_ids`; a product query leaves the product itself out of its
+    results. Filters apply to every query, as in /visual-search.
+    """
+    require_ready(index=True)
+    if not files and not product_ids:
+        raise HTTPException(status_code=400, detail="Provide files and/or product_ids")
+    if len(files) + len(product_ids) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many queries. Maximum is {MAX_BATCH_ITEMS} per request"
+        )
+    categories = tuple(sorted({c.strip() for c in (category or "").split(",") if c.strip()}))
+    
+    queries = []
+    uploads = []
+    for file, contents in zip(files, await read_batch_uploads(files)):
+        if isinstance(contents, HTTPException):
+            queries.append({"source": file.filename, "error": contents.detail})
+        else:
+            uploads.append(contents)
+            queries.append({"source": file.filename})
+    
+    embedded = iter(await embed_uploads(uploads))
+    for query in queries:
+        if "error" not in query:
+            entry = next(embedded)
+            if isinstance(entry, Exception):
+                query["error"] = str(entry) or type(entry).__name__
+            else:
+                query["features"], query["histogram"] = entry
+    
+    # Runs off the event loop; the lock keeps index syncs from moving rows mid-scan
+    async with index_lock.read():
+        for product_id in product_ids:
+            features = similarity_search.product_vector(product_id)
+            if features is None:
+                queries.append({"product_id": product_id, "error": "Product is not indexed"})
+            else:
+                queries.append({"product_id": product_id, "features": features, "exclude": product_id})
+        
+        valid = [query for query in queries if "features" in query]
+        if valid:
+            with STAGE_SECONDS.time(stage="scoring"):
+                matches = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                    similarity_search.search_batch,
+                    np.stack([query["features"] for query in valid]),
+                    top_k=limit,
+                    categories=categories,
+                    min_price=min_price,
+                    max_price=max_price,
+                    in_stock=in_stock,
+                    exclude=[query.get("exclude") for query in valid],
+                    query_histograms=[query.get("histogram") for query in valid]
+                ))
+            for query, results in zip(valid, matches):
+                query["results"] = results
+    
+    logger.debug("🔍 Batch search: %d queries, %d answered", len(queries), len(valid))
+    
+    return {
+        "message": "Batch visual search completed",
+        "total_products_compared": similarity_search.product_count,
+        "results": [
+            {"index": i, **{key: value for key, value in query.items() if key not in ("features", "histogram", "exclude")}}
+            for i, query in enumerate(queries)
+        ]
+    }
+
+@app.get("/similar/{product_id}")
+async def similar_products(product_id: str, limit: int = 10):
+    """
+    Products similar to an indexed product ("more like this")
+    
+    Served from the precomputed neighbour table. Products it doesn't cover
+    yet, or a `limit` above NEIGHBOR_TABLE_K, are searched live with the
+    product's primary image. No upload or model pass either way.
+    """
+    require_ready(index=True)
+    async with index_lock.read():
+        if product_id not in similarity_search.product_rows:
+            raise HTTPException(status_code=404, detail="Product is not indexed")
+        
+        neighbors = neighbor_table.get(product_id) if NEIGHBOR_TABLE_K > 0 and limit <= neighbor_table.k else None
+        if neighbors is not None:
+            source = "precomputed"
+            results = similarity_search.format_results(neighbors, exclude=product_id)[:limit]
+        else:
+            source = "live"
+            with STAGE_SECONDS.time(stage="scoring"):
+                results = (await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                    similarity_search.search_batch,
+                    similarity_search.product_vector(product_id)[None],
+                    top_k=limit,
+                    exclude=[product_id]
+                )))[0]
+    
+    return {"product_id": product_id, "source": source, "results": results}
+
+@app.get("/admin/duplicates")
+async def duplicate_products():
+    """
+    Near-duplicate product groups in the index (e.g. one photo listed under several SKUs)
+    
+    Searches return one product per group; the others are listed in its
+    "duplicates" field. Groups are largest first, each with its canonical
+    (lowest) product ID.
+    """
+    require_ready(index=True)
+    if similarity_search.dedup is None:
+        raise HTTPException(status_code=404, detail="Duplicate detection is disabled (INDEX_DEDUP=false)")
+    
+    async with index_lock.read():
+        groups = similarity_search.dedup.report()
+    return {
+        "groups": groups,
+        "total_groups": len(groups),
+        "total_duplicates": sum(group["size"] - 1 for group in groups),
+    }
+
 @app.post("/extract-features")
-async def extract_features(file: UploadFile = File(...)):
+async def extract_features(
+    file: UploadFile = File(...),
+    accept: Optional[str] = Header(None)
+):
     """
     Extract features from an image (for debugging/testing)
-    """
-    temp_path = None
     
+    The vector format follows the Accept header: plain JSON floats by default,
+    base64 in JSON for `application/json; encoding=base64`, or raw bytes for
+    `application/x-feature-vector` (add `; dtype=float16` to halve either).
+    """
+    require_ready()
     try:
-        # Validate file - be more flexible
-        if file.content_type and not file.content_type.startswith('image/'):
-            allowed_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.gif']
-            file_ext = Path(file.filename).suffix.lower()
-            if file_ext not in allowed_extensions:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Invalid file type: {file.content_type}"
-                )
-        
-        # Save temporarily
-        temp_path = TEMP_DIR / file.filename
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        contents = await read_upload(file)
         
-        print(f"🔍 Extracting features from: {file.filename}")
+        logger.debug("🔍 Extracting features from: %s", file.filename)
         
         # Process and extract
-        processed_image = image_processor.process_image(str(temp_path))
-        features = feature_extractor.extract_features(processed_image)
+        features, _, _ = await embed_upload(contents)
+        
+        logger.debug("✅ Extracted %d features", len(features))
         
-        # Clean up
-        if temp_path and temp_path.exists():
-            temp_path.unlink()
+        encoding, dtype = negotiate(accept)
         
-        print(f"✅ Extracted {len(features)} features")
+        if encoding == "raw":
+            return Response(
+                content=encode_vector(features, dtype),
+                media_type=RAW_MEDIA_TYPE,
+                headers={"X-Feature-Dtype": dtype, "X-Feature-Dim": str(len(features))}
+            )
+        
+        if encoding == "base64":
+            return {
+                "filename": file.filename,
+                "feature_vector_size": len(features),
+                "dtype": dtype,
+                "features_b64": encode_vector_base64(features, dtype),
+                "message": "Features extracted successfully"
+            }
         
         return {
             "filename": file.filename,
@@ -209,12 +964,137 @@ async def extract_features(file: UploadFile = File(...)):
             "message": "Features extracted successfully"
         }
         
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error extracting features: {str(e)}")
-        if temp_path and temp_path.exists():
-            temp_path.unlink()
+        logger.exception("❌ Error extracting features: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/extract-features/batch")
+async def extract_features_batch(
+    files: List[UploadFile] = File([]),
+    urls: List[str] = Form([]),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Extract features from many images in one request (catalog ingestion)
+    
+    Accepts uploaded files and/or image URLs. Images run through the model in
+    fixed-size batches and results are streamed back as NDJSON, one line per
+    image in request order ({"index", "source", "features", "phash",
+    "color_histogram"} or {"index", "source", "error"}), followed by a
+    summary line. "phash" is the image's perceptual hash (16 hex digits),
+    used for duplicate detection; "color_histogram" feeds the colour re-rank. With
+    `Accept: application/x-ndjson; encoding=base64` vectors are sent as
+    "features_b64" (little-endian, "dtype" float32 or float16) instead.
+    """
+    require_ready()
+    if not files and not urls:
+        raise HTTPException(status_code=400, detail="Provide files and/or urls")
+    if len(files) + len(urls) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many images. Maximum is {MAX_BATCH_ITEMS} per request"
+        )
+    
+    # Read uploads up front; the form is released once the response starts streaming.
+    # Rejected files (too large, not an image) fail on their own line
+    items = []
+    for file, contents in zip(files, await read_batch_uploads(files)):
+        if isinstance(contents, HTTPException):
+            contents = ValueError(contents.detail)
+        items.append({"source": file.filename, "data": contents})
+    for url in urls:
+        items.append({"source": url, "url": url})
+    
+    encoding, dtype = negotiate(accept)
+    
+    logger.info("📦 Batch extracting features from %d images", len(items))
+    
+    async def results():
+        loop = asyncio.get_running_loop()
+        processed = 0
+        failed = 0
+        
+        for start in range(0, len(items), EXTRACT_BATCH_SIZE):
+            chunk = items[start:start + EXTRACT_BATCH_SIZE]
+            
+            # Fetch any URLs in this chunk concurrently
+            to_download = [item for item in chunk if "url" in item]
+            if to_download:
+                downloads = await backend_client.download_images(
+                    [item["url"] for item in to_download], max_bytes=MAX_UPLOAD_BYTES
+                )
+                for item, data in zip(to_download, downloads):
+                    item["data"] = data
+            
+            # Decode in the worker pool; failures come back as exceptions
+            with STAGE_SECONDS.time(stage="decode"):
+                decoded = await image_executor.map(
+                    image_processor.process_image,
+                    [item["data"] if isinstance(item["data"], bytes) else b"" for item in chunk]
+                )
+            
+            ok = []
+            for offset, (item, result) in enumerate(zip(chunk, decoded)):
+                error = item["data"] if isinstance(item["data"], Exception) else result
+                if isinstance(error, Exception):
+                    item["error"] = str(error) or type(error).__name__
+                else:
+                    ok.append((offset, result))
+            
+            features, histograms = [], []
+            if ok:
+                try:
+                    with STAGE_SECONDS.time(stage="inference"):
+                        features, histograms = await asyncio.gather(
+                            loop.run_in_executor(
+                                inference_batcher.executor,
+                                feature_extractor.extract_features_batch,
+                                [array for _, array in ok]
+                            ),
+                            loop.run_in_executor(None, color_histograms, [array for _, array in ok])
+                        )
+                except Exception as e:
+                    for offset, _ in ok:
+                        chunk[offset]["error"] = str(e)
+                    ok = []
+            
+            for (offset, array), vector, color_histogram in zip(ok, features, histograms):
+                chunk[offset]["features"] = vector
+                chunk[offset]["phash"] = image_processor.perceptual_hash(array)
+                chunk[offset]["color_histogram"] = color_histogram
+            
+            for offset, item in enumerate(chunk):
+                line = {"index": start + offset, "source": item["source"]}
+                if "features" in item:
+                    line["feature_vector_size"] = len(item["features"])
+                    if encoding == "json":
+                        line["features"] = item["features"].tolist()
+                    else:
+                        line["dtype"] = dtype
+                        line["features_b64"] = encode_vector_base64(item["features"], dtype)
+                    line["phash"] = f"{item['phash']:016x}"
+                    line["color_histogram"] = np.round(item["color_histogram"], 4).tolist()
+                    processed += 1
+                else:
+                    line["error"] = item.get("error", "Unknown error")
+                    failed += 1
+                yield json.dumps(line) + "\n"
+            
+            # Drop image data we no longer need
+            for item in chunk:
+                item.pop("data", None)
+                item.pop("features", None)
+                item.pop("color_histogram", None)
+        
+        logger.info("✅ Batch extraction done: %d processed, %d failed", processed, failed)
+        yield json.dumps({"done": True, "total": len(items), "processed": processed, "failed": failed}) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(
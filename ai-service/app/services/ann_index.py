@@ -0,0 +1,181 @@
+import logging
+import numpy as np
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExactIndex:
+    """Brute-force backend: every indexed row is scored for every query"""
+
+    name = "exact"
+
+    @property
+    def is_trained(self) -> bool:
+        return True
+
+    def needs_training(self, size: int) -> bool:
+        return False
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        pass
+
+    def move(self, src_row: int, dst_row: int):
+        pass
+
+    def candidates(self, query: np.ndarray, size: int) -> Optional[np.ndarray]:
+        """Rows to score for this query (None means all rows)"""
+        return None
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF-Flat) backend in pure numpy
+
+    Vectors are partitioned into `nlist` clusters with spherical k-means; a query
+    only scores the rows in its `nprobe` closest clusters. Scoring stays exact on
+    those rows, so recall is controlled entirely by nprobe/nlist.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        nlist: int = 256,
+        nprobe: int = 16,
+        train_iterations: int = 10,
+        max_train_points: int = 64 * 1024,
+        seed: int = 0
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.max_train_points = max_train_points
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)  # cluster id per row
+        self.trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def min_train_size(self) -> int:
+        """Below this many vectors clusters are too sparse to be worth it"""
+        return self.nlist * 39
+
+    def needs_training(self, size: int) -> bool:
+        """Train once there is enough data, then again whenever the catalog doubles"""
+        if size < self.min_train_size:
+            return False
+        return not self.is_trained or size >= 2 * self.trained_size
+
+    def _assign(self, vectors: np.ndarray, block_size: int = 16384) -> np.ndarray:
+        """Nearest centroid (by inner product) for each row, computed in blocks"""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            assignments[start:start + block_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def train(self, vectors: np.ndarray):
+        """
+        Learn cluster centroids and assign all given rows
+
+        Args:
+            vectors: L2-normalised matrix of all live rows (row i = index row i)
+        """
+        rng = np.random.default_rng(self.seed)
+        n = len(vectors)
+        nlist = min(self.nlist, n)
+
+        sample = vectors
+        if n > self.max_train_points:
+            sample = vectors[rng.choice(n, self.max_train_points, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+
+            # Re-seed empty clusters from random sample points
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        self.centroids = centroids
+        self.assignments = self._assign(vectors)
+        self.trained_size = n
+        logger.info("🧭 IVF index trained: %d lists over %d vectors", nlist, n)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """Assign (new or updated) rows to their nearest cluster"""
+        if not self.is_trained or len(rows) == 0:
+            return
+
+        needed = int(rows.max()) + 1
+        if needed > len(self.assignments):
+            assignments = np.zeros(max(needed, 2 * len(self.assignments)), dtype=np.int32)
+            assignments[:len(self.assignments)] = self.assignments
+            self.assignments = assignments
+
+        self.assignments[rows] = self._assign(vectors)
+
+    def move(self, src_row: int, dst_row: int):
+        """Mirror a row being moved inside the index matrix"""
+        if self.is_trained and src_row < len(self.assignments):
+            self.assignments[dst_row] = self.assignments[src_row]
+
+    def candidates(self, query: np.ndarray, size: int) -> Optional[np.ndarray]:
+        """
+        Rows in the nprobe clusters closest to the query
+
+        Args:
+            query: L2-normalised query vector
+            size: Number of live rows in the index
+
+        Returns:
+            Row indices to score, or None to score every row (untrained index)
+        """
+        if not self.is_trained:
+            return None
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        if nprobe >= len(self.centroids):
+            return None
+
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        probe_mask = np.zeros(len(self.centroids), dtype=bool)
+        probe_mask[probe] = True
+        return np.flatnonzero(probe_mask[self.assignments[:size]])
+
+
+def create_ann_index(backend: str = "exact", nlist: int = 256, nprobe: int = 16):
+    """
+    Build an index backend by name
+
+    Args:
+        backend: "exact" or "ivf"
+        nlist: Number of IVF clusters (ignored for "exact")
+        nprobe: Clusters scanned per query (ignored for "exact")
+
+    Returns:
+        Index backend instance
+    """
+    backend = (backend or "exact").lower()
+    if backend == "exact":
+        return ExactIndex()
+    if backend == "ivf":
+        return IVFIndex(nlist=nlist, nprobe=nprobe)
+    raise ValueError(f"Unknown index backend: {backend}")
@@ -0,0 +1,202 @@
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+def _hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise bit distances between two arrays of 64-bit hashes"""
+    x = np.ascontiguousarray(a[:, None] ^ b[None, :])
+    return np.unpackbits(x.view(np.uint8)).reshape(x.shape + (64,)).sum(axis=-1)
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate products found through hash buckets instead of pairwise scans
+
+    Two images are near-duplicates if their embeddings have cosine similarity
+    of at least `similarity`, or their perceptual hashes (dHash) differ in at
+    most `max_distance` bits. Two products are duplicates if every image of
+    the one with fewer images has a near-duplicate in the other (the same
+    photo uploaded under several SKUs). Duplicates are grouped transitively.
+
+    Candidates come from buckets, so a product is only compared with the
+    few products that share one:
+        - embeddings: random-hyperplane LSH (SimHash), `tables` tables of
+          `bits`-bit signatures; near-identical vectors share at least one.
+          Embeddings all lie in a narrow cone, so the hyperplanes pass through
+          the catalog's mean vector (fitted while the index is empty) rather
+          than the origin, or most products would share buckets
+        - hashes: the 64 bits split into max_distance + 1 bands; hashes
+          within max_distance bits share at least one band exactly
+    """
+
+    def __init__(
+        self,
+        feature_size: int = 1280,
+        tables: int = 10,
+        bits: int = 20,
+        similarity: float = 0.97,
+        max_distance: int = 3,
+        seed: int = 0
+    ):
+        self.similarity = similarity
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((tables * bits, feature_size), dtype=np.float32)
+        self.tables = tables
+        self.bits = bits
+        self.center: Optional[np.ndarray] = None
+
+        self.buckets: Dict[Tuple[int, int], Set[str]] = {}
+        self.keys: Dict[str, Set[Tuple[int, int]]] = {}
+        self.hashes: Dict[str, np.ndarray] = {}
+        self.edges: Dict[str, Set[str]] = {}
+        self._groups: Optional[Dict[str, List[str]]] = None
+
+    def signatures(self, vectors: np.ndarray) -> np.ndarray:
+        """LSH signature per vector and table, shape (vectors, tables)"""
+        centered = vectors - self.center if self.center is not None else vectors
+        signs = (centered @ self.planes.T > 0).reshape(len(vectors), self.tables, self.bits)
+        return signs @ (1 << np.arange(self.bits, dtype=np.int64))
+
+    def _bucket_keys(
+        self,
+        vectors: np.ndarray,
+        hashes: np.ndarray,
+        signatures: Optional[np.ndarray] = None
+    ) -> Set[Tuple[int, int]]:
+        """(table, signature) keys; hash bands use the tables after the LSH ones"""
+        keys = set()
+        if len(vectors):
+            signatures = self.signatures(vectors) if signatures is None else signatures
+            keys.update((table, int(signature)) for row in signatures.tolist() for table, signature in enumerate(row))
+        mask = (1 << self.band_bits) - 1
+        for value in hashes.tolist():
+            keys.update((self.tables + band, (value >> (band * self.band_bits)) & mask) for band in range(self.bands))
+        return keys
+
+    def fit(self, vectors: np.ndarray):
+        """Centre the hyperplanes on the mean of the given vectors (only while empty)"""
+        if self.keys:
+            raise RuntimeError("Duplicate index must be empty to fit")
+        self.center = np.asarray(vectors, dtype=np.float32).mean(axis=0) if len(vectors) else None
+
+    def _covers(self, matches: np.ndarray) -> bool:
+        """Every image on the smaller side of an image-match matrix has a match"""
+        if matches.size == 0:
+            return False
+        axis = 1 if matches.shape[0] <= matches.shape[1] else 0
+        return bool(matches.any(axis=axis).all())
+
+    def _is_duplicate(self, vectors: np.ndarray, hashes: np.ndarray, other_vectors: np.ndarray, other_hashes: np.ndarray) -> bool:
+        if len(vectors) and len(other_vectors) and self._covers(vectors @ other_vectors.T >= self.similarity):
+            return True
+        if len(hashes) and len(other_hashes):
+            return self._covers(_hamming(hashes, other_hashes) <= self.max_distance)
+        return False
+
+    def find(
+        self,
+        vectors: np.ndarray,
+        hashes: Iterable[int],
+        vectors_of: Callable[[str], np.ndarray],
+        keys: Optional[Set[Tuple[int, int]]] = None
+    ) -> List[str]:
+        """
+        Indexed products the given images duplicate
+
+        Args:
+            vectors: L2-normalised image vectors
+            hashes: Perceptual hashes of the images (may be empty)
+            vectors_of: Image vectors of an indexed product
+        """
+        hashes = np.asarray(list(hashes), dtype=np.uint64)
+        keys = self._bucket_keys(vectors, hashes) if keys is None else keys
+        candidates = set().union(*(self.buckets.get(key, ()) for key in keys)) if keys else set()
+        return sorted(
+            product_id for product_id in candidates
+            if self._is_duplicate(vectors, hashes, vectors_of(product_id), self.hashes.get(product_id, np.zeros(0, np.uint64)))
+        )
+
+    def update(
+        self,
+        product_id: str,
+        vectors: np.ndarray,
+        hashes: Iterable[int],
+        vectors_of: Callable[[str], np.ndarray],
+        signatures: Optional[np.ndarray] = None
+    ):
+        """Add or replace a product and re-link it to its duplicates (`signatures` if precomputed)"""
+        self.remove(product_id)
+        hashes = np.asarray(list(hashes), dtype=np.uint64)
+        keys = self._bucket_keys(vectors, hashes, signatures)
+
+        for duplicate in self.find(vectors, hashes, vectors_of, keys):
+            self.edges.setdefault(product_id, set()).add(duplicate)
+            self.edges.setdefault(duplicate, set()).add(product_id)
+
+        for key in keys:
+            self.buckets.setdefault(key, set()).add(product_id)
+        self.keys[product_id] = keys
+        self.hashes[product_id] = hashes
+        self._groups = None
+
+    def remove(self, product_id: str):
+        for key in self.keys.pop(product_id, ()):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(product_id)
+                if not bucket:
+                    del self.buckets[key]
+        self.hashes.pop(product_id, None)
+        for duplicate in self.edges.pop(product_id, ()):
+            self.edges[duplicate].discard(product_id)
+            if not self.edges[duplicate]:
+                del self.edges[duplicate]
+        self._groups = None
+
+    def clear(self):
+        self.buckets, self.keys, self.hashes, self.edges = {}, {}, {}, {}
+        self.center = None
+        self._groups = None
+
+    def groups(self) -> Dict[str, List[str]]:
+        """Duplicate groups (connected components), keyed by product; members sorted"""
+        if self._groups is None:
+            groups = {}
+            for start in self.edges:
+                if start in groups:
+                    continue
+                members, stack = {start}, [start]
+                while stack:
+                    for neighbor in self.edges.get(stack.pop(), ()):
+                        if neighbor not in members:
+                            members.add(neighbor)
+                            stack.append(neighbor)
+                group = sorted(members)
+                for member in group:
+                    groups[member] = group
+            self._groups = groups
+        return self._groups
+
+    def collapse(self, ranked: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        """Keep the best-ranked product of each duplicate group"""
+        groups = self.groups()
+        seen, kept = set(), []
+        for product_id, score in ranked:
+            group = groups.get(product_id)
+            key = group[0] if group else product_id
+            if key not in seen:
+                seen.add(key)
+                kept.append((product_id, score))
+        return kept
+
+    def report(self) -> List[Dict[str, object]]:
+        """Every duplicate group, largest first, with its canonical (lowest) product ID"""
+        unique = {group[0]: group for group in self.groups().values()}
+        return [
+            {"canonical": canonical, "products": group, "size": len(group)}
+            for canonical, group in sorted(unique.items(), key=lambda item: (-len(item[1]), item[0]))
+        ]
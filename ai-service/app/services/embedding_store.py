@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """
+    On-disk snapshots of the catalog index
+
+    Each snapshot is a directory holding:
+        embeddings.npy  - float32 matrix of L2-normalised vectors (row i = ids[i])
+        histograms.npy  - optional colour histogram per row (zeros where unknown)
+        ids.json        - product ID per row
+        products.json   - result metadata per product ID
+        manifest.json   - model name/version, dimensions, row count, creation time
+
+    A `CURRENT` file names the live snapshot and is swapped atomically, so a
+    reader never sees a half-written snapshot. Matrices are opened with
+    np.load(mmap_mode="c"): every worker maps the same page-cache copy, and a
+    worker that later modifies rows in place gets private copies of only those
+    pages. The first insert that outgrows the mapping copies the whole matrix
+    into private memory, so sharing lasts until the index first grows.
+    """
+
+    def __init__(self, directory: str, keep_snapshots: int = 2):
+        self.directory = Path(directory)
+        self.keep_snapshots = keep_snapshots
+
+    def _current_snapshot(self) -> Optional[Path]:
+        current = self.directory / "CURRENT"
+        if not current.exists():
+            return None
+        snapshot = self.directory / current.read_text().strip()
+        return snapshot if snapshot.is_dir() else None
+
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        """Manifest of the live snapshot, or None if there is no snapshot"""
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return None
+        return json.loads((snapshot / "manifest.json").read_text())
+
+    def save(
+        self,
+        matrix: np.ndarray,
+        product_ids: List[str],
+        products: Dict[str, Dict[str, Any]],
+        model_name: str,
+        model_version: str,
+        extra: Optional[Dict[str, Any]] = None,
+        histograms: Optional[np.ndarray] = None,
+        reuse_rows: bool = False
+    ) -> Path:
+        """
+        Write a new snapshot and make it the live one
+
+        Args:
+            matrix: L2-normalised vectors, one row per product ID
+            product_ids: Product ID per row
+            products: Result metadata per product ID
+            model_name: Model that produced the vectors
+            model_version: Version of the model/preprocessing
+            extra: Additional manifest fields (e.g. the catalog sync cursor)
+            histograms: Optional colour histogram per row
+            reuse_rows: The rows are unchanged since the live snapshot, so
+                hard-link its embeddings.npy/histograms.npy instead of
+                rewriting them (only ids and metadata are written)
+
+        Returns:
+            Path of the new snapshot directory
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"snapshot-{time.time_ns()}-{os.getpid()}"
+        tmp = self.directory / f".{name}.tmp"
+        tmp.mkdir()
+
+        current = self._current_snapshot() if reuse_rows else None
+        if current is None or not self._link(current / "embeddings.npy", tmp / "embeddings.npy"):
+            np.save(tmp / "embeddings.npy", np.ascontiguousarray(matrix, dtype=np.float32))
+        if histograms is not None:
+            if current is None or not self._link(current / "histograms.npy", tmp / "histograms.npy"):
+                np.save(tmp / "histograms.npy", np.ascontiguousarray(histograms, dtype=np.float32))
+        (tmp / "ids.json").write_text(json.dumps(list(product_ids)))
+        (tmp / "products.json").write_text(json.dumps({pid: products[pid] for pid in product_ids}))
+        (tmp / "manifest.json").write_text(json.dumps({
+            "model_name": model_name,
+            "model_version": model_version,
+            "feature_size": int(matrix.shape[1]),
+            "count": len(product_ids),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            **(extra or {}),
+        }, indent=2))
+
+        snapshot = self.directory / name
+        tmp.rename(snapshot)
+
+        current_tmp = self.directory / f".CURRENT.{os.getpid()}"
+        current_tmp.write_text(name)
+        os.replace(current_tmp, self.directory / "CURRENT")
+
+        self._prune(keep=snapshot)
+        logger.info("💾 Embedding snapshot saved: %d vectors -> %s", len(product_ids), snapshot)
+        return snapshot
+
+    def load(
+        self,
+        model_name: str,
+        model_version: str,
+        feature_size: int
+    ) -> Optional[Tuple[np.ndarray, List[str], Dict[str, Dict[str, Any]], Optional[np.ndarray]]]:
+        """
+        Open the live snapshot if it was built by the same model
+
+        Returns:
+            (memory-mapped matrix, product IDs, product metadata, memory-mapped
+            colour histograms or None), or None if there is no usable snapshot
+        """
+        try:
+            manifest = self.read_manifest()
+            if manifest is None:
+                return None
+
+            expected = (model_name, model_version, feature_size)
+            found = (manifest.get("model_name"), manifest.get("model_version"), manifest.get("feature_size"))
+            if found != expected:
+                logger.warning("⚠️  Embedding snapshot is for %s, expected %s - ignoring it", found, expected)
+                return None
+
+            snapshot = self._current_snapshot()
+            matrix = np.load(snapshot / "embeddings.npy", mmap_mode="c")
+            product_ids = json.loads((snapshot / "ids.json").read_text())
+            products = json.loads((snapshot / "products.json").read_text())
+
+            if matrix.shape != (len(product_ids), feature_size):
+                logger.warning("⚠️  Embedding snapshot is inconsistent (%s) - ignoring it", matrix.shape)
+                return None
+
+            histograms = None
+            if (snapshot / "histograms.npy").exists():
+                histograms = np.load(snapshot / "histograms.npy", mmap_mode="c")
+                if len(histograms) != len(product_ids):
+                    logger.warning("⚠️  Colour histograms don't match the snapshot rows - ignoring them")
+                    histograms = None
+
+            return matrix, product_ids, products, histograms
+
+        except Exception as e:
+            logger.error("❌ Failed to load embedding snapshot: %s", e)
+            return None
+
+    def scratch(self, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+        """
+        Zeroed, writable file-backed array next to the snapshots
+
+        Used for float32 rows that shouldn't be held in RAM: the pages live in
+        the page cache, so only the rows being read or written take memory and
+        the kernel can evict them. The file is unlinked as soon as it is
+        mapped, so it goes away with the array.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryFile(dir=self.directory, prefix=".scratch-") as f:
+            f.truncate(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            return np.memmap(f, dtype=dtype, mode="r+", shape=shape)
+
+    def _link(self, source: Path, target: Path) -> bool:
+        """Hard-link a file from an older snapshot (snapshot files are never modified in place)"""
+        try:
+            os.link(source, target)
+            return True
+        except OSError:
+            return False
+
+    def _prune(self, keep: Path):
+        """Delete all but the newest snapshots (open memmaps stay valid on POSIX)"""
+        snapshots = sorted(
+            (p for p in self.directory.glob("snapshot-*") if p.is_dir()),
+            key=lambda p: int(p.name.split("-")[1]),
+            reverse=True
+        )
+        for old in snapshots[self.keep_snapshots:]:
+            if old != keep:
+                shutil.rmtree(old, ignore_errors=True)
@@ -1,48 +1,292 @@
+import logging
+import os
+import threading
 import numpy as np
-from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-from tensorflow.keras.models import Model
-import tensorflow as tf
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# TensorFlow is imported inside the functions that need it: importing this
+# module (and app.main) stays cheap, and the tflite/onnx backends can serve
+# from an exported model without loading TensorFlow at all
+if TYPE_CHECKING:
+    from tensorflow.keras.models import Model
+
+INFERENCE_BACKENDS = ("keras", "tf-function", "tflite", "onnx")
+
+class KerasBackend:
+    """Baseline: Keras `predict` (per-call overhead; kept as the parity reference)"""
+    
+    def __init__(self, model: "Model"):
+        self.model = model
+    
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.model.predict(batch, verbose=0)
+
+class TFFunctionBackend:
+    """
+    Direct call of the model through one traced `tf.function`
+    
+    The input signature has a dynamic batch dimension, so every batch size
+    reuses the same graph instead of going through `predict`'s data pipeline.
+    """
+    
+    def __init__(self, model: "Model"):
+        import tensorflow as tf
+        
+        self.model = model
+        self.function = tf.function(
+            lambda images: model(images, training=False),
+            input_signature=[tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)]
+        )
+    
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.function(batch).numpy()
+
+class TFLiteBackend:
+    """
+    TensorFlow Lite interpreter over an exported `.tflite` file
+    
+    The interpreter is resized when the batch size changes and is not
+    thread-safe, so calls are serialised. The standalone `tflite_runtime`
+    package is used when installed, so serving doesn't need TensorFlow.
+    """
+    
+    def __init__(self, model_path: Path, num_threads: Optional[int] = None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            
+            Interpreter = tf.lite.Interpreter
+        
+        self.interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.batch_size = 1
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def export(model: "Model", model_path: Path, quantize: bool = False, calibration: Optional[Iterable[np.ndarray]] = None):
+        """Convert a Keras model, optionally with int8 weights and activations (float I/O)"""
+        import tensorflow as tf
+        
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if quantize:
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = lambda: ([sample[None]] for sample in calibration)
+        model_path.write_bytes(converter.convert())
+    
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self.lock:
+            if len(batch) != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(batch)
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+class OnnxBackend:
+    """ONNX Runtime session over an exported `.onnx` file (needs tf2onnx + onnxruntime)"""
+    
+    def __init__(self, model_path: Path, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    @staticmethod
+    def export(model: "Model", model_path: Path, quantize: bool = False, calibration: Optional[Iterable[np.ndarray]] = None):
+        """Convert a Keras model, optionally with static int8 quantisation (QDQ)"""
+        import tensorflow as tf
+        import tf2onnx
+        
+        signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="images")]
+        float_path = model_path.with_suffix(".float.onnx") if quantize else model_path
+        tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=str(float_path))
+        if not quantize:
+            return
+        
+        from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+        
+        class Reader(CalibrationDataReader):
+            def __init__(self):
+                self.samples = iter(calibration)
+            
+            def get_next(self):
+                sample = next(self.samples, None)
+                return None if sample is None else {"images": sample[None]}
+        
+        quantize_static(
+            str(float_path), str(model_path), Reader(),
+            weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8
+        )
+        float_path.unlink()
+    
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
 
 class FeatureExtractor:
-    """Extract features from images using pre-trained MobileNetV2"""
+    """
+    Extract features from images using pre-trained MobileNetV2
+    
+    Inference runs through a pluggable backend (`INFERENCE_BACKENDS`):
+    - "keras": `model.predict` (reference)
+    - "tf-function": the same model called through a traced graph
+    - "tflite" / "onnx": an exported model, built on first use and cached in
+      `model_dir`; with `quantize=True` it is post-training quantised to int8,
+      which changes the embeddings, so `model_version` changes too
     
-    def __init__(self):
+    All model files live in `model_dir`. The Keras model itself is saved there
+    the first time it is built from the ImageNet weights; with `offline=True`
+    a missing file is an error instead of a download (run prepare_model.py
+    when building the image).
+    """
+    
+    def __init__(
+        self,
+        backend: str = "tf-function",
+        quantize: bool = False,
+        model_dir: str = "models",
+        num_threads: Optional[int] = None,
+        calibration_dir: Optional[str] = None,
+        offline: bool = False
+    ):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        if quantize and backend not in ("tflite", "onnx"):
+            raise ValueError("int8 quantisation needs the tflite or onnx backend")
+        
         self.model = None
         self.model_name = "MobileNetV2"
+        # Bump when weights or preprocessing change; stored embeddings are tied to it
+        self.base_version = "imagenet-avg-224-v1"
+        self.model_version = self.base_version + ("-int8" if quantize else "")
         self.input_shape = (224, 224, 3)
         self.feature_size = 1280
         
+        self.backend = backend
+        self.quantize = quantize
+        self.model_dir = Path(model_dir)
+        self.num_threads = num_threads
+        self.calibration_dir = calibration_dir
+        self.offline = offline
+    
+    @classmethod
+    def from_env(cls) -> "FeatureExtractor":
+        """Configure from INFERENCE_* / MODEL_* environment variables"""
+        return cls(
+            backend=os.getenv("INFERENCE_BACKEND", "tf-function"),
+            quantize=os.getenv("INFERENCE_QUANTIZE", "false").lower() == "true",
+            model_dir=os.getenv("MODEL_DIR", "models"),
+            num_threads=int(os.getenv("INFERENCE_NUM_THREADS", 0)) or None,
+            calibration_dir=os.getenv("INFERENCE_CALIBRATION_DIR"),
+            offline=os.getenv("MODEL_OFFLINE", "false").lower() == "true"
+        )
+    
+    def _keras_model(self) -> "Model":
+        """MobileNetV2 from the local artifact, building (and saving) it on first use"""
+        import tensorflow as tf
+        
+        model_path = self.model_dir / f"{self.model_name}-{self.base_version}.keras"
+        if model_path.exists():
+            return tf.keras.models.load_model(model_path, compile=False)
+        if self.offline:
+            raise FileNotFoundError(f"{model_path} not found (offline mode) - run prepare_model.py first")
+        
+        # Load MobileNetV2 without top layer (already has global average pooling)
+        logger.info("🔧 Building %s from ImageNet weights -> %s", self.model_name, model_path)
+        model = tf.keras.applications.MobileNetV2(
+            weights='imagenet',
+            include_top=False,
+            pooling='avg',
+            input_shape=self.input_shape
+        )
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = model_path.with_name(f".{model_path.stem}.{os.getpid()}{model_path.suffix}")
+        model.save(tmp_path)
+        os.replace(tmp_path, model_path)
+        return model
+    
+    def _calibration_images(self, count: int = 100):
+        """
+        Preprocessed samples for int8 calibration
+        
+        Images from `calibration_dir` (ideally real catalog photos) if set,
+        otherwise random noise - which works, but calibrates ranges less well.
+        """
+        if self.calibration_dir:
+            from app.utils.image_processor import ImageProcessor
+            
+            processor = ImageProcessor()
+            paths = sorted(p for p in Path(self.calibration_dir).iterdir() if p.is_file())[:count]
+            for path in paths:
+                yield self._preprocess(processor.process_image(str(path))[None])[0]
+            return
+        
+        rng = np.random.default_rng(0)
+        for _ in range(count):
+            yield self._preprocess(rng.uniform(0, 255, (1,) + self.input_shape))[0]
+    
+    def _artifact_path(self) -> Path:
+        suffix = ".tflite" if self.backend == "tflite" else ".onnx"
+        return self.model_dir / f"{self.model_name}-{self.model_version}{suffix}"
+    
     def load_model(self):
-        """Load pre-trained MobileNetV2 model"""
+        """Load pre-trained MobileNetV2 and build the configured inference backend"""
         try:
-            print("📦 Loading MobileNetV2 model...")
-            
-            # Load MobileNetV2 without top layer
-            base_model = MobileNetV2(
-                weights='imagenet',
-                include_top=False,
-                pooling='avg',
-                input_shape=self.input_shape
-            )
+            logger.info("📦 Loading %s model (%s backend)...", self.model_name, self.backend)
             
-            # Use the model directly (already has global average pooling)
-            self.model = base_model
-            
-            print(f"✅ Model loaded: {self.model_name}")
-            print(f"   Feature vector size: {self.feature_size}")
+            if self.backend == "keras":
+                self.model = KerasBackend(self._keras_model())
+            elif self.backend == "tf-function":
+                self.model = TFFunctionBackend(self._keras_model())
+            else:
+                backend_class = TFLiteBackend if self.backend == "tflite" else OnnxBackend
+                model_path = self._artifact_path()
+                if not model_path.exists():
+                    if self.offline:
+                        raise FileNotFoundError(f"{model_path} not found (offline mode) - run prepare_model.py first")
+                    logger.info("🔧 Exporting model to %s%s...", model_path, " (int8)" if self.quantize else "")
+                    self.model_dir.mkdir(parents=True, exist_ok=True)
+                    tmp_path = model_path.with_name(f".{model_path.name}.{os.getpid()}{model_path.suffix}")
+                    backend_class.export(self._keras_model(), tmp_path, self.quantize, self._calibration_images())
+                    os.replace(tmp_path, model_path)
+                self.model = backend_class(model_path, self.num_threads)
             
+            logger.info("✅ Model loaded: %s (%d-dim features)", self.model_name, self.feature_size)
+        
         except Exception as e:
-            print(f"❌ Failed to load model: {str(e)}")
+            logger.error("❌ Failed to load model: %s", e)
             raise
     
+    def warm_up(self, batch_sizes: Sequence[int] = (1,)):
+        """
+        Run dummy batches through the model
+        
+        The first call of each batch size traces the graph / allocates the
+        interpreter's tensors; doing it here keeps that off the first request.
+        """
+        for batch_size in batch_sizes:
+            self.extract_features_batch([np.zeros(self.input_shape, dtype=np.float32)] * batch_size)
+    
+    def _preprocess(self, image_batch: np.ndarray) -> np.ndarray:
+        """Scale a batch for MobileNetV2 ([-1, 1], float32 - same as Keras' preprocess_input)"""
+        return np.asarray(image_batch, dtype=np.float32) / 127.5 - 1.0
+    
     def extract_features(self, image_array):
         """
         Extract feature vector from image
         
         Args:
             image_array: numpy array of shape (224, 224, 3)
-            
+        
         Returns:
             numpy array of shape (1280,) - feature vector
         """
@@ -54,16 +298,16 @@ class FeatureExtractor:
             image_batch = np.expand_dims(image_array, axis=0)
             
             # Preprocess for MobileNetV2
-            preprocessed = preprocess_input(image_batch)
+            preprocessed = self._preprocess(image_batch)
             
             # Extract features
-            features = self.model.predict(preprocessed, verbose=0)
+            features = self.model.predict(preprocessed)
             
             # Return flattened feature vector
             return features.flatten()
-            
+        
         except Exception as e:
-            print(f"❌ Feature extraction failed: {str(e)}")
+            logger.error("❌ Feature extraction failed: %s", e)
             raise
     
     def extract_features_batch(self, image_arrays):
@@ -72,7 +316,7 @@ class FeatureExtractor:
         
         Args:
             image_arrays: list of numpy arrays
-            
+        
         Returns:
             numpy array of shape (n_images, 1280)
         """
@@ -84,13 +328,13 @@ class FeatureExtractor:
             image_batch = np.stack(image_arrays, axis=0)
             
             # Preprocess
-            preprocessed = preprocess_input(image_batch)
+            preprocessed = self._preprocess(image_batch)
             
             # Extract features
-            features = self.model.predict(preprocessed, verbose=0)
+            features = self.model.predict(preprocessed)
             
             return features
-            
+        
         except Exception as e:
-            print(f"❌ Batch feature extraction failed: {str(e)}")
+            logger.error("❌ Batch feature extraction failed: %s", e)
             raise
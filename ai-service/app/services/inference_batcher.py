@@ -0,0 +1,138 @@
+import asyncio
+import time
+import numpy as np
+from typing import List, Optional, Tuple
+
+from app.utils.executors import ExecutorSaturatedError
+from app.utils.metrics import INFERENCE_BATCH_SIZE, STAGE_SECONDS
+
+
+class InferenceBatcher:
+    """
+    Collect concurrent feature-extraction requests into model batches
+
+    Requests are queued; a single worker takes whatever arrives within
+    `max_wait_ms` of the first request (up to `max_batch_size` images) and runs
+    it through `FeatureExtractor.extract_features_batch` in one call on
+    `executor` (the loop's default executor if None). Every caller gets back
+    its own row.
+    """
+
+    def __init__(
+        self,
+        feature_extractor,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 0,
+        executor=None
+    ):
+        self.feature_extractor = feature_extractor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size  # 0 = unbounded
+        self.executor = executor
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting for a model slot"""
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def start(self):
+        """Start the batching worker on the running event loop"""
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker; requests still queued are failed"""
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference batcher stopped"))
+
+    async def extract(self, image_array: np.ndarray) -> np.ndarray:
+        """
+        Extract features for one image via the shared batch
+
+        Args:
+            image_array: numpy array of shape (224, 224, 3)
+
+        Returns:
+            numpy array of shape (1280,) - feature vector
+
+        Raises:
+            ExecutorSaturatedError: if max_queue_size requests are already waiting
+        """
+        if self.worker is None:
+            raise RuntimeError("Inference batcher not started. Call start() first.")
+        if self.max_queue_size and self.queue.qsize() >= self.max_queue_size:
+            raise ExecutorSaturatedError(f"Inference queue is full ({self.queue.qsize()} waiting)")
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image_array, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """Wait for one request, then gather more until the batch is full or the window closes"""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take anything already waiting without yielding
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Callers that gave up (e.g. client disconnect) don't need a model slot
+        return [(image, future) for image, future in batch if not future.cancelled()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            images = [image for image, _ in batch]
+            INFERENCE_BATCH_SIZE.observe(len(images))
+            started = time.perf_counter()
+            try:
+                features = await loop.run_in_executor(
+                    self.executor, self.feature_extractor.extract_features_batch, images
+                )
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage="model")
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Inference batcher stopped"))
+                raise
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), row in zip(batch, features):
+                if not future.done():
+                    future.set_result(row)
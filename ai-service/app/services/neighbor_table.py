@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class NeighborTable:
+    """
+    Precomputed "more like this" results for every indexed product
+
+    Row i holds the k most similar products to product `ids[i]` (queried with
+    its primary image, itself excluded), as row numbers into the same table
+    plus their scores, so a lookup is a dict access and a slice. Rows are
+    never moved: removed products are marked dead and dropped when the table
+    is saved.
+
+    The table follows the index incrementally. `plan` works out which rows a
+    batch of index changes can affect:
+        - changed products themselves (compared by a fingerprint of their
+          vectors and active flag, so re-upserting identical data is free)
+        - rows listing a changed or removed product as a neighbour
+        - rows a changed product could now enter: its best image scores at
+          least the row's k-th score (one blocked matrix product)
+    and `compute` re-ranks those rows with `SimilaritySearch.search_batch`.
+    """
+
+    def __init__(self, k: int = 20, path: Optional[str] = None, chunk_size: int = 1024):
+        self.k = k
+        self.path = Path(path) if path else None
+        self.chunk_size = chunk_size
+
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.neighbors = np.full((0, k), -1, dtype=np.int32)
+        self.scores = np.zeros((0, k), dtype=np.float32)
+        self.fingerprints = np.zeros(0, dtype=np.uint64)
+        self.computed = np.zeros(0, dtype=bool)
+        self.live = np.zeros(0, dtype=bool)
+
+    @property
+    def size(self) -> int:
+        """Number of products with an up-to-date neighbour list"""
+        return int((self.computed & self.live).sum())
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self.live):
+            return
+        new_capacity = max(capacity, 2 * len(self.live), 64)
+        grow = new_capacity - len(self.live)
+        self.neighbors = np.vstack([self.neighbors, np.full((grow, self.k), -1, dtype=np.int32)])
+        self.scores = np.vstack([self.scores, np.zeros((grow, self.k), dtype=np.float32)])
+        self.fingerprints = np.concatenate([self.fingerprints, np.zeros(grow, dtype=np.uint64)])
+        self.computed = np.concatenate([self.computed, np.zeros(grow, dtype=bool)])
+        self.live = np.concatenate([self.live, np.zeros(grow, dtype=bool)])
+
+    def _row(self, product_id: str) -> int:
+        row = self.index.get(product_id)
+        if row is None:
+            row = len(self.ids)
+            self._reserve(row + 1)
+            self.ids.append(product_id)
+            self.index[product_id] = row
+            self.live[row] = True
+        return row
+
+    def _fingerprint(self, search, product_id: str) -> int:
+        rows = search.product_rows[product_id]
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(np.ascontiguousarray(search.matrix[rows]).tobytes())
+        digest.update(bytes([bool(search.columns["active"][rows[0]])]))
+        return int.from_bytes(digest.digest(), "little")
+
+    def get(self, product_id: str) -> Optional[List[Tuple[str, float]]]:
+        """Precomputed (product ID, score) neighbours, best first, or None if not computed"""
+        row = self.index.get(product_id)
+        if row is None or not self.computed[row]:
+            return None
+        return [
+            (self.ids[neighbor], float(score))
+            for neighbor, score in zip(self.neighbors[row], self.scores[row])
+            if neighbor >= 0 and self.live[neighbor]
+        ]
+
+    def plan(self, search) -> List[str]:
+        """
+        Apply the index changes since the last plan and return the products to recompute
+
+        Call with the index locked; `compute` can then run in chunks.
+        """
+        changed = search.pop_changed_products()
+        candidates = set(search.product_rows) | set(self.index) if changed is None else changed
+
+        modified, removed = [], []
+        for product_id in candidates:
+            row = self.index.get(product_id)
+            if product_id not in search.product_rows:
+                if row is not None and self.live[row]:
+                    removed.append(row)
+                continue
+            fingerprint = self._fingerprint(search, product_id)
+            if row is None or self.fingerprints[row] != fingerprint or not self.computed[row]:
+                row = self._row(product_id)
+                self.fingerprints[row] = fingerprint
+                modified.append(row)
+
+        affected = np.zeros(len(self.ids), dtype=bool)
+        affected[modified] = True
+        for row in removed:
+            self.live[row] = False
+            self.computed[row] = False
+            del self.index[self.ids[row]]
+
+        touched = np.array(modified + removed, dtype=np.int32)
+        if len(touched):
+            # Rows listing a changed or removed product
+            affected |= np.isin(self.neighbors[:len(self.ids)], touched).any(axis=1)
+        if modified:
+            affected |= self._could_enter(search, [self.ids[row] for row in modified])
+
+        affected &= self.live[:len(self.ids)]
+        return [self.ids[row] for row in np.flatnonzero(affected)]
+
+    def _could_enter(self, search, product_ids: List[str]) -> np.ndarray:
+        """Rows where any of the given products' images scores at least the row's k-th score"""
+        target_rows = [row for product_id in product_ids for row in search.product_rows[product_id]]
+        targets = np.asarray(search.matrix[target_rows])
+
+        # A full row admits products above its k-th score; a short one anything above the threshold
+        bounds = np.where(
+            self.neighbors[:len(self.ids), -1] >= 0, self.scores[:len(self.ids), -1], search.similarity_threshold
+        )
+        rows = np.flatnonzero(self.computed[:len(self.ids)] & self.live[:len(self.ids)])
+
+        could_enter = np.zeros(len(self.ids), dtype=bool)
+        for start in range(0, len(rows), search.row_tile):
+            block = rows[start:start + search.row_tile]
+            queries = np.stack([search.product_vector(self.ids[row]) for row in block])
+            best = (queries @ targets.T).max(axis=1)
+            could_enter[block] = best >= bounds[block]
+        return could_enter
+
+    def compute(self, search, product_ids: List[str]):
+        """Recompute the neighbour lists of the given products (call with the index locked)"""
+        product_ids = [product_id for product_id in product_ids if product_id in search.product_rows]
+        if not product_ids:
+            return
+
+        queries = np.stack([search.product_vector(product_id) for product_id in product_ids])
+        results = search.search_batch(queries, self.k, exclude=product_ids)
+
+        for product_id, products in zip(product_ids, results):
+            row = self._row(product_id)
+            neighbors = [self._row(product["id"]) for product in products]
+            self.neighbors[row] = -1
+            self.neighbors[row, :len(neighbors)] = neighbors
+            self.scores[row] = 0.0
+            self.scores[row, :len(neighbors)] = [product["similarity"] for product in products]
+            self.computed[row] = True
+
+    def save(self, meta: Dict[str, Any]):
+        """Write the live rows (compacted) to `path`, replacing it atomically"""
+        if self.path is None:
+            return
+        keep = np.flatnonzero(self.live[:len(self.ids)])
+        remap = np.full(len(self.ids) + 1, -1, dtype=np.int32)  # last slot maps -1 to -1
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+        neighbors = remap[self.neighbors[keep]]
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                ids=np.array([self.ids[row] for row in keep], dtype=str),
+                neighbors=neighbors,
+                scores=self.scores[keep],
+                fingerprints=self.fingerprints[keep],
+                computed=self.computed[keep],
+                meta=np.array(json.dumps({**meta, "k": self.k})),
+            )
+        os.replace(tmp, self.path)
+        logger.info("💾 Neighbour table saved: %d products -> %s", len(keep), self.path)
+
+    def load(self, meta: Dict[str, Any]) -> bool:
+        """
+        Load a saved table if it was built with the same settings (model, k, scoring)
+
+        Returns:
+            True if the table was loaded
+        """
+        if self.path is None or not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as data:
+                found = json.loads(str(data["meta"]))
+                if found != {**meta, "k": self.k}:
+                    logger.warning("⚠️  Neighbour table was built with %s - rebuilding it", found)
+                    return False
+                self.ids = data["ids"].tolist()
+                self.neighbors = data["neighbors"]
+                self.scores = data["scores"]
+                self.fingerprints = data["fingerprints"]
+                self.computed = data["computed"]
+            self.live = np.ones(len(self.ids), dtype=bool)
+            self.index = {product_id: row for row, product_id in enumerate(self.ids)}
+            logger.info("📚 Neighbour table loaded: %d products", len(self.ids))
+            return True
+        except Exception as e:
+            logger.error("❌ Failed to load neighbour table: %s", e)
+            return False
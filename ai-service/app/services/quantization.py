@@ -0,0 +1,97 @@
+import numpy as np
+from typing import Optional
+
+
+class ScalarQuantizer:
+    """
+    Scalar quantisation of index vectors for cheaper scans
+
+    - "float16": each value stored as half precision (2x smaller)
+    - "int8": each dimension mapped to 0..255 with a per-dimension offset and
+      scale learned from the catalog (4x smaller)
+
+    Scores are computed directly from the codes: for int8,
+    q . x ~= q . offset + (q * scale) . code, so only the codes are scanned
+    and only they need to stay in RAM.
+    """
+
+    def __init__(self, kind: str = "int8", block_size: int = 1024):
+        if kind not in ("float16", "int8"):
+            raise ValueError(f"Unknown quantization: {kind}")
+        self.kind = kind
+        self.block_size = block_size
+
+        self.offset: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+        self.trained_size = 0
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(np.float16 if self.kind == "float16" else np.uint8)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.kind == "float16" or self.scale is not None
+
+    def needs_training(self, size: int) -> bool:
+        """int8 ranges are learned once there is data, then again whenever the catalog doubles"""
+        if self.kind == "float16" or size == 0:
+            return False
+        return not self.is_trained or size >= 2 * self.trained_size
+
+    def train(self, vectors: np.ndarray, max_train_points: int = 100000, seed: int = 0):
+        """
+        Learn per-dimension ranges (int8 only)
+
+        The 0.1/99.9 percentiles are used instead of min/max so a few outliers
+        don't waste most of the 256 levels.
+        """
+        if self.kind == "float16":
+            return
+
+        sample = vectors
+        if len(vectors) > max_train_points:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), max_train_points, replace=False)]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        low = np.percentile(sample, 0.1, axis=0)
+        high = np.percentile(sample, 99.9, axis=0)
+        self.offset = low.astype(np.float32)
+        self.scale = (np.maximum(high - low, 1e-12) / 255.0).astype(np.float32)
+        self.trained_size = len(vectors)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Codes for a matrix of vectors, converted one block at a time (so a memmap is read, not copied)"""
+        codes = np.empty(np.shape(vectors), dtype=self.dtype)
+        for start in range(0, len(codes), self.block_size):
+            block = np.asarray(vectors[start:start + self.block_size], dtype=np.float32)
+            if self.kind == "int8":
+                block = np.clip(np.rint((block - self.offset) / self.scale), 0, 255)
+            codes[start:start + self.block_size] = block
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        if self.kind == "float16":
+            return codes.astype(np.float32)
+        return codes.astype(np.float32) * self.scale + self.offset
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products between a query and encoded rows
+
+        Codes are widened to float32 one block at a time, so the temporary
+        memory stays bounded however large the index is. A 2-D `query` (one
+        query per row) gives one column of scores per query.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if self.kind == "float16":
+            weights, bias = query, 0.0
+        else:
+            weights, bias = query * self.scale, query @ self.offset
+
+        scores = np.empty((len(codes),) + query.shape[:-1], dtype=np.float32)
+        for start in range(0, len(codes), self.block_size):
+            block = codes[start:start + self.block_size].astype(np.float32)
+            scores[start:start + self.block_size] = block @ weights.T
+        return scores + bias
@@ -0,0 +1,275 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Tuple
+
+from app.services.similarity_search import column_mask
+from app.utils.executors import ShardUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# BLAS pools per worker; the shards already use one core each
+_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+Layout = Dict[str, Tuple[str, Tuple[int, ...], str]]
+
+
+def _attach(attached: Dict[str, Any], layout: Layout) -> Dict[str, np.ndarray]:
+    """Map the arrays named in the layout, reusing segments that haven't been replaced"""
+    arrays = {}
+    for key, (name, shape, dtype) in layout.items():
+        segment = attached.get(key)
+        if segment is None or segment.name != name:
+            if segment is not None:
+                segment.close()
+            segment = shared_memory.SharedMemory(name=name)
+            attached[key] = segment
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    return arrays
+
+
+def _shortlist(arrays: Dict[str, np.ndarray], request: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Best candidate rows of one shard's slice
+
+    Returns:
+        (global rows, scores) best first, and the score products outside
+        them can't exceed (-inf if every candidate was returned)
+    """
+    start, stop = request["start"], request["stop"]
+    columns = {name: arrays[name][start:stop] for name in ("category", "price", "active", "stock")}
+    mask = column_mask(columns, *request["filters"])
+
+    if mask.sum() <= request["prefilter_ratio"] * (stop - start):
+        rows = np.flatnonzero(mask)
+        scores = arrays["matrix"][start + rows] @ request["query"]
+    else:
+        scores = arrays["matrix"][start:stop] @ request["query"]
+        rows = np.flatnonzero(mask)
+        scores = scores[rows]
+
+    keep = scores >= request["threshold"]
+    rows, scores = rows[keep], scores[keep]
+
+    limit = request["limit"]
+    bound = -np.inf
+    if len(rows) > limit:
+        part = np.argpartition(-scores, limit - 1)[:limit]
+        rows, scores = rows[part], scores[part]
+        bound = float(scores.min())
+    order = np.argsort(-scores, kind="stable")
+    return rows[order] + start, scores[order], bound
+
+
+def _worker(conn):
+    attached: Dict[str, Any] = {}
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        try:
+            conn.send(_shortlist(_attach(attached, request["layout"]), request))
+        except Exception as e:
+            conn.send(e)
+    for segment in attached.values():
+        segment.close()
+    conn.close()
+
+
+class ShardPool:
+    """
+    Score queries over the catalog index in parallel worker processes
+
+    The index arrays (vector matrix and metadata columns) are allocated in
+    shared memory, so every worker maps the same pages without a copy. A
+    search is scattered as the query plus the layout of the arrays; worker i
+    scores its contiguous slice of the live rows, applies the filters on the
+    columns, and sends back its best rows. The coordinator merges them.
+
+    Arrays are written only by the coordinator, between searches, so workers
+    always see a consistent index. Growing an array allocates a new segment;
+    workers re-attach when its name changes.
+
+    A worker that has died, or doesn't answer within `timeout` seconds, is
+    replaced and the search raises ShardUnavailableError, so the caller can
+    answer from the shared arrays in-process instead.
+    """
+
+    def __init__(self, shards: int, timeout: float = 5.0):
+        self.shards = shards
+        self.timeout = timeout
+        self.segments: Dict[str, Tuple[shared_memory.SharedMemory, weakref.ref]] = {}
+        # Replaced segments, unmapped once the array over them is garbage
+        # (numpy doesn't pin the mapping, so closing earlier would crash)
+        self.retired: List[Tuple[shared_memory.SharedMemory, weakref.ref]] = []
+        self.layout: Layout = {}
+        self.connections: List[Any] = []
+        self.processes: List[multiprocessing.Process] = []
+        self.lock = threading.Lock()  # one scatter/gather at a time on the pipes
+
+    def allocate(self, key: str, shape, dtype) -> np.ndarray:
+        """Zeroed shared array for `key`, replacing (and releasing) the previous one"""
+        shape = tuple(np.atleast_1d(shape).tolist())
+        dtype = np.dtype(dtype)
+        segment = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        array.fill(0)
+
+        previous = self.segments.get(key)
+        self.segments[key] = (segment, weakref.ref(array))
+        self.layout[key] = (segment.name, shape, dtype.str)
+        if previous is not None:
+            # Existing mappings (the old array, workers still attached) stay valid
+            previous[0].unlink()
+            self.retired.append(previous)
+        self._close_retired()
+        return array
+
+    def _close_retired(self):
+        """Unmap replaced segments whose arrays (and so all views of them) are gone"""
+        still_used = []
+        for segment, array in self.retired:
+            if array() is None:
+                segment.close()
+            else:
+                still_used.append((segment, array))
+        self.retired = still_used
+
+    def _spawn(self) -> Tuple[Any, multiprocessing.Process]:
+        """Start one worker process (spawned, one BLAS thread)"""
+        context = multiprocessing.get_context("spawn")
+        saved = {name: os.environ.get(name) for name in _THREAD_VARS}
+        os.environ.update({name: "1" for name in _THREAD_VARS})
+        try:
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker, args=(child,), daemon=True)
+            process.start()
+            child.close()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        return parent, process
+
+    def _replace(self, shard: int):
+        """Kill a dead or stuck worker and start a fresh one in its place"""
+        process = self.processes[shard]
+        if process.is_alive():
+            process.kill()
+        process.join(timeout=5)
+        self.connections[shard].close()
+        self.connections[shard], self.processes[shard] = self._spawn()
+        logger.warning("⚠️  Search shard %d replaced (exit code %s)", shard, process.exitcode)
+
+    def start(self):
+        """Start the worker processes"""
+        if self.processes:
+            return
+        for _ in range(self.shards):
+            connection, process = self._spawn()
+            self.connections.append(connection)
+            self.processes.append(process)
+        logger.info("🧩 Search shards started: %d worker processes", self.shards)
+
+    def search(
+        self,
+        query: np.ndarray,
+        size: int,
+        limit: int,
+        filters: Tuple,
+        threshold: float,
+        prefilter_ratio: float
+    ) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Scatter a query to every shard and gather their shortlists
+
+        Args:
+            query: L2-normalised query vector
+            size: Number of live rows (split evenly across the shards)
+            limit: Rows each shard returns at most
+            filters: (category codes, min price, max price, in stock) for column_mask
+            threshold: Minimum score of a candidate row
+            prefilter_ratio: Shards score only matching rows below this match ratio
+
+        Returns:
+            (rows, scores) from all shards, and the highest score a row outside them can have
+
+        Raises:
+            ShardUnavailableError: a worker died or timed out (it has been replaced)
+        """
+        if not self.processes:
+            raise RuntimeError("Shard pool is not started")
+
+        bounds = np.linspace(0, size, self.shards + 1).astype(int)
+        with self.lock:
+            # Workers that died since the last search are replaced up front
+            for i, process in enumerate(self.processes):
+                if not process.is_alive():
+                    self._replace(i)
+
+            failed = set()
+            for i, connection in enumerate(self.connections):
+                try:
+                    connection.send({
+                        "layout": self.layout,
+                        "start": int(bounds[i]),
+                        "stop": int(bounds[i + 1]),
+                        "query": query,
+                        "limit": limit,
+                        "filters": filters,
+                        "threshold": threshold,
+                        "prefilter_ratio": prefilter_ratio,
+                    })
+                except OSError:
+                    failed.add(i)
+
+            # Every live worker is drained, so no late reply is left in a pipe
+            deadline = time.monotonic() + self.timeout
+            results = []
+            for i, connection in enumerate(self.connections):
+                if i in failed:
+                    continue
+                try:
+                    if connection.poll(max(deadline - time.monotonic(), 0)):
+                        results.append(connection.recv())
+                        continue
+                except (EOFError, OSError):
+                    pass
+                failed.add(i)
+
+            for i in sorted(failed):
+                self._replace(i)
+        if failed:
+            raise ShardUnavailableError(f"Search shards {sorted(failed)} failed or timed out")
+
+        rows, scores, bound = [], [], -np.inf
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+            rows.append(result[0])
+            scores.append(result[1])
+            bound = max(bound, result[2])
+        return np.concatenate(rows), np.concatenate(scores), bound
+
+    def close(self):
+        """Stop the workers and release the shared memory"""
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        self.connections, self.processes = [], []
+        for segment, _ in self.segments.values():
+            segment.unlink()
+        self.retired.extend(self.segments.values())
+        self.segments, self.layout = {}, {}
+        self._close_retired()
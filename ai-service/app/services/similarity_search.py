@@ -1,12 +1,997 @@
+import logging
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Any
+from itertools import chain
+from typing import List, Dict, Any, Optional, Iterable, Set, Tuple
+
+from app.services.ann_index import ExactIndex
+from app.utils.executors import ShardUnavailableError
+
+logger = logging.getLogger(__name__)
+
+def column_mask(
+    columns: Dict[str, np.ndarray],
+    category_codes: Optional[List[int]] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False
+) -> np.ndarray:
+    """Boolean mask over (equal-length slices of) the metadata columns; inactive rows never match"""
+    mask = columns["active"].copy()
+    if category_codes is not None:
+        mask &= np.isin(columns["category"], category_codes)
+    if min_price is not None:
+        mask &= columns["price"] >= min_price
+    if max_price is not None:
+        mask &= columns["price"] <= max_price
+    if in_stock:
+        mask &= columns["stock"] > 0
+    return mask
 
 class SimilaritySearch:
     """Find similar products using cosine similarity"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        feature_size: int = 1280,
+        ann_index=None,
+        quantizer=None,
+        rerank_factor: int = 0,
+        aggregation: str = "max",
+        top_m: int = 3,
+        shards=None,
+        dedup=None,
+        color_weight: float = 0.0,
+        color_candidates: int = 200,
+        store=None
+    ):
+        if aggregation not in ("max", "mean"):
+            raise ValueError(f"Unknown score aggregation: {aggregation}")
+        if shards is not None and (quantizer is not None or getattr(ann_index, "name", "exact") != "exact"):
+            raise ValueError("Sharded search only supports the exact, unquantized index")
+        
         self.similarity_threshold = 0.3  # Minimum similarity to include
+        self.feature_size = feature_size
+        
+        # A product scores its best image ("max") or the mean of its best
+        # top_m images ("mean")
+        self.aggregation = aggregation
+        self.top_m = top_m
+        
+        # Candidate generation backend (exact brute force unless configured)
+        self.ann_index = ann_index or ExactIndex()
+        
+        # Optional scalar quantisation: scans read the compact `codes` copy of
+        # the matrix; with rerank_factor > 0 the best top_k * rerank_factor
+        # candidates are re-scored exactly from the float32 rows. Given an
+        # EmbeddingStore `store`, those rows stay on disk (the memory-mapped
+        # snapshot, or a file-backed scratch array once the index changes
+        # shape), so only the codes are held in RAM
+        self.quantizer = quantizer
+        self.rerank_factor = rerank_factor
+        self.codes: Optional[np.ndarray] = None
+        self.store = store
+        
+        # Optional ShardPool: the matrix and metadata columns live in shared
+        # memory and each search is scattered across its worker processes
+        self.shards = shards
+        
+        # Optional DuplicateIndex: near-duplicate products (the same photo
+        # under several SKUs) are collapsed to their best-ranked member
+        self.dedup = dedup
+        
+        # Colour re-rank stage: for queries with a colour histogram, the best
+        # color_candidates products by embedding are re-scored as
+        # (1 - color_weight) * embedding + color_weight * colour similarity.
+        # `histograms[row]` is the row's image histogram (all zeros if unknown)
+        self.color_weight = color_weight
+        self.color_candidates = color_candidates
+        self.histograms: Optional[np.ndarray] = None
+        
+        # Resident catalog index: rows [0, size) of `matrix` are live,
+        # L2-normalised image vectors, one row per embedded product image;
+        # `product_ids[row]` maps a row back to its product and
+        # `product_rows[product_id]` lists a product's rows
+        self.matrix = self._allocate("matrix", (0, feature_size), np.float32)
+        self.product_ids: List[str] = []
+        self.product_rows: Dict[str, List[int]] = {}
+        self.products: Dict[str, Dict[str, Any]] = {}
+        
+        # Columnar per-row metadata for filtering without touching the product
+        # dicts: category IDs are dictionary-encoded to small ints (-1 = none)
+        self.columns = {
+            "category": self._allocate("category", 0, np.int32),
+            "price": self._allocate("price", 0, np.float32),
+            "active": self._allocate("active", 0, bool),
+            "stock": self._allocate("stock", 0, np.int32),
+        }
+        self.category_codes: Dict[str, int] = {}
+        
+        # Filters matching at most this fraction of the catalog are applied
+        # before scoring (only matching rows are scanned, bypassing the ANN
+        # backend); broader ones are applied to the candidates while scoring
+        self.prefilter_ratio = 0.3
+        
+        # Batch search scores query_tile queries against row_tile rows at a
+        # time, so its scratch memory is bounded by one tile of scores
+        self.query_tile = 256
+        self.row_tile = 16384
+        
+        # Bumped on every change to the index contents (vectors or metadata)
+        self.version = 0
+        
+        # Bumped only when the rows themselves change (vectors, histograms or
+        # row order), so a snapshot after a metadata-only change can reuse the
+        # previous matrix file
+        self.rows_version = 0
+        
+        # Products upserted or removed since the last pop_changed_products();
+        # None after load_index, when any product may have changed
+        self.changed_products: Optional[Set[str]] = set()
+    
+    @property
+    def size(self) -> int:
+        """Number of vectors (rows) currently held in the index"""
+        return len(self.product_ids)
+    
+    @property
+    def product_count(self) -> int:
+        """Number of products currently held in the index"""
+        return len(self.product_rows)
+    
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Bytes allocated per index array (capacity, not just live rows), plus the total
+        
+        Arrays memory-mapped from files (a snapshot, or the scratch rows of a
+        quantized index) are reported as "mapped" and left out of the total:
+        they are page cache the kernel can evict, not process memory.
+        """
+        arrays = {
+            "matrix": [self.matrix],
+            "codes": [self.codes],
+            "histograms": [self.histograms],
+            "columns": list(self.columns.values()),
+        }
+        usage = {
+            name: sum(a.nbytes for a in group if a is not None and not isinstance(a, np.memmap))
+            for name, group in arrays.items()
+        }
+        usage["total"] = sum(usage.values())
+        usage["mapped"] = sum(a.nbytes for group in arrays.values() for a in group if isinstance(a, np.memmap))
+        return usage
+    
+    @property
+    def _rows_on_disk(self) -> bool:
+        """Whether the float32 rows are kept in a file instead of RAM (quantized, with a store)"""
+        return self.quantizer is not None and self.store is not None
+    
+    def _allocate(self, name: str, shape, dtype) -> np.ndarray:
+        """
+        Zeroed array for the named index array
+        
+        Non-empty arrays go in shared memory when sharded, and a quantized
+        index's float32 matrix goes in a file-backed scratch array.
+        """
+        if np.prod(shape) > 0:
+            if self.shards is not None:
+                return self.shards.allocate(name, shape, dtype)
+            if name == "matrix" and self._rows_on_disk:
+                return self.store.scratch(shape, dtype)
+        return np.zeros(shape, dtype=dtype)
+    
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        """L2-normalise vectors row-wise (zero vectors are left as zeros)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+    
+    def _reserve(self, capacity: int):
+        """Grow the backing arrays geometrically so appends stay amortised O(1)"""
+        if capacity <= self.matrix.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self.matrix.shape[0], 64)
+        
+        matrix = self._allocate("matrix", (new_capacity, self.feature_size), np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        self.matrix = matrix
+        
+        for name, column in self.columns.items():
+            grown = self._allocate(name, new_capacity, column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        
+        if self.codes is not None:
+            codes = np.zeros((new_capacity, self.feature_size), dtype=self.codes.dtype)
+            codes[:self.size] = self.codes[:self.size]
+            self.codes = codes
+        
+        if self.histograms is not None:
+            histograms = np.zeros((new_capacity, self.histograms.shape[1]), dtype=np.float32)
+            histograms[:self.size] = self.histograms[:self.size]
+            self.histograms = histograms
+    
+    def pop_changed_products(self) -> Optional[Set[str]]:
+        """Take the set of products touched since the last call (None means all of them)"""
+        changed, self.changed_products = self.changed_products, set()
+        return changed
+    
+    def _mark_changed(self, product_ids: Iterable[str]):
+        if self.changed_products is not None:
+            self.changed_products.update(product_ids)
+    
+    def _train_if_needed(self):
+        """(Re)train the ANN backend and quantizer once the catalog is big enough"""
+        if self.ann_index.needs_training(self.size):
+            self.ann_index.train(self.matrix[:self.size])
+        
+        if self.quantizer is not None and (self.codes is None or self.quantizer.needs_training(self.size)):
+            if self.quantizer.needs_training(self.size):
+                self.quantizer.train(self.matrix[:self.size])
+            if self.quantizer.is_trained:
+                self.codes = np.zeros((self.matrix.shape[0], self.feature_size), dtype=self.quantizer.dtype)
+                self.codes[:self.size] = self.quantizer.encode(self.matrix[:self.size])
+    
+    @property
+    def quantized(self) -> bool:
+        return self.quantizer is not None and self.codes is not None
+    
+    def _score(self, rows: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """Scores of the given rows (all live rows if None) - approximate when quantized"""
+        if self.quantized:
+            codes = self.codes[:self.size] if rows is None else self.codes[rows]
+            return self.quantizer.score(codes, query)
+        matrix = self.matrix[:self.size] if rows is None else self.matrix[rows]
+        return matrix @ query
+    
+    def _product_metadata(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep only the fields returned in search results"""
+        return {
+            "id": product["id"],
+            "name": product["name"],
+            "slug": product["slug"],
+            "price": product["price"],
+            "images": product["images"],
+            "category": product.get("category", {}),
+            "categoryId": product.get("categoryId") or (product.get("category") or {}).get("id"),
+            "isActive": product.get("isActive", True),
+            "stock": product.get("stock") or 0,
+            "imageHashes": product.get("image_hashes") or [],
+        }
+    
+    def _category_code(self, category_id: Optional[str]) -> int:
+        if category_id is None:
+            return -1
+        return self.category_codes.setdefault(category_id, len(self.category_codes))
+    
+    def _set_columns(self, rows, metadata: Dict[str, Any]):
+        """Write a product's filterable fields into the metadata columns of its rows"""
+        self.columns["category"][rows] = self._category_code(metadata["categoryId"])
+        self.columns["price"][rows] = metadata["price"]
+        self.columns["active"][rows] = bool(metadata.get("isActive", True))
+        self.columns["stock"][rows] = metadata.get("stock") or 0
+    
+    def _product_vectors(self, product: Dict[str, Any]) -> List[np.ndarray]:
+        """A product's image vectors of the index's dimension"""
+        vectors = product.get("feature_vectors")
+        if vectors is None:
+            vectors = [product["feature_vector"]] if product.get("feature_vector") is not None else []
+        return [vector for vector in vectors if len(vector) == self.feature_size]
+    
+    def _product_histograms(self, product: Dict[str, Any]) -> List[Optional[np.ndarray]]:
+        """A product's colour histograms, aligned with _product_vectors (None where unknown)"""
+        vectors = product.get("feature_vectors")
+        if vectors is None:
+            vectors = [product["feature_vector"]] if product.get("feature_vector") is not None else []
+        histograms = product.get("color_histograms") or []
+        return [
+            histograms[i] if i < len(histograms) else None
+            for i, vector in enumerate(vectors) if len(vector) == self.feature_size
+        ]
+    
+    def filter_mask(
+        self,
+        categories: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: bool = False
+    ) -> np.ndarray:
+        """
+        Boolean mask over the live rows matching all the given filters
+        
+        Inactive products never match. Each filter is one vectorised pass over
+        a compact column, so building the mask is cheap next to scoring.
+        """
+        return column_mask(
+            {name: column[:self.size] for name, column in self.columns.items()},
+            self._category_filter(categories), min_price, max_price, in_stock
+        )
+    
+    def _category_filter(self, categories: Optional[Iterable[str]]) -> Optional[List[int]]:
+        """Dictionary codes of the given category IDs (None means no category filter)"""
+        if not categories:
+            return None
+        return [self.category_codes[c] for c in categories if c in self.category_codes]
+    
+    def _top_k(
+        self,
+        scores: np.ndarray,
+        top_k: int,
+        mask: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Select indices of the top_k highest scores, best first
+        
+        Uses argpartition so only the selected candidates are sorted.
+        
+        Args:
+            scores: 1-D array of similarity scores
+            top_k: Number of indices to return
+            mask: Optional boolean array; False entries are never selected
+            
+        Returns:
+            Array of indices into scores
+        """
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+        if top_k <= 0 or len(candidates) == 0:
+            return candidates[:0]
+        
+        candidate_scores = scores[candidates]
+        if len(candidates) > top_k:
+            part = np.argpartition(-candidate_scores, top_k - 1)[:top_k]
+            candidates, candidate_scores = candidates[part], candidate_scores[part]
+        
+        return candidates[np.argsort(-candidate_scores, kind="stable")]
+    
+    def _format_result(self, product: Dict[str, Any], similarity: float) -> Dict[str, Any]:
+        """Build the search result entry for a product"""
+        similarity = float(similarity)
+        return {
+            "id": product["id"],
+            "name": product["name"],
+            "slug": product["slug"],
+            "price": product["price"],
+            "images": product["images"],
+            "category": product.get("category", {}),
+            "similarity": similarity,
+            "match_percentage": int(similarity * 100)
+        }
+    
+    def format_results(self, ranked: Iterable[Tuple[str, float]], exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Result entries for (product ID, score) pairs, skipping products no longer active
+        
+        Duplicates are collapsed, and `exclude` drops a product together with its duplicates.
+        """
+        available = [
+            (product_id, score) for product_id, score in ranked
+            if product_id in self.products and self.products[product_id].get("isActive", True)
+        ]
+        return self._results(self._distinct(lambda k: available[:k], len(available), exclude))
+    
+    def _results(self, ranked: List[Tuple[str, float]]) -> List[Dict[str, Any]]:
+        """Result entries for ranked products, listing each one's duplicates"""
+        groups = self.dedup.groups() if self.dedup is not None else {}
+        results = []
+        for product_id, score in ranked:
+            result = self._format_result(self.products[product_id], score)
+            if product_id in groups:
+                result["duplicates"] = [other for other in groups[product_id] if other != product_id]
+            results.append(result)
+        return results
+    
+    def _distinct(self, rank, top_k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Top_k products from `rank(k)`, one per duplicate group, leaving out `exclude` and its duplicates
+        
+        `rank(k)` returns the k best products (fewer if there are no more);
+        it's asked again for more until top_k are left after collapsing.
+        """
+        excluded = set()
+        if exclude is not None:
+            groups = self.dedup.groups() if self.dedup is not None else {}
+            excluded = set(groups.get(exclude, [exclude]))
+        
+        k = top_k + len(excluded)
+        while True:
+            ranked = rank(k)
+            kept = [(product_id, score) for product_id, score in ranked if product_id not in excluded]
+            if self.dedup is not None:
+                kept = self.dedup.collapse(kept)
+            if len(kept) >= top_k or len(ranked) < k:
+                return kept[:top_k]
+            k *= 2
+    
+    def _update_duplicates(self, product_ids: Iterable[str]):
+        """Re-link the given (indexed) products in the duplicate index"""
+        if self.dedup is None:
+            return
+        if self.dedup.center is None and not self.dedup.keys:
+            self.dedup.fit(self.matrix[:self.size])
+        vectors_of = lambda product_id: np.asarray(self.matrix[self.product_rows[product_id]])
+        
+        # Signatures for a chunk of products come from one matrix product
+        product_ids = list(product_ids)
+        for start in range(0, len(product_ids), 4096):
+            chunk = product_ids[start:start + 4096]
+            rows = [self.product_rows[product_id] for product_id in chunk]
+            signatures = self.dedup.signatures(self.matrix[np.concatenate(rows)])
+            offset = 0
+            for product_id, product_rows in zip(chunk, rows):
+                # Hashes only count when every image has one; otherwise the
+                # unhashed images could never be matched by hash
+                hashes = self.products[product_id].get("imageHashes") or []
+                hashes = [int(h, 16) for h in hashes] if all(hashes) else []
+                self.dedup.update(
+                    product_id, vectors_of(product_id), hashes, vectors_of,
+                    signatures[offset:offset + len(product_rows)]
+                )
+                offset += len(product_rows)
+    
+    def upsert_products(self, products: List[Dict[str, Any]]) -> int:
+        """
+        Add products to the index, replacing the vectors of ones already present
+        
+        Each product gets one row per image vector (`feature_vectors`, or the
+        single `feature_vector`). Rows whose vector is unchanged are not
+        rewritten, so a matrix restored from a memory-mapped snapshot keeps
+        sharing its pages until a vector changes (only that page is copied)
+        or a new row is added (the whole matrix is copied to grow it).
+        
+        Args:
+            products: List of products WITH feature_vector(s) key
+            
+        Returns:
+            Number of vectors written to the index
+        """
+        # Last entry wins if a product appears twice
+        entries = {}
+        for product in products:
+            product_vectors = self._product_vectors(product)
+            if product_vectors:
+                entries[product["id"]] = (product, product_vectors)
+        if not entries:
+            return 0
+        
+        vectors = self._normalize(np.stack([v for _, product_vectors in entries.values() for v in product_vectors]))
+        self._mark_changed(entries)
+        
+        # Products whose number of images changed are re-added from scratch
+        modified = self.remove_products([
+            product_id for product_id, (_, product_vectors) in entries.items()
+            if product_id in self.product_rows and len(self.product_rows[product_id]) != len(product_vectors)
+        ]) > 0
+        self._reserve(self.size + sum(
+            len(product_vectors) for product_id, (_, product_vectors) in entries.items()
+            if product_id not in self.product_rows
+        ))
+        
+        rows = np.empty(len(vectors), dtype=np.int64)
+        existing = np.zeros(len(vectors), dtype=bool)
+        new_metadata = set()
+        offset = 0
+        for product_id, (product, product_vectors) in entries.items():
+            count = len(product_vectors)
+            product_rows = self.product_rows.get(product_id)
+            if product_rows is None:
+                product_rows = list(range(self.size, self.size + count))
+                self.product_rows[product_id] = product_rows
+                self.product_ids.extend([product_id] * count)
+            else:
+                existing[offset:offset + count] = True
+            rows[offset:offset + count] = product_rows
+            offset += count
+            
+            metadata = self._product_metadata(product)
+            if self.products.get(product_id) != metadata:
+                modified = True
+                new_metadata.add(product_id)
+            self._set_columns(product_rows, metadata)
+            self.products[product_id] = metadata
+        
+        changed = np.ones(len(vectors), dtype=bool)
+        if existing.any():
+            diff = np.abs(self.matrix[rows[existing]] - vectors[existing]).max(axis=1)
+            changed[existing] = diff > 1e-6
+        
+        rows_changed = self._set_histograms(entries, rows)
+        if changed.any():
+            rows_changed = True
+            self.matrix[rows[changed]] = vectors[changed]
+            if self.quantized:
+                self.codes[rows[changed]] = self.quantizer.encode(vectors[changed])
+            self.ann_index.add(rows[changed], vectors[changed])
+            # An index that grows through upserts alone (the change feed) trains here
+            self._train_if_needed()
+        if rows_changed:
+            modified = True
+            self.rows_version += 1
+        if self.dedup is not None:
+            self._update_duplicates(new_metadata | {self.product_ids[row] for row in rows[changed]})
+        if modified:
+            self.version += 1
+        return int(changed.sum())
+    
+    def _set_histograms(self, entries: Dict[str, Tuple[Dict[str, Any], List[np.ndarray]]], rows: np.ndarray) -> bool:
+        """Write the colour histograms of upserted products (rows in entry order); True if any changed"""
+        histograms = [h for product, _ in entries.values() for h in self._product_histograms(product)]
+        known = [h for h in histograms if h is not None]
+        if self.histograms is None:
+            if not known:
+                return False
+            self.histograms = np.zeros((self.matrix.shape[0], len(known[0])), dtype=np.float32)
+        
+        width = self.histograms.shape[1]
+        values = np.zeros((len(rows), width), dtype=np.float32)
+        for i, histogram in enumerate(histograms):
+            if histogram is not None and len(histogram) == width:
+                values[i] = histogram
+        
+        changed = np.any(self.histograms[rows] != values, axis=1)
+        if changed.any():
+            self.histograms[rows[changed]] = values[changed]
+        return bool(changed.any())
+    
+    def load_index(
+        self,
+        matrix: np.ndarray,
+        product_ids: List[str],
+        products: Dict[str, Dict[str, Any]],
+        histograms: Optional[np.ndarray] = None
+    ):
+        """
+        Replace the index contents wholesale (e.g. from an embedding store snapshot)
+        
+        Args:
+            matrix: L2-normalised vectors, row i belongs to product_ids[i]; may be a memmap
+            product_ids: Product ID per row (repeated for products with several images)
+            products: Result metadata per product ID
+            histograms: Optional colour histogram per row (zeros where unknown)
+        """
+        if self.shards is not None or (self._rows_on_disk and not isinstance(matrix, np.memmap)):
+            # Copy the rows into shared memory so the shard workers can read
+            # them, or out of RAM when quantized (a memmapped snapshot stays as is)
+            copied = self._allocate("matrix", matrix.shape, np.float32)
+            copied[:] = matrix
+            matrix = copied
+        self.matrix = matrix
+        self.product_ids = list(product_ids)
+        self.product_rows = {}
+        for row, product_id in enumerate(self.product_ids):
+            self.product_rows.setdefault(product_id, []).append(row)
+        self.products = dict(products)
+        self.columns = {name: self._allocate(name, self.size, column.dtype) for name, column in self.columns.items()}
+        for row, product_id in enumerate(self.product_ids):
+            self._set_columns(row, self.products[product_id])
+        
+        self.codes = None
+        self.histograms = histograms
+        self.version += 1
+        self.rows_version += 1
+        self.changed_products = None
+        
+        if self.ann_index.is_trained:
+            self.ann_index.add(np.arange(self.size), self.matrix[:self.size])
+        self._train_if_needed()
+        
+        if self.dedup is not None:
+            self.dedup.clear()
+            self._update_duplicates(self.product_rows)
+        
+        logger.info("📚 Index loaded: %d products (%d vectors)", self.product_count, self.size)
+    
+    def remove_products(self, product_ids: Iterable[str]) -> int:
+        """
+        Remove products (all their rows) from the index
+        
+        The last live row is moved into each freed slot so the matrix stays contiguous.
+        
+        Args:
+            product_ids: IDs of products to remove
+            
+        Returns:
+            Number of products removed
+        """
+        removed = 0
+        for product_id in product_ids:
+            rows = self.product_rows.pop(product_id, None)
+            if rows is None:
+                continue
+            
+            # Highest rows first, so the last live row never belongs to this product
+            for row in sorted(rows, reverse=True):
+                last_row = self.size - 1
+                if row != last_row:
+                    moved_id = self.product_ids[last_row]
+                    self.matrix[row] = self.matrix[last_row]
+                    if self.codes is not None:
+                        self.codes[row] = self.codes[last_row]
+                    if self.histograms is not None:
+                        self.histograms[row] = self.histograms[last_row]
+                    for column in self.columns.values():
+                        column[row] = column[last_row]
+                    self.product_ids[row] = moved_id
+                    moved_rows = self.product_rows[moved_id]
+                    moved_rows[moved_rows.index(last_row)] = row
+                    self.ann_index.move(last_row, row)
+                self.product_ids.pop()
+            
+            self.products.pop(product_id, None)
+            if self.dedup is not None:
+                self.dedup.remove(product_id)
+            self._mark_changed([product_id])
+            removed += 1
+        
+        if removed:
+            self.version += 1
+            self.rows_version += 1
+        return removed
+    
+    def sync_products(self, products: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Bring the index in line with a full catalog listing
+        
+        Products in the listing are upserted; indexed products missing from it are removed.
+        
+        Args:
+            products: Full list of products WITH feature_vector key
+            
+        Returns:
+            Counts of upserted and removed products
+        """
+        upserted = self.upsert_products(products)
+        current_ids = {p["id"] for p in products}
+        removed = self.remove_products(
+            [product_id for product_id in list(self.product_rows) if product_id not in current_ids]
+        )
+        
+        self._train_if_needed()
+        
+        logger.info(
+            "📚 Index synced: %d products, %d vectors (%d upserted, %d removed)",
+            self.product_count, self.size, upserted, removed
+        )
+        return {"upserted": upserted, "removed": removed}
+    
+    def search(
+        self,
+        query_features: np.ndarray,
+        top_k: int = 10,
+        category: Optional[str] = None,
+        categories: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: bool = False,
+        exclude: Optional[str] = None,
+        query_histogram: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Find most similar products in the resident index
+        
+        Near-duplicate products are collapsed to the best-ranked one. With a
+        query colour histogram, the embedding candidates are re-ranked by colour.
+        
+        Args:
+            query_features: Feature vector from query image (1280-dim)
+            top_k: Number of results to return
+            category: Only return products from this category ID
+            categories: Only return products from any of these category IDs
+            min_price: Only return products priced at least this
+            max_price: Only return products priced at most this
+            in_stock: Only return products with stock left
+            exclude: Product to leave out (with its duplicates)
+            query_histogram: Colour histogram of the query image (ImageProcessor.color_histogram)
+            
+        Returns:
+            List of products sorted by similarity (highest first)
+        """
+        if self.size == 0:
+            return []
+        
+        query = self._normalize(query_features.reshape(-1))
+        
+        categories = set(categories or ()) | ({category} if category else set())
+        rank = self._color_stage(
+            lambda k: self._rank(query, k, categories, min_price, max_price, in_stock), query_histogram
+        )
+        return self._results(self._distinct(rank, top_k, exclude))
+    
+    def _color_stage(self, rank, query_histogram: Optional[np.ndarray]):
+        """
+        Wrap an embedding ranking `rank(k)` in the colour re-rank stage
+        
+        The re-ranked top k comes from the best max(k, color_candidates)
+        products by embedding, so the stage costs one small matrix-vector
+        product over those candidates' rows, whatever the catalog size.
+        """
+        if query_histogram is None or self.color_weight <= 0 or self.histograms is None:
+            return rank
+        query_histogram = np.asarray(query_histogram, dtype=np.float32)
+        if len(query_histogram) != self.histograms.shape[1]:
+            return rank
+        
+        def reranked(k: int) -> List[Tuple[str, float]]:
+            candidates = rank(max(k, self.color_candidates))
+            if not candidates:
+                return candidates
+            
+            product_ids = [product_id for product_id, _ in candidates]
+            product_rows = [self.product_rows[product_id] for product_id in product_ids]
+            lengths = np.array([len(rows) for rows in product_rows], dtype=np.int64)
+            all_rows = np.fromiter(chain.from_iterable(product_rows), dtype=np.int64, count=int(lengths.sum()))
+            
+            # A product's colour score is its best image's; products without
+            # histograms keep their embedding score
+            histograms = self.histograms[all_rows]
+            row_scores = np.where(histograms.any(axis=1), histograms @ query_histogram, -np.inf)
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            embedding = np.array([score for _, score in candidates], dtype=np.float32)
+            color = np.maximum.reduceat(row_scores, starts)
+            color = np.where(np.isfinite(color), color, embedding)
+            
+            fused = (1 - self.color_weight) * embedding + self.color_weight * color
+            order = np.argsort(-fused, kind="stable")[:k]
+            return [(product_ids[i], float(fused[i])) for i in order]
+        
+        return reranked
+    
+    def _rank(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        categories: Optional[Iterable[str]],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        in_stock: bool
+    ) -> List[Tuple[str, float]]:
+        """Top_k (product ID, score) pairs for a normalised query, before duplicates are collapsed"""
+        if self.shards is not None:
+            try:
+                return self._search_sharded(
+                    query, top_k, (self._category_filter(categories), min_price, max_price, in_stock)
+                )
+            except ShardUnavailableError as e:
+                # The arrays are shared memory, so the exact path can read them here
+                logger.warning("⚠️  %s - searching in-process", e)
+        
+        mask = self.filter_mask(categories, min_price, max_price, in_stock)
+        matching = int(mask.sum())
+        if matching == 0:
+            return []
+        
+        if matching <= self.prefilter_ratio * self.size:
+            # Selective filter: score only the matching rows
+            rows = np.flatnonzero(mask)
+            scores = self._score(rows, query)
+        else:
+            # ANN backends narrow the rows to score; exact scores the whole
+            # catalog with one matrix-vector product
+            rows = self.ann_index.candidates(query, self.size)
+            scores = self._score(rows, query)
+            if rows is None:
+                rows = np.arange(self.size)
+        
+        rerank = self.quantized and self.rerank_factor > 0
+        
+        # Approximate scores only shortlist when re-ranking; the threshold is
+        # applied to the exact scores afterwards
+        candidates = mask[rows]
+        if not rerank:
+            candidates &= scores >= self.similarity_threshold
+        
+        return self._rank_products(query, rows, scores, candidates, top_k)
+    
+    def _search_sharded(self, query: np.ndarray, top_k: int, filters: Tuple) -> List[Tuple[str, float]]:
+        """
+        Scatter the query to the shard workers and rank their merged shortlists
+        
+        A product outside the shortlists scores at most the highest last score
+        of a truncated shard, so the shortlists grow until that bound can't
+        change the top_k.
+        """
+        shortlist_size = top_k * max(self.rerank_factor, 2) * 4
+        while True:
+            rows, scores, bound = self.shards.search(
+                query, self.size, shortlist_size, filters, self.similarity_threshold, self.prefilter_ratio
+            )
+            ranked = self._rank_products(query, rows, scores, np.ones(len(rows), dtype=bool), top_k)
+            if bound < self.similarity_threshold or (len(ranked) == top_k and ranked[-1][1] >= bound):
+                return ranked
+            shortlist_size *= 4
+    
+    def product_vector(self, product_id: str) -> Optional[np.ndarray]:
+        """A product's primary (first image) vector, or None if it isn't indexed"""
+        rows = self.product_rows.get(product_id)
+        return None if rows is None else np.array(self.matrix[rows[0]])
+    
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        top_k: int = 10,
+        categories: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: bool = False,
+        exclude: Optional[List[Optional[str]]] = None,
+        query_histograms: Optional[List[Optional[np.ndarray]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Find the most similar products for many queries at once
+        
+        Queries are scored against the catalog with blocked matrix-matrix
+        products (query_tile x row_tile scores at a time), keeping a running
+        shortlist of the best rows per query. Each shortlist is then ranked
+        like a single search. The scan is always exhaustive (ANN backends are
+        not used), and a query whose shortlist can't prove its top_k falls
+        back to `search`.
+        
+        Args:
+            queries: One feature vector per row
+            top_k: Number of results per query
+            categories, min_price, max_price, in_stock: Filters, as in `search`
+            exclude: Optional product ID per query to leave out of its results
+                (e.g. the product a "similar items" query was made from)
+            query_histograms: Optional colour histogram per query, as in `search`
+            
+        Returns:
+            One result list per query, in query order
+        """
+        queries = self._normalize(np.atleast_2d(queries))
+        exclude = exclude or [None] * len(queries)
+        query_histograms = query_histograms or [None] * len(queries)
+        if self.size == 0 or len(queries) == 0:
+            return [[] for _ in queries]
+        
+        mask = self.filter_mask(categories, min_price, max_price, in_stock)
+        matching = int(mask.sum())
+        if matching == 0:
+            return [[] for _ in queries]
+        
+        # Selective filters shrink the scan to the matching rows
+        rows = np.flatnonzero(mask) if matching <= self.prefilter_ratio * self.size else None
+        rerank = self.quantized and self.rerank_factor > 0
+        
+        results = []
+        for start in range(0, len(queries), self.query_tile):
+            block = queries[start:start + self.query_tile]
+            block_exclude = exclude[start:start + self.query_tile]
+            block_histograms = query_histograms[start:start + self.query_tile]
+            k = top_k + any(product_id is not None for product_id in block_exclude)
+            if self.color_weight > 0 and any(histogram is not None for histogram in block_histograms):
+                k = max(k, self.color_candidates)  # the colour stage re-ranks this many
+            shortlist_size = k * max(self.rerank_factor, 2) * 4
+            best_rows, best_scores, remaining = self._scan_tiles(block, rows, mask, shortlist_size, rerank)
+            
+            for i, query in enumerate(block):
+                found = best_scores[i] > -np.inf
+                # Products outside the shortlist score at most its last entry
+                bound = best_scores[i][found].min() if found.any() else -np.inf
+                
+                def rank(k):
+                    ranked = self._rank_products(
+                        query, best_rows[i][found], best_scores[i][found], np.ones(int(found.sum()), dtype=bool), k
+                    )
+                    if remaining[i] > found.sum() and bound >= self.similarity_threshold and (
+                        len(ranked) < k or ranked[-1][1] < bound
+                    ):
+                        return self._rank(query, k, categories, min_price, max_price, in_stock)
+                    return ranked
+                
+                results.append(self._results(
+                    self._distinct(self._color_stage(rank, block_histograms[i]), top_k, block_exclude[i])
+                ))
+        
+        return results
+    
+    def _scan_tiles(
+        self,
+        queries: np.ndarray,
+        rows: Optional[np.ndarray],
+        mask: np.ndarray,
+        shortlist_size: int,
+        rerank: bool
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Best shortlist_size candidate rows per query, scanning row_tile rows at a time
+        
+        Returns:
+            (row indices, scores) of shape (queries, shortlist_size) - unused
+            slots score -inf - and the number of candidate rows per query
+        """
+        total = self.size if rows is None else len(rows)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        remaining = np.zeros(len(queries), dtype=np.int64)
+        
+        for start in range(0, total, self.row_tile):
+            tile_rows = (
+                np.arange(start, min(start + self.row_tile, total)) if rows is None
+                else rows[start:start + self.row_tile]
+            )
+            if self.quantized:
+                scores = self.quantizer.score(self.codes[tile_rows], queries).T
+            else:
+                scores = queries @ self.matrix[tile_rows].T
+            
+            # Approximate scores only shortlist when re-ranking; the threshold
+            # is applied to the exact scores afterwards
+            candidates = np.broadcast_to(mask[tile_rows], scores.shape)
+            if not rerank:
+                candidates = candidates & (scores >= self.similarity_threshold)
+            remaining += candidates.sum(axis=1)
+            scores = np.where(candidates, scores, -np.inf).astype(np.float32)
+            
+            best_scores = np.hstack([best_scores, scores])
+            best_rows = np.hstack([best_rows, np.broadcast_to(tile_rows, scores.shape)])
+            if best_scores.shape[1] > shortlist_size:
+                keep = np.argpartition(-best_scores, shortlist_size - 1, axis=1)[:, :shortlist_size]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        
+        return best_rows, best_scores, remaining
+    
+    def _aggregate(self, row_scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Reduce per-row scores to per-product scores
+        
+        Rows arrive grouped by product (`lengths[i]` rows for product i), so
+        both aggregations are segment reductions over one score vector.
+        """
+        if len(lengths) == 0:
+            return np.zeros(0, dtype=np.float32)
+        
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        if self.aggregation == "max":
+            return np.maximum.reduceat(row_scores, starts)
+        
+        # Mean of each product's best top_m rows: sort within segments, keep ranks < top_m
+        owner = np.repeat(np.arange(len(lengths)), lengths)
+        order = np.lexsort((-row_scores, owner))
+        rank = np.arange(len(order)) - starts[owner]
+        keep = rank < self.top_m
+        sums = np.bincount(owner[keep], weights=row_scores[order][keep], minlength=len(lengths))
+        return (sums / np.minimum(lengths, self.top_m)).astype(np.float32)
+    
+    def _rank_products(
+        self,
+        query: np.ndarray,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        candidates: np.ndarray,
+        top_k: int
+    ) -> List[Tuple[str, float]]:
+        """
+        Turn row scores into the top_k products
+        
+        The best candidate rows are shortlisted, every row of the shortlisted
+        products is re-scored and aggregated per product. A product outside
+        the shortlist has no row above the shortlist's lowest score, so its
+        aggregate can't beat that either; the shortlist grows until that
+        bound rules out every product that isn't already in it.
+        """
+        exact = not self.quantized or self.rerank_factor > 0
+        remaining = int(candidates.sum())
+        shortlist_size = top_k * max(self.rerank_factor, 2)
+        
+        while True:
+            shortlist = self._top_k(scores, shortlist_size, candidates)
+            product_ids = list(dict.fromkeys(self.product_ids[row] for row in rows[shortlist]))
+            product_rows = [self.product_rows[product_id] for product_id in product_ids]
+            lengths = np.array([len(r) for r in product_rows], dtype=np.int64)
+            all_rows = np.fromiter(chain.from_iterable(product_rows), dtype=np.int64, count=int(lengths.sum()))
+            
+            row_scores = self.matrix[all_rows] @ query if exact else self._score(all_rows, query)
+            product_scores = self._aggregate(row_scores, lengths)
+            top = self._top_k(product_scores, top_k, product_scores >= self.similarity_threshold)
+            
+            bound = scores[shortlist[-1]] if len(shortlist) else -np.inf
+            if (
+                len(shortlist) >= remaining
+                or bound < self.similarity_threshold
+                or (len(top) == top_k and product_scores[top[-1]] >= bound)
+            ):
+                return [(product_ids[i], product_scores[i]) for i in top]
+            shortlist_size *= 4
     
     def find_similar(
         self,
@@ -27,72 +1012,45 @@ class SimilaritySearch:
         """
         try:
             if not products:
-                print("⚠️  No products available for comparison")
+                logger.warning("⚠️  No products available for comparison")
                 return []
             
-            # Filter products that have features
+            # Filter products that have features of the query's dimension
+            query_size = query_features.size
             products_with_features = [
                 p for p in products 
                 if "feature_vector" in p and p["feature_vector"] is not None
+                and np.size(p["feature_vector"]) == query_size
             ]
             
             if not products_with_features:
-                print("⚠️  No products have feature vectors")
+                logger.warning("⚠️  No products have feature vectors")
                 return []
             
-            print(f"🔍 Comparing with {len(products_with_features)} products...")
-            
-            # Reshape query features for sklearn
-            query_features_2d = query_features.reshape(1, -1)
-            
-            # Calculate similarities for all products
-            results = []
-            for product in products_with_features:
-                try:
-                    # Get product features
-                    product_features = product["feature_vector"]
-                    
-                    # Ensure it's a numpy array
-                    if not isinstance(product_features, np.ndarray):
-                        product_features = np.array(product_features, dtype=np.float32)
-                    
-                    # Reshape for sklearn
-                    product_features_2d = product_features.reshape(1, -1)
-                    
-                    # Calculate cosine similarity
-                    similarity = cosine_similarity(query_features_2d, product_features_2d)[0][0]
-                    
-                    # Only include if above threshold
-                    if similarity >= self.similarity_threshold:
-                        results.append({
-                            "id": product["id"],
-                            "name": product["name"],
-                            "slug": product["slug"],
-                            "price": product["price"],
-                            "images": product["images"],
-                            "category": product.get("category", {}),
-                            "similarity": float(similarity),
-                            "match_percentage": int(similarity * 100)
-                        })
-                    
-                except Exception as e:
-                    print(f"⚠️  Error comparing product {product.get('name', 'unknown')}: {str(e)}")
-                    continue
-            
-            # Sort by similarity (highest first)
-            results.sort(key=lambda x: x["similarity"], reverse=True)
-            
-            # Return top K results
-            top_results = results[:top_k]
-            
-            print(f"✨ Found {len(top_results)} similar products")
+            logger.debug("🔍 Comparing with %d products...", len(products_with_features))
+            
+            # Stack candidates once and score them all in one normalised matmul
+            similarities = self.calculate_similarity_batch(
+                query_features,
+                [p["feature_vector"] for p in products_with_features]
+            )
+            
+            rows = self._top_k(similarities, top_k, similarities >= self.similarity_threshold)
+            top_results = [
+                self._format_result(products_with_features[row], similarities[row])
+                for row in rows
+            ]
+            
             if top_results:
-                print(f"   Best match: {top_results[0]['name']} ({top_results[0]['match_percentage']}%)")
+                logger.debug(
+                    "✨ Found %d similar products, best match: %s (%d%%)",
+                    len(top_results), top_results[0]["name"], top_results[0]["match_percentage"]
+                )
             
             return top_results
             
         except Exception as e:
-            print(f"❌ Similarity search failed: {str(e)}")
+            logger.error("❌ Similarity search failed: %s", e)
             raise
     
     def calculate_similarity(
@@ -110,6 +1068,9 @@ class SimilaritySearch:
         Returns:
             Similarity score (0-1)
         """
+        # Imported here: sklearn is slow to import and only needed by this helper
+        from sklearn.metrics.pairwise import cosine_similarity
+        
         try:
             # Reshape to 2D for sklearn
             f1 = features1.reshape(1, -1)
@@ -121,7 +1082,7 @@ class SimilaritySearch:
             return float(similarity)
             
         except Exception as e:
-            print(f"❌ Similarity calculation failed: {str(e)}")
+            logger.error("❌ Similarity calculation failed: %s", e)
             raise
     
     def calculate_similarity_batch(
@@ -140,17 +1101,14 @@ class SimilaritySearch:
             Array of similarity scores
         """
         try:
-            # Reshape query
-            query_2d = query_features.reshape(1, -1)
-            
-            # Stack all product features
-            products_2d = np.vstack([f.reshape(1, -1) for f in product_features_list])
+            # Normalise query and stacked products, then score with a single matmul
+            query = self._normalize(np.asarray(query_features).reshape(-1))
+            products_2d = self._normalize(np.vstack([np.asarray(f).reshape(1, -1) for f in product_features_list]))
             
-            # Calculate all similarities at once
-            similarities = cosine_similarity(query_2d, products_2d)[0]
+            similarities = products_2d @ query
             
             return similarities
             
         except Exception as e:
-            print(f"❌ Batch similarity calculation failed: {str(e)}")
+            logger.error("❌ Batch similarity calculation failed: %s", e)
             raise
\ No newline at end of file
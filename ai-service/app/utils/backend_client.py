@@ -1,13 +1,117 @@
+import logging
 import aiohttp
+import asyncio
 import os
 from typing import List, Dict, Any, Optional
+from urllib.parse import urlsplit
 import numpy as np
 
+from app.utils.vector_codec import decode_vector_base64
+
+logger = logging.getLogger(__name__)
+
 class BackendClient:
     """Client to communicate with main backend API"""
     
     def __init__(self):
         self.base_url = os.getenv("BACKEND_API_URL", "http://localhost:3000/api")
+        
+        # One pooled session per process; see start()/close()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.timeout = aiohttp.ClientTimeout(
+            total=float(os.getenv("BACKEND_TIMEOUT", 30)),
+            connect=float(os.getenv("BACKEND_CONNECT_TIMEOUT", 5))
+        )
+        self.max_connections = int(os.getenv("BACKEND_MAX_CONNECTIONS", 100))
+        self.max_connections_per_host = int(os.getenv("BACKEND_MAX_CONNECTIONS_PER_HOST", 20))
+        
+        # Catalog pagination
+        self.page_size = int(os.getenv("BACKEND_PAGE_SIZE", 1000))
+        self.fetch_concurrency = int(os.getenv("BACKEND_FETCH_CONCURRENCY", 4))
+        
+        # Hosts image URLs may be downloaded from (default: the backend's own host)
+        self.image_hosts = {
+            host.strip().lower()
+            for host in os.getenv("IMAGE_URL_HOSTS", urlsplit(self.base_url).hostname or "").split(",")
+            if host.strip()
+        }
+    
+    async def start(self):
+        """Create the shared session (keep-alive connections, cached DNS)"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+    
+    async def close(self):
+        """Close the shared session"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+    
+    def _parse_products(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Attach numpy vectors to each product that has features
+        
+        `feature_vectors` holds one vector per embedded image (in the backend's
+        order); `feature_vector` is the first one, for single-vector callers.
+        `image_hashes` holds the images' perceptual hashes (hex) and
+        `color_histograms` their colour histograms, both aligned with the
+        vectors (None where unknown).
+        """
+        processed_products = []
+        for product in products:
+            vectors = []
+            hashes = []
+            histograms = []
+            for feature_data in product.get("aiFeatures") or []:
+                # Binary payload if the backend supports it, JSON list otherwise
+                if feature_data.get("featuresB64"):
+                    vector = decode_vector_base64(
+                        feature_data["featuresB64"],
+                        feature_data.get("dtype", "float32")
+                    )
+                else:
+                    features = feature_data.get("features", [])
+                    
+                    # Convert to numpy array
+                    if not isinstance(features, list) or len(features) == 0:
+                        continue
+                    vector = np.array(features, dtype=np.float32)
+                
+                vectors.append(vector)
+                histogram = feature_data.get("colorHistogram")
+                histograms.append(np.array(histogram, dtype=np.float32) if histogram else None)
+                hashes.append(feature_data.get("phash") or None)
+            
+            if vectors:
+                product["feature_vectors"] = vectors
+                product["feature_vector"] = vectors[0]
+                product["image_hashes"] = hashes
+                product["color_histograms"] = histograms
+                processed_products.append(product)
+        
+        return processed_products
+    
+    async def _fetch_features_page(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Fetch one page of /product-features/all"""
+        session = await self._get_session()
+        url = f"{self.base_url}/product-features/all"
+        headers = {"Accept": "application/json; encoding=base64"}
+        
+        async with session.get(url, params=params, headers=headers) as response:
+            if response.status != 200:
+                raise ValueError(f"Backend returned status {response.status}")
+            return await response.json()
     
     async def get_products_with_features(
         self,
@@ -17,6 +121,12 @@ class BackendClient:
         """
         Fetch products that have AI features extracted
         
+        Vectors are requested as base64 little-endian floats, which is ~5x
+        smaller than JSON float lists and parses with np.frombuffer. Pages are
+        keyed on product ID (`afterId`), so products added or removed during
+        the fetch can't shift a page and make others be skipped. The ID space
+        is split into fetch_concurrency ranges that are paged in parallel.
+        
         Args:
             category: Filter by category ID
             limit: Maximum number of products
@@ -25,41 +135,82 @@ class BackendClient:
             List of products with their feature vectors
         """
         try:
-            url = f"{self.base_url}/product-features/all"
-            
-            params = {"limit": limit}
+            params = {}
             if category:
                 params["category"] = category
+            page_size = min(self.page_size, limit)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        products = data.get("products", [])
-                        
-                        # Process products to extract features as numpy arrays
-                        processed_products = []
-                        for product in products:
-                            if product.get("aiFeatures") and len(product["aiFeatures"]) > 0:
-                                # Get the first feature set (usually from first image)
-                                feature_data = product["aiFeatures"][0]
-                                features = feature_data.get("features", [])
-                                
-                                # Convert to numpy array
-                                if isinstance(features, list) and len(features) > 0:
-                                    product["feature_vector"] = np.array(features, dtype=np.float32)
-                                    processed_products.append(product)
-                        
-                        print(f"✅ Fetched {len(processed_products)} products with features")
-                        return processed_products
-                    else:
-                        print(f"⚠️  Backend returned status {response.status}")
-                        return []
+            # Product IDs are random UUIDs, so hex prefixes split them evenly
+            bounds = [""] + [f"{i * 256 // self.fetch_concurrency:02x}" for i in range(1, self.fetch_concurrency)] + [""]
+            
+            async def fetch_range(after_id: str, before_id: str) -> List[Dict[str, Any]]:
+                products = []
+                while len(products) < limit:
+                    page = await self._fetch_features_page({
+                        **params, "afterId": after_id, "beforeId": before_id, "limit": page_size
+                    })
+                    products.extend(page.get("products", []))
+                    after_id = page.get("nextAfterId")
+                    if not after_id:
+                        break
+                return products
+            
+            ranges = await asyncio.gather(*(fetch_range(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)))
+            products = [product for products in ranges for product in products]
+            if len(products) > limit:
+                logger.warning("⚠️  Catalog has more than %d products with features, keeping the first %d", limit, limit)
+                products = products[:limit]
+            
+            processed_products = self._parse_products(products)
+            logger.info("✅ Fetched %d products with features", len(processed_products))
+            return processed_products
                         
         except Exception as e:
-            print(f"❌ Failed to fetch products with features: {str(e)}")
+            logger.error("❌ Failed to fetch products with features: %s", e)
             return []
     
+    async def get_feature_changes(
+        self,
+        since: Optional[str] = None,
+        limit: int = 1000
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch catalog changes since a cursor from the backend's change feed
+        
+        Args:
+            since: Cursor from a previous call (None just returns a fresh cursor)
+            limit: Maximum number of changed products
+            
+        Returns:
+            Dict with "products" (upserts, with feature vectors), "removed"
+            (product IDs), "cursor" and "has_more", or None if the call failed
+        """
+        try:
+            session = await self._get_session()
+            url = f"{self.base_url}/product-features/changes"
+            
+            params = {"limit": limit}
+            if since:
+                params["since"] = since
+            headers = {"Accept": "application/json; encoding=base64"}
+            
+            async with session.get(url, params=params, headers=headers) as response:
+                if response.status != 200:
+                    logger.warning("⚠️  Backend returned status %d", response.status)
+                    return None
+                data = await response.json()
+            
+            return {
+                "products": self._parse_products(data.get("products", [])),
+                "removed": data.get("removed", []),
+                "cursor": data.get("cursor"),
+                "has_more": bool(data.get("hasMore")),
+            }
+            
+        except Exception as e:
+            logger.error("❌ Failed to fetch feature changes: %s", e)
+            return None
+    
     async def get_all_products(
         self,
         category: Optional[str] = None,
@@ -82,17 +233,17 @@ class BackendClient:
             if category:
                 params["category"] = category
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get("products", [])
-                    else:
-                        print(f"⚠️  Backend returned status {response.status}")
-                        return []
+            session = await self._get_session()
+            async with session.get(url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get("products", [])
+                else:
+                    logger.warning("⚠️  Backend returned status %d", response.status)
+                    return []
                         
         except Exception as e:
-            print(f"❌ Failed to fetch products from backend: {str(e)}")
+            logger.error("❌ Failed to fetch products from backend: %s", e)
             return []
     
     async def get_product_by_id(self, product_id: str) -> Optional[Dict[str, Any]]:
@@ -108,16 +259,16 @@ class BackendClient:
         try:
             url = f"{self.base_url}/products/{product_id}"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get("product")
-                    else:
-                        return None
+            session = await self._get_session()
+            async with session.get(url) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get("product")
+                else:
+                    return None
                         
         except Exception as e:
-            print(f"❌ Failed to fetch product: {str(e)}")
+            logger.error("❌ Failed to fetch product: %s", e)
             return None
     
     async def trigger_feature_extraction(self, product_id: str) -> bool:
@@ -133,15 +284,54 @@ class BackendClient:
         try:
             url = f"{self.base_url}/product-features/extract/{product_id}"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url) as response:
-                    if response.status == 200:
-                        print(f"✅ Feature extraction triggered for product {product_id}")
-                        return True
-                    else:
-                        print(f"⚠️  Feature extraction failed with status {response.status}")
-                        return False
+            session = await self._get_session()
+            async with session.post(url) as response:
+                if response.status == 200:
+                    logger.info("✅ Feature extraction triggered for product %s", product_id)
+                    return True
+                else:
+                    logger.warning("⚠️  Feature extraction failed with status %d", response.status)
+                    return False
                         
         except Exception as e:
-            print(f"❌ Failed to trigger feature extraction: {str(e)}")
-            return False
\ No newline at end of file
+            logger.error("❌ Failed to trigger feature extraction: %s", e)
+            return False
+    
+    async def download_images(self, urls: List[str], max_bytes: int) -> List[Any]:
+        """
+        Download product images concurrently
+        
+        Only http(s) URLs on IMAGE_URL_HOSTS are fetched, without following
+        redirects, and each body is streamed with a max_bytes cap.
+        
+        Args:
+            urls: Image URLs
+            max_bytes: Largest image accepted
+            
+        Returns:
+            Image bytes for each URL, in order; failed downloads are returned as the exception
+        """
+        session = await self._get_session()
+        
+        async def download(url: str) -> bytes:
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https") or (parts.hostname or "").lower() not in self.image_hosts:
+                raise ValueError("Image URL host is not allowed")
+            
+            async with session.get(url, allow_redirects=False) as response:
+                if response.status != 200:
+                    raise ValueError(f"Download failed with status {response.status}")
+                if (response.content_length or 0) > max_bytes:
+                    raise ValueError("Image too large")
+                
+                data = bytearray()
+                async for block in response.content.iter_chunked(64 * 1024):
+                    data += block
+                    if len(data) > max_bytes:
+                        raise ValueError("Image too large")
+                return bytes(data)
+        
+        return await asyncio.gather(
+            *(download(url) for url in urls),
+            return_exceptions=True
+        )
\ No newline at end of file
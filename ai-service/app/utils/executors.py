@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from concurrent.futures import BrokenExecutor, Executor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when a bounded stage already has as much work as it may queue"""
+
+
+class ShardUnavailableError(RuntimeError):
+    """Raised when a search worker process died or didn't answer in time"""
+
+
+class BoundedExecutor:
+    """
+    Run blocking work in an executor with a cap on queued + running jobs
+
+    Keeps CPU-bound work (PIL decoding, model inference) off the event loop,
+    and rejects new work instead of letting the backlog grow without bound.
+
+    A process pool is broken for good once one of its workers dies (e.g. OOM
+    killed by a decompression bomb). Given a `factory`, a broken executor is
+    replaced with a new one and the jobs it failed are retried once.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        max_pending: int,
+        name: str = "executor",
+        factory: Optional[Callable[[], Executor]] = None
+    ):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.name = name
+        self.factory = factory
+        self.pending = 0
+        self.restarts = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.max_pending
+
+    @property
+    def broken(self) -> bool:
+        # Process and thread pools both set _broken once they can't run jobs any more
+        return bool(getattr(self.executor, "_broken", False))
+
+    def restart_if_broken(self) -> bool:
+        """Replace the executor if it is broken; True if the executor can run jobs"""
+        if self.broken and self.factory is not None:
+            self._restart(self.executor)
+        return not self.broken
+
+    def _restart(self, broken: Executor) -> bool:
+        """
+        Replace a broken executor with a new one from the factory
+
+        Jobs that failed together share one replacement: only the first
+        caller holding the broken executor replaces it.
+        """
+        if self.factory is None:
+            return False
+        if self.executor is broken:
+            logger.warning("⚠️  %s pool is broken (a worker died) - starting a new one", self.name)
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.factory()
+            self.restarts += 1
+        return True
+
+    async def _submit(self, fn, *args):
+        """Run fn(*args), retrying once in a new executor if the current one broke"""
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenExecutor:
+            if not self._restart(executor):
+                raise
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenExecutor:
+            # This job probably killed the worker twice; fail it, but leave a working pool
+            self._restart(executor)
+            raise
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) in the executor
+
+        Raises:
+            ExecutorSaturatedError: if max_pending jobs are already queued or running
+        """
+        if self.saturated:
+            raise ExecutorSaturatedError(f"{self.name} is saturated ({self.pending} jobs pending)")
+
+        self.pending += 1
+        try:
+            return await self._submit(fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def map(self, fn, items):
+        """
+        Run fn over items for bulk jobs
+
+        Bulk work is never rejected, but it counts towards pending so
+        interactive requests are shed while a large batch is in progress.
+
+        Returns:
+            Results in input order; failed items are returned as their exception
+        """
+        self.pending += len(items)
+        try:
+            return await asyncio.gather(*[self._submit(fn, item) for item in items], return_exceptions=True)
+        finally:
+            self.pending -= len(items)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,34 +1,77 @@
+import logging
 from PIL import Image
 import numpy as np
+import io
 from pathlib import Path
+from typing import BinaryIO, Union
+
+logger = logging.getLogger(__name__)
+
+# An image on disk, its raw encoded bytes, or an open binary file object
+ImageSource = Union[str, Path, bytes, bytearray, memoryview, BinaryIO]
+
+# Colour histogram bins: hue x saturation x value
+COLOR_BINS = (8, 3, 3)
+COLOR_HISTOGRAM_SIZE = COLOR_BINS[0] * COLOR_BINS[1] * COLOR_BINS[2]
 
 class ImageProcessor:
     """Process images for AI model"""
     
-    def __init__(self):
+    def __init__(self, fast_mode: bool = False, max_pixels: int = 50_000_000):
         self.target_size = (224, 224)
         self.allowed_formats = ['JPEG', 'PNG', 'JPG', 'WEBP']
+        
+        # Fast mode: JPEG DCT-domain downscaling + cheaper resample filter
+        self.fast_mode = fast_mode
+        # Refuse to decode anything bigger (decompression bombs, huge scans)
+        self.max_pixels = max_pixels
+    
+    def open_image(self, source: ImageSource) -> Image.Image:
+        """
+        Open an image from a path, raw bytes or a file-like object
+        
+        Bytes are decoded straight from memory, so uploads never touch disk.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return Image.open(io.BytesIO(source))
+        return Image.open(source)
     
-    def process_image(self, image_path: str) -> np.ndarray:
+    def process_image(self, source: ImageSource) -> np.ndarray:
         """
         Load and preprocess image for model
         
         Args:
-            image_path: Path to image file
+            source: Path to image file, encoded image bytes or binary file object
             
         Returns:
             numpy array of shape (224, 224, 3)
         """
         try:
-            # Open image
-            img = Image.open(image_path)
+            # Open image (header only - pixels are decoded lazily)
+            img = self.open_image(source)
+            
+            width, height = img.size
+            if width * height > self.max_pixels:
+                raise ValueError(
+                    f"Image too large: {width}x{height} exceeds {self.max_pixels} pixels"
+                )
+            
+            if self.fast_mode:
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, keeping at least
+                # 2x the target so the final resize still has detail to work with
+                # (no-op for non-JPEG formats)
+                img.draft('RGB', (self.target_size[0] * 2, self.target_size[1] * 2))
             
             # Convert to RGB (remove alpha channel if present)
             if img.mode != 'RGB':
                 img = img.convert('RGB')
             
             # Resize to target size
-            img = img.resize(self.target_size, Image.Resampling.LANCZOS)
+            if self.fast_mode:
+                # reducing_gap does a cheap integer box reduce before the bilinear pass
+                img = img.resize(self.target_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+            else:
+                img = img.resize(self.target_size, Image.Resampling.LANCZOS)
             
             # Convert to numpy array
             img_array = np.array(img, dtype=np.float32)
@@ -40,21 +83,89 @@ class ImageProcessor:
             return img_array
             
         except Exception as e:
-            print(f"❌ Image processing failed: {str(e)}")
+            logger.error("❌ Image processing failed: %s", e)
             raise
     
-    def validate_image(self, image_path: str) -> bool:
+    def perceptual_hash(self, img_array: np.ndarray) -> int:
+        """
+        64-bit difference hash (dHash) of a processed image
+        
+        The image is shrunk to 9x8 greyscale and each bit records whether a
+        pixel is brighter than its right neighbour. Re-encoded, resized or
+        lightly edited copies of a photo differ in only a few bits.
+        
+        Args:
+            img_array: Output of process_image (224x224x3)
+            
+        Returns:
+            Hash as an unsigned 64-bit integer
+        """
+        grey = Image.fromarray(np.clip(img_array, 0, 255).astype(np.uint8)).convert('L')
+        pixels = np.asarray(grey.resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).reshape(-1)
+        return int(np.packbits(bits).view('>u8')[0])
+    
+    def color_histogram(self, img_array: np.ndarray) -> np.ndarray:
+        """
+        HSV colour histogram of a processed image, for colour-aware re-ranking
+        
+        The image is shrunk to 64x64 and each pixel is spread over its nearest
+        8 (hue) x 3 (saturation) x 3 (value) bins, so neighbouring shades
+        still overlap. Near-white pixels (the usual studio background) are
+        left out unless they are almost the whole image. The result is the
+        square root of the normalised histogram: it has unit length, and the
+        dot product of two histograms is their Bhattacharyya coefficient
+        (1 = same colours).
+        
+        Args:
+            img_array: Output of process_image (224x224x3)
+            
+        Returns:
+            float32 vector of COLOR_HISTOGRAM_SIZE values
+        """
+        image = Image.fromarray(np.clip(img_array, 0, 255).astype(np.uint8)).resize((64, 64), Image.Resampling.BOX)
+        hsv = np.asarray(image.convert('HSV'), dtype=np.float32).reshape(-1, 3)
+        
+        foreground = ~((hsv[:, 1] < 30) & (hsv[:, 2] > 225))
+        if foreground.mean() >= 0.05:
+            hsv = hsv[foreground]
+        
+        # Per channel: the two nearest bins and their weights (hue wraps around)
+        corners = []
+        for channel, (count, circular) in enumerate(zip(COLOR_BINS, (True, False, False))):
+            position = hsv[:, channel] * (count / 256.0) - 0.5
+            if not circular:
+                position = np.clip(position, 0, count - 1)
+            lower = np.floor(position)
+            weight = position - lower
+            lower = lower.astype(np.int64) % count
+            upper = (lower + 1) % count if circular else np.minimum(lower + 1, count - 1)
+            corners.append(((lower, 1 - weight), (upper, weight)))
+        
+        histogram = np.zeros(COLOR_HISTOGRAM_SIZE, dtype=np.float64)
+        _, s_bins, v_bins = COLOR_BINS
+        for h_bin, h_weight in corners[0]:
+            for s_bin, s_weight in corners[1]:
+                for v_bin, v_weight in corners[2]:
+                    histogram += np.bincount(
+                        (h_bin * s_bins + s_bin) * v_bins + v_bin,
+                        weights=h_weight * s_weight * v_weight,
+                        minlength=COLOR_HISTOGRAM_SIZE
+                    )
+        return np.sqrt(histogram / histogram.sum()).astype(np.float32)
+    
+    def validate_image(self, source: ImageSource) -> bool:
         """
         Validate if file is a valid image
         
         Args:
-            image_path: Path to image file
+            source: Path to image file, encoded image bytes or binary file object
             
         Returns:
             True if valid, False otherwise
         """
         try:
-            img = Image.open(image_path)
+            img = self.open_image(source)
             
             # Check format
             if img.format not in self.allowed_formats:
@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by total size
+
+    Each entry's size comes from `sizeof` (1 per entry by default, so capacity
+    is an entry count; pass e.g. `lambda v: v.nbytes` to bound memory instead).
+    Hit/miss/eviction counters are kept for monitoring.
+    """
+
+    def __init__(self, capacity: int, sizeof: Callable[[Any], int] = lambda value: 1):
+        self.capacity = capacity
+        self.sizeof = sizeof
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.sizes: Dict[Hashable, int] = {}
+        self.total_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (marking it recently used), or None"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        """Insert or replace a value, evicting least-recently-used entries to fit"""
+        size = self.sizeof(value)
+        if size > self.capacity:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.total_size -= self.sizes.pop(key)
+                del self.entries[key]
+
+            while self.entries and self.total_size + size > self.capacity:
+                old_key, _ = self.entries.popitem(last=False)
+                self.total_size -= self.sizes.pop(old_key)
+                self.evictions += 1
+
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_size += size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "size": self.total_size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,183 @@
+import abc
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Latency buckets in seconds: 1 ms .. 30 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for the metric's current values"""
+
+    def render(self) -> str:
+        return "\n".join([
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ])
+
+
+class Counter(_Metric):
+    """Monotonic count; `function` makes it read a live value instead (e.g. cache hits)"""
+
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None
+    ):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.function = function
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def _current(self) -> Dict[LabelValues, float]:
+        if self.function is None:
+            with self.lock:
+                return dict(self.values)
+        value = self.function()
+        return value if isinstance(value, dict) else {(): value}
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self._current().items())
+        ]
+
+
+class Gauge(Counter):
+    """Value that goes up and down; usually read live through `function` (e.g. queue depth)"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, plus their sum and count"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last = +Inf)], sum
+        self.series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the duration of the block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            series = {key: (list(counts), total[0]) for key, (counts, total) in self.series.items()}
+
+        lines = []
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered in the Prometheus text exposition format"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labels: Sequence[str] = (), function=None) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labels, function))
+
+
+def gauge(name: str, documentation: str, labels: Sequence[str] = (), function=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labels, function))
+
+
+def histogram(name: str, documentation: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+# Time spent per pipeline stage (upload_read, decode, inference, model, scoring,
+# catalog_fetch, change_feed), shared by every module that runs a stage
+STAGE_SECONDS = histogram("ai_stage_duration_seconds", "Time spent in each pipeline stage", ["stage"])
+
+INFERENCE_BATCH_SIZE = histogram(
+    "ai_inference_batch_size", "Images per model call", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
@@ -0,0 +1,48 @@
+import asyncio
+import contextlib
+
+
+class ReadWriteLock:
+    """
+    asyncio lock with shared (read) and exclusive (write) holders
+
+    Searches hold it for reading, so they run concurrently in executor
+    threads; index syncs hold it for writing while they move rows. A waiting
+    writer blocks new readers, so a steady stream of searches can't starve
+    the syncs.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer and not self._writers_waiting)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self._condition:
+            self._writers_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writer and self._readers == 0)
+            finally:
+                self._writers_waiting -= 1
+                self._condition.notify_all()  # readers held back by a cancelled writer
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
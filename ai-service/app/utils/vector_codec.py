@@ -0,0 +1,69 @@
+import base64
+import numpy as np
+from typing import Optional, Tuple
+
+# Raw little-endian vector bytes; dtype/dim travel in X-Feature-* headers
+RAW_MEDIA_TYPE = "application/x-feature-vector"
+
+SUPPORTED_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+}
+
+
+def encode_vector(vector: np.ndarray, dtype: str = "float32") -> bytes:
+    """Serialise a vector as little-endian bytes of the given dtype"""
+    return np.asarray(vector).astype(SUPPORTED_DTYPES[dtype], copy=False).tobytes()
+
+
+def decode_vector(data: bytes, dtype: str = "float32", dim: Optional[int] = None) -> np.ndarray:
+    """
+    Parse little-endian vector bytes back into float32
+
+    Args:
+        data: Raw bytes
+        dtype: Wire dtype ("float32" or "float16")
+        dim: Expected number of values (checked if given)
+
+    Returns:
+        numpy float32 array
+    """
+    vector = np.frombuffer(data, dtype=SUPPORTED_DTYPES[dtype])
+    if dim is not None and vector.size != dim:
+        raise ValueError(f"Expected {dim} values, got {vector.size}")
+    return vector.astype(np.float32)
+
+
+def encode_vector_base64(vector: np.ndarray, dtype: str = "float32") -> str:
+    return base64.b64encode(encode_vector(vector, dtype)).decode("ascii")
+
+
+def decode_vector_base64(data: str, dtype: str = "float32", dim: Optional[int] = None) -> np.ndarray:
+    return decode_vector(base64.b64decode(data), dtype, dim)
+
+
+def negotiate(accept: Optional[str]) -> Tuple[str, str]:
+    """
+    Pick the feature encoding from an Accept header
+
+    - `application/x-feature-vector[; dtype=float16]` -> raw bytes
+    - `application/json; encoding=base64[; dtype=float16]` -> base64 in JSON
+    - anything else -> plain JSON float lists
+
+    Returns:
+        (encoding, dtype) where encoding is "raw", "base64" or "json"
+    """
+    for media_range in (accept or "").split(","):
+        parts = [part.strip().lower() for part in media_range.split(";")]
+        params = dict(part.split("=", 1) for part in parts[1:] if "=" in part)
+
+        dtype = params.get("dtype", "float32")
+        if dtype not in SUPPORTED_DTYPES:
+            dtype = "float32"
+
+        if parts[0] == RAW_MEDIA_TYPE:
+            return "raw", dtype
+        if parts[0] in ("application/json", "application/x-ndjson") and params.get("encoding") == "base64":
+            return "base64", dtype
+
+    return "json", "float32"
@@ -0,0 +1,78 @@
+"""
+Recall/latency benchmark: IVF index vs the exact brute-force path
+
+Usage (from ai-service/):
+    python -m benchmarks.ann_recall --size 200000 --nlist 512 --nprobe 4 8 16 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.ann_index import IVFIndex
+from app.services.similarity_search import SimilaritySearch
+
+
+def synthetic_catalog(size: int, dim: int, clusters: int, seed: int = 0):
+    """Clustered random vectors, roughly shaped like real product embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+    return np.maximum(vectors, 0)  # MobileNetV2 pooled features are post-ReLU
+
+
+def build_search(vectors: np.ndarray, **options) -> SimilaritySearch:
+    search = SimilaritySearch(feature_size=vectors.shape[1], **options)
+    search.similarity_threshold = -1.0  # measure pure ranking quality
+    search.sync_products([
+        {"id": str(i), "name": str(i), "slug": str(i), "price": 0, "images": [], "feature_vector": v}
+        for i, v in enumerate(vectors)
+    ])
+    return search
+
+
+def run_queries(search: SimilaritySearch, queries: np.ndarray, k: int):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = search.search(query, top_k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append({hit["id"] for hit in hits})
+    return results, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1280)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    vectors = synthetic_catalog(args.size + args.queries, args.dim, clusters=max(args.nlist // 2, 1))
+    catalog, queries = vectors[:args.size], vectors[args.size:]
+
+    exact = build_search(catalog)
+    truth, exact_ms = run_queries(exact, queries, args.k)
+    print(f"exact        p50={np.percentile(exact_ms, 50):7.2f}ms  p99={np.percentile(exact_ms, 99):7.2f}ms")
+
+    ivf = IVFIndex(nlist=args.nlist)
+    approx = build_search(catalog, ann_index=ivf)
+    if not ivf.is_trained:
+        ivf.train(approx.matrix[:approx.size])
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        found, ivf_ms = run_queries(approx, queries, args.k)
+        recall = np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)])
+        print(
+            f"ivf nprobe={nprobe:<3} recall@{args.k}={recall:.3f}  "
+            f"p50={np.percentile(ivf_ms, 50):7.2f}ms  p99={np.percentile(ivf_ms, 99):7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Image preprocessing benchmark: quality (LANCZOS) vs fast (JPEG draft + bilinear)
+
+Reports decode+resize latency for both modes, the pixel difference between
+their outputs and, with --with-model, the cosine similarity between the
+MobileNetV2 embeddings of each pair (1.0 = no effect on retrieval).
+
+Usage (from ai-service/):
+    python -m benchmarks.image_decode --count 20 --width 4032 --height 3024
+    python -m benchmarks.image_decode --images path/to/photos --with-model
+"""
+import argparse
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.utils.image_processor import ImageProcessor
+
+
+def synthetic_jpegs(count: int, width: int, height: int, seed: int = 0):
+    """Photo-like JPEGs: smooth colour fields plus sensor-style noise"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        small = rng.integers(0, 255, (height // 64, width // 64, 3), dtype=np.uint8)
+        img = Image.fromarray(small).resize((width, height), Image.Resampling.BICUBIC)
+        noisy = np.asarray(img, dtype=np.int16) + rng.integers(-12, 12, (height, width, 3))
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def load_images(directory: str):
+    paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"})
+    return [p.read_bytes() for p in paths]
+
+
+def time_mode(processor: ImageProcessor, images, repeats: int):
+    latencies, outputs = [], []
+    for data in images:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            array = processor.process_image(data)
+            latencies.append(time.perf_counter() - start)
+        outputs.append(array)
+    return np.array(latencies) * 1000, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory of real images (default: synthetic JPEGs)")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--with-model", action="store_true", help="Compare MobileNetV2 embeddings too")
+    args = parser.parse_args()
+
+    images = load_images(args.images) if args.images else synthetic_jpegs(args.count, args.width, args.height)
+    print(f"{len(images)} images, {args.repeats} repeats each")
+
+    quality_ms, quality_out = time_mode(ImageProcessor(fast_mode=False), images, args.repeats)
+    fast_ms, fast_out = time_mode(ImageProcessor(fast_mode=True), images, args.repeats)
+
+    for name, ms in (("quality", quality_ms), ("fast", fast_ms)):
+        print(f"{name:8} p50={np.percentile(ms, 50):8.2f}ms  p95={np.percentile(ms, 95):8.2f}ms")
+    print(f"speedup  {np.median(quality_ms) / np.median(fast_ms):.1f}x")
+
+    pixel_mae = np.mean([np.abs(q - f).mean() for q, f in zip(quality_out, fast_out)])
+    print(f"pixel MAE between modes: {pixel_mae:.2f} / 255")
+
+    if args.with_model:
+        from app.services.feature_extractor import FeatureExtractor
+
+        extractor = FeatureExtractor()
+        extractor.load_model()
+        q = extractor.extract_features_batch(quality_out)
+        f = extractor.extract_features_batch(fast_out)
+        cosine = np.sum(q * f, axis=1) / (np.linalg.norm(q, axis=1) * np.linalg.norm(f, axis=1))
+        print(f"embedding cosine(quality, fast): mean={cosine.mean():.4f}  min={cosine.min():.4f}")
+
+
+if __name__ == "__main__":
+    main()
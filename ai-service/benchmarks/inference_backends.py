@@ -0,0 +1,104 @@
+"""
+Inference backend benchmark and parity check against the Keras baseline
+
+For each backend, reports single-image and batch latency, plus how far its
+embeddings are from Keras `predict` on the same inputs (cosine similarity and
+max absolute difference). Exits with status 1 if any backend's minimum cosine
+falls below --tolerance, so it can gate an export or a deploy.
+
+Usage (from ai-service/):
+    python -m benchmarks.inference_backends --backends tf-function tflite
+    python -m benchmarks.inference_backends --backends tflite onnx --quantize --tolerance 0.98
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.services.feature_extractor import FeatureExtractor
+
+
+def sample_images(directory: str, count: int):
+    """Real photos if a directory is given, otherwise smooth random images"""
+    if directory:
+        from pathlib import Path
+
+        from app.utils.image_processor import ImageProcessor
+
+        processor = ImageProcessor()
+        paths = sorted(p for p in Path(directory).iterdir() if p.is_file())[:count]
+        return [processor.process_image(str(p)) for p in paths]
+
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        small = rng.integers(0, 255, (14, 14, 3), dtype=np.uint8)
+        images.append(np.asarray(Image.fromarray(small).resize((224, 224), Image.Resampling.BICUBIC), dtype=np.float32))
+    return images
+
+
+def time_backend(extractor: FeatureExtractor, images, batch_size: int, repeats: int):
+    extractor.extract_features(images[0])  # warm-up (tracing, tensor allocation)
+
+    single = []
+    for image in images[:repeats]:
+        start = time.perf_counter()
+        extractor.extract_features(image)
+        single.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    features = np.concatenate([
+        extractor.extract_features_batch(images[i:i + batch_size])
+        for i in range(0, len(images), batch_size)
+    ])
+    batch_ms_per_image = (time.perf_counter() - start) / len(images) * 1000
+    return np.array(single) * 1000, batch_ms_per_image, features
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["tf-function", "tflite"])
+    parser.add_argument("--quantize", action="store_true", help="int8 models for tflite/onnx")
+    parser.add_argument("--images", help="Directory of real images (default: synthetic)")
+    parser.add_argument("--count", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=0.999, help="Min cosine vs the Keras baseline")
+    args = parser.parse_args()
+
+    images = sample_images(args.images, args.count)
+
+    baseline = FeatureExtractor(backend="keras")
+    baseline.load_model()
+    base_single, base_batch, reference = time_backend(baseline, images, args.batch_size, args.repeats)
+    print(f"{'keras':18} single p50={np.median(base_single):7.2f}ms  batch={base_batch:6.2f}ms/img")
+
+    failed = False
+    for backend in args.backends:
+        quantize = args.quantize and backend in ("tflite", "onnx")
+        extractor = FeatureExtractor(backend=backend, quantize=quantize)
+        extractor.load_model()
+        single, batch, features = time_backend(extractor, images, args.batch_size, args.repeats)
+
+        cosine = np.sum(features * reference, axis=1) / (
+            np.linalg.norm(features, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        max_diff = np.abs(features - reference).max()
+        ok = cosine.min() >= args.tolerance
+        failed |= not ok
+
+        name = backend + (" (int8)" if quantize else "")
+        print(
+            f"{name:18} single p50={np.median(single):7.2f}ms  batch={batch:6.2f}ms/img  "
+            f"speedup={np.median(base_single) / np.median(single):4.1f}x  "
+            f"cosine min={cosine.min():.5f}  max|diff|={max_diff:.4f}  {'OK' if ok else 'FAIL'}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
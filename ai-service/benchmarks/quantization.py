@@ -0,0 +1,59 @@
+"""
+Scalar quantisation benchmark: float16 / int8 codes vs the float32 index
+
+Reports the memory scanned per query, the index's resident footprint (only
+the codes: the float32 rows are kept in a scratch file), recall@k against
+exact float32 search and latency, with and without the exact float32 re-rank
+of the shortlist.
+
+Usage (from ai-service/):
+    python -m benchmarks.quantization --size 200000 --rerank 0 4
+"""
+import argparse
+import tempfile
+
+import numpy as np
+
+from app.services.embedding_store import EmbeddingStore
+from app.services.quantization import ScalarQuantizer
+from benchmarks.ann_recall import build_search, run_queries, synthetic_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1280)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4], help="Re-rank factors to try")
+    args = parser.parse_args()
+
+    vectors = synthetic_catalog(args.size + args.queries, args.dim, clusters=128)
+    catalog, queries = vectors[:args.size], vectors[args.size:]
+
+    exact = build_search(catalog)
+    truth, exact_ms = run_queries(exact, queries, args.k)
+    float32_mb = exact.matrix[:exact.size].nbytes / 2**20
+    resident_mb = exact.memory_usage()["total"] / 2**20
+    print(
+        f"float32            {float32_mb:8.1f}MB scanned {resident_mb:8.1f}MB resident  "
+        f"p50={np.percentile(exact_ms, 50):7.2f}ms"
+    )
+
+    store = EmbeddingStore(tempfile.mkdtemp(prefix="quantization-"))
+    for kind in ("float16", "int8"):
+        for factor in args.rerank:
+            search = build_search(catalog, quantizer=ScalarQuantizer(kind), rerank_factor=factor, store=store)
+            found, ms = run_queries(search, queries, args.k)
+            recall = np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)])
+            codes_mb = search.codes[:search.size].nbytes / 2**20
+            resident_mb = search.memory_usage()["total"] / 2**20
+            print(
+                f"{kind:7} rerank={factor:<3} {codes_mb:8.1f}MB scanned {resident_mb:8.1f}MB resident  "
+                f"p50={np.percentile(ms, 50):7.2f}ms  "
+                f"recall@{args.k}={recall:.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Benchmark and load-test suite for the service's hot paths
+
+Stages (pick with --stages):
+    preprocess  decode + resize of generated JPEGs (quality and fast modes)
+    extract     model latency/throughput at several batch sizes
+    search      SimilaritySearch over synthetic catalogs of each --sizes
+    e2e         /visual-search latency and throughput under concurrent load
+
+For e2e the service runs in-process under uvicorn, with the catalog index
+loaded from a synthetic matrix and a stub in place of the backend (no network,
+no database). `--stub-model` also swaps MobileNetV2 for a cheap random
+projection, to measure everything but the model; `--url` load-tests an
+already running service instead.
+
+Results are written as JSON (with environment metadata) so runs can be
+compared between versions with --compare.
+
+Usage (from ai-service/):
+    python -m benchmarks.suite --output results/baseline.json
+    python -m benchmarks.suite --stages search --sizes 1000 100000 1000000 --dim 1280
+    python -m benchmarks.suite --stages e2e --stub-model --concurrency 1 8 32 --requests 500
+    python -m benchmarks.suite --compare results/baseline.json results/candidate.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.image_decode import synthetic_jpegs
+
+
+def summarize(latencies_s, count: int = None, elapsed_s: float = None) -> dict:
+    """Latency percentiles in ms, plus throughput when the wall time is known"""
+    ms = np.asarray(latencies_s) * 1000
+    summary = {
+        "n": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+    if elapsed_s:
+        summary["throughput_per_s"] = round((count or len(ms)) / elapsed_s, 2)
+    return summary
+
+
+def environment(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+
+
+def synthetic_matrix(size: int, dim: int, seed: int = 0, chunk: int = 65536) -> np.ndarray:
+    """Clustered, post-ReLU, L2-normalised float32 vectors, generated in chunks so 1M x 1280 fits"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, dim), dtype=np.float32)
+    matrix = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, chunk):
+        end = min(start + chunk, size)
+        block = centers[rng.integers(0, len(centers), end - start)]
+        block += 0.6 * rng.standard_normal((end - start, dim), dtype=np.float32)
+        np.maximum(block, 0, out=block)
+        block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        matrix[start:end] = block
+    return matrix
+
+
+def synthetic_products(size: int, categories: int = 20) -> dict:
+    return {
+        str(i): {
+            "id": str(i), "name": f"Product {i}", "slug": f"product-{i}", "price": float(i % 200),
+            "images": [], "category": {}, "categoryId": f"c{i % categories}", "isActive": True, "stock": i % 3,
+        }
+        for i in range(size)
+    }
+
+
+def load_synthetic_index(search, size: int, dim: int):
+    matrix = synthetic_matrix(size, dim)
+    ids = [str(i) for i in range(size)]
+    search.load_index(matrix, ids, synthetic_products(size))
+    return matrix
+
+
+class StubModel:
+    """Random projection of 8x8-pooled pixels: cheap, deterministic, shaped like MobileNetV2 output"""
+
+    def __init__(self, feature_size: int):
+        self.projection = np.random.default_rng(0).standard_normal((8 * 8 * 3, feature_size), dtype=np.float32)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        pooled = batch.reshape(len(batch), 8, 28, 8, 28, 3).mean(axis=(2, 4)).reshape(len(batch), -1)
+        return np.maximum(pooled @ self.projection, 0)
+
+
+# --- stages -----------------------------------------------------------------
+
+def bench_preprocess(args) -> dict:
+    from app.utils.image_processor import ImageProcessor
+
+    images = synthetic_jpegs(args.images, args.width, args.height)
+    results = {}
+    for mode, fast in (("quality", False), ("fast", True)):
+        processor = ImageProcessor(fast_mode=fast)
+        latencies = []
+        started = time.perf_counter()
+        for data in images:
+            for _ in range(args.repeats):
+                t = time.perf_counter()
+                processor.process_image(data)
+                latencies.append(time.perf_counter() - t)
+        results[mode] = summarize(latencies, elapsed_s=time.perf_counter() - started)
+        print(f"  preprocess {mode:8} p50={results[mode]['p50_ms']:8.2f}ms")
+    return results
+
+
+def bench_extract(args) -> dict:
+    from app.services.feature_extractor import FeatureExtractor
+
+    extractor = FeatureExtractor.from_env()
+    if args.stub_model:
+        extractor.model = StubModel(extractor.feature_size)
+    else:
+        try:
+            extractor.load_model()
+        except Exception as e:
+            print(f"  extract skipped: {e}")
+            return {"skipped": str(e)}
+
+    rng = np.random.default_rng(0)
+    results = {"backend": "stub" if args.stub_model else extractor.backend}
+    for batch_size in args.batch_sizes:
+        batch = list(rng.uniform(0, 255, (batch_size,) + extractor.input_shape).astype(np.float32))
+        extractor.extract_features_batch(batch)  # warm-up for this shape
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.repeats):
+            t = time.perf_counter()
+            extractor.extract_features_batch(batch)
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+        results[f"batch_{batch_size}"] = summarize(latencies, count=batch_size * args.repeats, elapsed_s=elapsed)
+        print(
+            f"  extract batch={batch_size:<3} p50={results[f'batch_{batch_size}']['p50_ms']:8.2f}ms  "
+            f"{results[f'batch_{batch_size}']['throughput_per_s']:8.1f} img/s"
+        )
+    return results
+
+
+def bench_search(args) -> dict:
+    from app.services.shard_pool import ShardPool
+    from app.services.similarity_search import SimilaritySearch
+
+    pool = None
+    if args.shards > 1:
+        pool = ShardPool(args.shards)
+        pool.start()
+
+    results = {"shards": args.shards}
+    for size in args.sizes:
+        search = SimilaritySearch(feature_size=args.dim, shards=pool)
+        matrix = load_synthetic_index(search, size, args.dim)
+        rng = np.random.default_rng(1)
+        queries = matrix[rng.integers(0, size, args.queries)] + 0.05 * rng.standard_normal(
+            (args.queries, args.dim), dtype=np.float32
+        )
+
+        entry = {"vectors": size, "index_mb": round(matrix.nbytes / 2**20, 1)}
+        for name, filters in (("unfiltered", {}), ("category", {"category": "c3"}), ("price_stock", {"min_price": 10, "max_price": 50, "in_stock": True})):
+            latencies = []
+            started = time.perf_counter()
+            for query in queries:
+                t = time.perf_counter()
+                search.search(query, top_k=args.k, **filters)
+                latencies.append(time.perf_counter() - t)
+            entry[name] = summarize(latencies, elapsed_s=time.perf_counter() - started)
+        results[str(size)] = entry
+        print(
+            f"  search size={size:<8} unfiltered p50={entry['unfiltered']['p50_ms']:8.2f}ms  "
+            f"category p50={entry['category']['p50_ms']:8.2f}ms"
+        )
+        del search, matrix
+    if pool is not None:
+        pool.close()
+    return results
+
+
+def start_local_service(args):
+    """Run app.main under uvicorn in a thread, with a synthetic index and a stub backend"""
+    # Keep the synthetic catalog away from the real snapshots and neighbour table
+    os.environ.setdefault("EMBEDDING_STORE_DIR", tempfile.mkdtemp(prefix="bench-embeddings-"))
+    os.environ.setdefault(
+        "NEIGHBOR_TABLE_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-neighbors-"), "table.npz")
+    )
+    os.environ["INDEX_SYNC_INTERVAL"] = "0"
+    os.environ["INDEX_REFRESH_INTERVAL"] = "0"
+
+    import uvicorn
+    from app import main
+
+    async def no_changes(since=None, limit=None):
+        return {"products": [], "removed": [], "cursor": "1970-01-01T00:00:00Z", "has_more": False}
+
+    async def no_products(*a, **k):
+        return []
+
+    # Stub backend: the index comes from the synthetic matrix, and syncs see no changes
+    main.backend_client.get_feature_changes = no_changes
+    main.backend_client.get_products_with_features = no_products
+
+    def restore_synthetic():
+        load_synthetic_index(main.similarity_search, args.catalog_size, main.feature_extractor.feature_size)
+        main.sync_cursor = "1970-01-01T00:00:00Z"
+        return True
+
+    main.restore_index = restore_synthetic
+    if args.stub_model:
+        main.feature_extractor.load_model = lambda: setattr(
+            main.feature_extractor, "model", StubModel(main.feature_extractor.feature_size)
+        )
+
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    return server, thread
+
+
+async def wait_ready(session, url: str, timeout: float = 600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{url}/health/ready") as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not become ready")
+
+
+async def run_load(url: str, images, concurrency: int, requests: int) -> dict:
+    import aiohttp
+
+    latencies, statuses = [], {}
+    next_request = iter(range(requests))
+
+    async def worker(session):
+        for i in next_request:
+            form = aiohttp.FormData()
+            form.add_field("file", images[i % len(images)], filename=f"query-{i}.jpg", content_type="image/jpeg")
+            t = time.perf_counter()
+            async with session.post(f"{url}/visual-search?limit=10", data=form) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - t)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, url)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, elapsed_s=elapsed)
+    result["status_codes"] = {str(code): count for code, count in sorted(statuses.items())}
+    return result
+
+
+def bench_e2e(args) -> dict:
+    server = None
+    url = args.url
+    if url is None:
+        server, thread = start_local_service(args)
+        url = f"http://127.0.0.1:{args.port}"
+
+    # Distinct images per request, so the query caches don't turn this into a cache benchmark
+    images = synthetic_jpegs(max(args.requests, 1), args.width, args.height, seed=1) if args.unique_images \
+        else synthetic_jpegs(args.images, args.width, args.height, seed=1)
+
+    results = {"url": args.url or "in-process", "stub_model": args.stub_model, "catalog_size": args.catalog_size}
+    try:
+        for concurrency in args.concurrency:
+            entry = asyncio.run(run_load(url, images, concurrency, args.requests))
+            results[f"concurrency_{concurrency}"] = entry
+            print(
+                f"  e2e concurrency={concurrency:<3} p50={entry['p50_ms']:8.2f}ms  p99={entry['p99_ms']:8.2f}ms  "
+                f"{entry['throughput_per_s']:7.1f} req/s  {entry['status_codes']}"
+            )
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=30)
+    return results
+
+
+STAGES = {
+    "preprocess": bench_preprocess,
+    "extract": bench_extract,
+    "search": bench_search,
+    "e2e": bench_e2e,
+}
+
+
+# --- comparison ---------------------------------------------------------------
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline_path: str, candidate_path: str, threshold: float) -> int:
+    """Print metric changes; returns the number of regressions beyond threshold"""
+    baseline = flatten(json.loads(Path(baseline_path).read_text())["results"])
+    candidate = flatten(json.loads(Path(candidate_path).read_text())["results"])
+
+    regressions = 0
+    for name in sorted(baseline.keys() & candidate.keys()):
+        if not (name.endswith("_ms") or name.endswith("_per_s")):
+            continue
+        old, new = baseline[name], candidate[name]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        # Latency should go down, throughput up
+        worse = change > threshold if name.endswith("_ms") else change < -threshold
+        regressions += worse
+        print(f"{'REGRESSION' if worse else '':10} {name:60} {old:12.3f} -> {new:12.3f}  ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--output", help="Write results JSON here (default: print only)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two results files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    # preprocess / e2e images
+    parser.add_argument("--images", type=int, default=10, help="Generated images")
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--repeats", type=int, default=10)
+    # extract
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--stub-model", action="store_true", help="Random projection instead of MobileNetV2")
+    # search
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=1280)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shards", type=int, default=1, help="Search worker processes (see INDEX_SHARDS)")
+    # e2e
+    parser.add_argument("--url", help="Load-test a running service instead of an in-process one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--unique-images", action="store_true", help="A different image per request (no cache hits)")
+    args = parser.parse_args()
+
+    if args.compare:
+        raise SystemExit(1 if compare(*args.compare, args.threshold) else 0)
+
+    report = {"environment": environment(args), "results": {}}
+    for stage in args.stages:
+        print(f"▶ {stage}")
+        report["results"][stage] = STAGES[stage](args)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
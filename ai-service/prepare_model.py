@@ -0,0 +1,23 @@
+"""
+Build the local model artifacts ahead of time (e.g. while building the image)
+
+Saves the Keras model to MODEL_DIR and, for INFERENCE_BACKEND=tflite/onnx,
+exports the serving model too, then runs one warm-up inference. The service
+can then start with MODEL_OFFLINE=true and never touch the network.
+
+Usage (from ai-service/):
+    INFERENCE_BACKEND=tflite python prepare_model.py
+"""
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.feature_extractor import FeatureExtractor
+
+if __name__ == "__main__":
+    started = time.monotonic()
+    extractor = FeatureExtractor.from_env()
+    extractor.load_model()
+    extractor.warm_up()
+    print(f"✅ Model artifacts ready in {extractor.model_dir} ({time.monotonic() - started:.1f}s)")
@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Tests import the service as `app.*`, like run.py does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def make_products():
+    """Factory for catalog products with random feature vectors"""
+    def make(count, feature_size=8, seed=0):
+        rng = np.random.default_rng(seed)
+        return [
+            {
+                "id": str(i), "name": f"Product {i}", "slug": f"product-{i}", "price": 10.0,
+                "images": [], "stock": 1, "feature_vector": rng.standard_normal(feature_size),
+            }
+            for i in range(count)
+        ]
+    return make
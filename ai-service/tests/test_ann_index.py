@@ -0,0 +1,47 @@
+from app.services.ann_index import IVFIndex
+from app.services.similarity_search import SimilaritySearch
+
+
+def test_ivf_trains_once_upserts_reach_the_minimum(make_products):
+    index = SimilaritySearch(feature_size=8, ann_index=IVFIndex(nlist=4, nprobe=2))
+    products = make_products(300)
+
+    index.upsert_products(products[:100])
+    assert not index.ann_index.is_trained
+
+    index.upsert_products(products[100:200])
+    assert index.ann_index.is_trained
+    assert index.ann_index.trained_size == 200
+
+    index.upsert_products(products[200:])
+    assert len(index.ann_index.assignments) >= index.size
+    assert index.search(products[250]["feature_vector"], top_k=1)[0]["id"] == "250"
+
+
+def build(products, **ivf):
+    index = SimilaritySearch(feature_size=8, ann_index=IVFIndex(**ivf) if ivf else None)
+    index.similarity_threshold = -1.0
+    index.sync_products(products)
+    return index
+
+
+def test_ivf_probing_every_list_matches_brute_force(make_products):
+    products = make_products(400)
+    exact = build(products)
+    ivf = build(products, nlist=8, nprobe=8)
+    assert ivf.ann_index.is_trained
+
+    for product in products[:50]:
+        query = product["feature_vector"]
+        assert [r["id"] for r in ivf.search(query, top_k=10)] == [r["id"] for r in exact.search(query, top_k=10)]
+
+
+def test_ivf_assignments_follow_moved_rows(make_products):
+    products = make_products(400)
+    ivf = build(products, nlist=8, nprobe=1)
+    ivf.remove_products([str(i) for i in range(0, 400, 3)])
+
+    # A row's own list is the one closest to it, so one probe always finds it
+    for product in products:
+        if product["id"] in ivf.product_rows:
+            assert ivf.search(product["feature_vector"], top_k=1)[0]["id"] == product["id"]
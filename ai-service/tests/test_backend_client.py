@@ -0,0 +1,56 @@
+import asyncio
+
+from app.utils.backend_client import BackendClient
+
+
+def test_image_hashes_stay_aligned_with_vectors():
+    products = BackendClient()._parse_products([{
+        "id": "p1",
+        "aiFeatures": [
+            {"features": [1.0, 0.0], "phash": None},
+            {"features": [], "phash": "ffff"},  # unusable vector, dropped with its hash
+            {"features": [0.0, 1.0], "phash": "00ff"},
+        ],
+    }])
+
+    assert len(products[0]["feature_vectors"]) == 2
+    assert products[0]["image_hashes"] == [None, "00ff"]
+
+
+def test_download_images_rejects_other_hosts(monkeypatch):
+    monkeypatch.setenv("BACKEND_API_URL", "http://backend:3000/api")
+    client = BackendClient()
+
+    async def run():
+        try:
+            return await client.download_images(
+                ["http://169.254.169.254/latest/meta-data", "file:///etc/passwd"], max_bytes=1024
+            )
+        finally:
+            await client.close()
+
+    results = asyncio.run(run())
+    assert client.image_hosts == {"backend"}
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_catalog_fetch_survives_deletes_between_pages():
+    client = BackendClient()
+    client.page_size = 10
+    catalog = {f"{i:03x}": {"id": f"{i:03x}", "aiFeatures": [{"features": [1.0, 0.0]}]} for i in range(0, 4096, 16)}
+    requests = []
+
+    async def fetch_page(params):
+        requests.append(params)
+        if len(requests) == 3:
+            # Products before every range's cursor disappear mid-fetch
+            for product_id in sorted(catalog)[:20]:
+                catalog.pop(product_id)
+        after, before, limit = params["afterId"], params["beforeId"], params["limit"]
+        rows = [catalog[i] for i in sorted(catalog) if i > after and (not before or i < before)][:limit]
+        return {"products": rows, "nextAfterId": rows[-1]["id"] if len(rows) == limit else None}
+
+    client._fetch_features_page = fetch_page
+    products = asyncio.run(client.get_products_with_features(limit=100000))
+
+    assert set(catalog) <= {product["id"] for product in products}
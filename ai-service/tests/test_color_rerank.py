@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from app.services.similarity_search import SimilaritySearch
+from app.utils.image_processor import COLOR_HISTOGRAM_SIZE, ImageProcessor
+
+
+def solid(rgb):
+    return np.broadcast_to(np.array(rgb, dtype=np.float32), (224, 224, 3))
+
+
+@pytest.fixture
+def histograms():
+    processor = ImageProcessor()
+    return {
+        name: processor.color_histogram(solid(rgb))
+        for name, rgb in {"red": (200, 20, 20), "dark red": (150, 10, 10), "blue": (20, 20, 200)}.items()
+    }
+
+
+def test_histograms_are_unit_length_and_compare_colours(histograms):
+    for histogram in histograms.values():
+        assert histogram.shape == (COLOR_HISTOGRAM_SIZE,)
+        assert np.linalg.norm(histogram) == pytest.approx(1.0, abs=1e-5)
+    assert histograms["red"] @ histograms["dark red"] > histograms["red"] @ histograms["blue"]
+
+
+@pytest.fixture
+def index(make_products, histograms):
+    # By embedding alone: blue (0.96), red (0.93), plain (0.82, no histogram)
+    basis = np.eye(16)
+    query = basis[0]
+    products = make_products(3, feature_size=16)
+    for product, (name, axis, offset) in zip(products, [("blue", 1, 0.3), ("red", 2, 0.4), ("plain", 3, 0.7)]):
+        product["id"] = name
+        product["feature_vector"] = query + offset * basis[axis]
+        product["color_histograms"] = [histograms[name]] if name in histograms else []
+
+    index = SimilaritySearch(feature_size=16, color_weight=0.5, color_candidates=10)
+    index.sync_products(products)
+    return index, query
+
+
+def test_colour_reorders_the_embedding_ranking(index, histograms):
+    index, query = index
+    by_embedding = [r["id"] for r in index.search(query, top_k=3)]
+    by_colour = index.search(query, top_k=3, query_histogram=histograms["dark red"])
+
+    assert by_embedding == ["blue", "red", "plain"]
+    assert [r["id"] for r in by_colour] == ["red", "plain", "blue"]
+
+    # A product without a histogram keeps its embedding score
+    plain = [r for r in index.search(query, top_k=3) if r["id"] == "plain"][0]
+    assert [r for r in by_colour if r["id"] == "plain"][0]["similarity"] == pytest.approx(plain["similarity"])
+
+
+def test_colour_weight_zero_disables_the_stage(index, histograms):
+    index, query = index
+    index.color_weight = 0.0
+    assert [r["id"] for r in index.search(query, top_k=3, query_histogram=histograms["dark red"])][0] == "blue"
+
+
+def test_batch_search_re_ranks_like_search(index, histograms):
+    index, query = index
+    batch = index.search_batch(np.stack([query, query]), top_k=3, query_histograms=[histograms["dark red"], None])
+    assert batch[0] == index.search(query, top_k=3, query_histogram=histograms["dark red"])
+    assert batch[1] == index.search(query, top_k=3)
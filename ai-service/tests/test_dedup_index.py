@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app.services.dedup_index import DuplicateIndex
+from app.services.similarity_search import SimilaritySearch
+
+
+@pytest.fixture
+def products(make_products):
+    products = make_products(50, feature_size=16)
+    rng = np.random.default_rng(1)
+
+    def copy_of(source, product_id, noise=0.01):
+        vector = products[source]["feature_vector"] + noise * rng.standard_normal(16)
+        return dict(products[source], id=product_id, slug=product_id, feature_vector=vector)
+
+    # "3" re-listed under two more SKUs
+    products.append(copy_of(3, "3-copy-a"))
+    products.append(copy_of(3, "3-copy-b"))
+    return products
+
+
+@pytest.fixture
+def index(products):
+    index = SimilaritySearch(feature_size=16, dedup=DuplicateIndex(feature_size=16))
+    index.similarity_threshold = 0.0
+    index.sync_products(products)
+    return index
+
+
+def test_near_duplicates_are_grouped(index):
+    assert index.dedup.report() == [
+        {"canonical": "3", "products": ["3", "3-copy-a", "3-copy-b"], "size": 3}
+    ]
+
+
+def test_search_collapses_duplicates_to_the_best_match(index, products):
+    results = index.search(products[3]["feature_vector"], top_k=5)
+    ids = [r["id"] for r in results]
+
+    assert ids[0] == "3"
+    assert len(ids) == 5 and not {"3-copy-a", "3-copy-b"} & set(ids)
+    assert results[0]["duplicates"] == ["3-copy-a", "3-copy-b"]
+
+
+def test_excluding_a_product_excludes_its_duplicates(index, products):
+    ids = [r["id"] for r in index.search(products[3]["feature_vector"], top_k=5, exclude="3-copy-a")]
+    assert len(ids) == 5 and not {"3", "3-copy-a", "3-copy-b"} & set(ids)
+
+
+def test_removing_a_product_unlinks_it(index):
+    index.remove_products(["3-copy-a"])
+    assert index.dedup.groups()["3"] == ["3", "3-copy-b"]
+    index.remove_products(["3-copy-b"])
+    assert index.dedup.groups() == {}
+
+
+def test_matching_perceptual_hashes_make_duplicates(make_products):
+    products = make_products(10, feature_size=16)
+    for product in products:
+        product["image_hashes"] = [f"{int(product['id']) * 0x1111111111:016x}"]
+    products[5]["image_hashes"] = ["0000000000000007"]  # 3 bits from product 0's hash
+    products[6]["image_hashes"] = [None]  # no hash: only its embedding can match
+
+    index = SimilaritySearch(feature_size=16, dedup=DuplicateIndex(feature_size=16, max_distance=3))
+    index.sync_products(products)
+    assert index.dedup.report() == [{"canonical": "0", "products": ["0", "5"], "size": 2}]
+
+
+def test_every_image_of_the_smaller_product_must_match():
+    dedup = DuplicateIndex(feature_size=4)
+    x, y, z = np.eye(4, dtype=np.float32)[:3]
+    vectors = {"single": np.stack([x]), "pair": np.stack([x, y]), "other": np.stack([y, z])}
+    for product_id, product_vectors in vectors.items():
+        dedup.update(product_id, product_vectors, [], vectors.__getitem__)
+
+    # "single" is covered by "pair"; "pair" and "other" only share one image
+    assert dedup.groups() == {"single": ["pair", "single"], "pair": ["pair", "single"]}
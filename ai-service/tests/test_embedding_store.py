@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from app.services.embedding_store import EmbeddingStore
+from app.services.similarity_search import SimilaritySearch
+
+
+@pytest.fixture
+def index(make_products):
+    index = SimilaritySearch(feature_size=8)
+    index.upsert_products(make_products(20))
+    return index
+
+
+def save(store, index, **kwargs):
+    return store.save(
+        index.matrix[:index.size], index.product_ids, index.products, "model", "1", **kwargs
+    )
+
+
+def test_metadata_only_change_keeps_rows_version(index):
+    rows_version, version = index.rows_version, index.version
+
+    product = dict(index.products["3"], id="3", price=99.0, feature_vector=np.array(index.matrix[index.product_rows["3"][0]]))
+    index.upsert_products([product])
+
+    assert index.version > version
+    assert index.rows_version == rows_version
+
+    index.remove_products(["4"])
+    assert index.rows_version > rows_version
+
+
+def test_snapshot_reuses_unchanged_rows(index, tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    first = (save(store, index) / "embeddings.npy").stat().st_ino
+
+    index.products["3"] = dict(index.products["3"], price=99.0)
+    second = save(store, index, reuse_rows=True)
+
+    assert (second / "embeddings.npy").stat().st_ino == first
+    matrix, product_ids, products, _ = store.load("model", "1", 8)
+    np.testing.assert_array_equal(matrix, index.matrix[:index.size])
+    assert products["3"]["price"] == 99.0
+
+    third = save(store, index)
+    assert (third / "embeddings.npy").stat().st_ino != first
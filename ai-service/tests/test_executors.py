@@ -0,0 +1,41 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.utils.executors import BoundedExecutor
+
+
+def test_broken_pool_is_replaced():
+    async def run():
+        pool = lambda: ProcessPoolExecutor(max_workers=1)
+        executor = BoundedExecutor(pool(), max_pending=4, name="Test", factory=pool)
+        assert await executor.run(abs, -1) == 1
+
+        # The job kills its worker in the first pool and again in the
+        # replacement, so it fails - but the pool left behind works
+        with pytest.raises(BrokenProcessPool):
+            await executor.run(os._exit, 1)
+        assert not executor.broken
+        assert executor.restarts == 2
+
+        assert await executor.run(abs, -2) == 2
+        results = await executor.map(abs, [-3, -4])
+        executor.shutdown()
+        return results
+
+    assert asyncio.run(run()) == [3, 4]
+
+
+def test_broken_pool_without_factory_stays_broken():
+    async def run():
+        executor = BoundedExecutor(ProcessPoolExecutor(max_workers=1), max_pending=4)
+        with pytest.raises(BrokenProcessPool):
+            await executor.run(os._exit, 1)
+        broken = executor.broken, executor.restart_if_broken()
+        executor.shutdown()
+        return broken
+
+    assert asyncio.run(run()) == (True, False)
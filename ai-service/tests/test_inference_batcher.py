@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services.inference_batcher import InferenceBatcher
+from app.utils.executors import ExecutorSaturatedError
+
+
+class FakeExtractor:
+    """Returns each image's first pixel as its 'features' and records batch sizes"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def extract_features_batch(self, images):
+        self.batches.append(len(images))
+        if self.fail:
+            raise ValueError("model failed")
+        return np.stack([image.reshape(-1)[:4] for image in images])
+
+
+def image(value):
+    return np.full((2, 2, 3), value, dtype=np.float32)
+
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_rows():
+    async def run():
+        extractor = FakeExtractor()
+        batcher = InferenceBatcher(extractor, max_batch_size=4, max_wait_ms=50)
+        batcher.start()
+        results = await asyncio.gather(*[batcher.extract(image(i)) for i in range(6)])
+        await batcher.stop()
+        return extractor.batches, results
+
+    batches, results = asyncio.run(run())
+    assert batches == [4, 2]
+    assert [float(row[0]) for row in results] == [0, 1, 2, 3, 4, 5]
+
+
+def test_model_errors_fail_every_request_in_the_batch():
+    async def run():
+        batcher = InferenceBatcher(FakeExtractor(fail=True), max_batch_size=4, max_wait_ms=50)
+        batcher.start()
+        results = await asyncio.gather(*[batcher.extract(image(i)) for i in range(3)], return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
+
+
+def test_full_queue_rejects_new_requests():
+    async def run():
+        batcher = InferenceBatcher(FakeExtractor(), max_queue_size=1)
+        batcher.queue = asyncio.Queue()
+        batcher.worker = object()  # started, but nothing takes requests off the queue
+        waiting = asyncio.ensure_future(batcher.extract(image(0)))
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorSaturatedError):
+            await batcher.extract(image(1))
+        waiting.cancel()
+
+    asyncio.run(run())
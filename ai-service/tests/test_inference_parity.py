@@ -0,0 +1,49 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from app.services.feature_extractor import FeatureExtractor
+from benchmarks.inference_backends import sample_images
+
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+
+
+def available(*modules):
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+@pytest.fixture(scope="module")
+def images():
+    return sample_images(None, 8)
+
+
+@pytest.fixture(scope="module")
+def reference(images):
+    baseline = FeatureExtractor(backend="keras", model_dir=MODEL_DIR)
+    baseline.load_model()
+    return baseline.extract_features_batch(images)
+
+
+@pytest.mark.parametrize("backend", [
+    "tf-function",
+    "tflite",
+    pytest.param("onnx", marks=pytest.mark.skipif(
+        not available("tf2onnx", "onnxruntime"), reason="needs tf2onnx and onnxruntime"
+    )),
+])
+def test_backend_matches_keras(backend, images, reference):
+    extractor = FeatureExtractor(backend=backend, model_dir=MODEL_DIR)
+    extractor.load_model()
+
+    features = extractor.extract_features_batch(images)
+    single = extractor.extract_features(images[0])
+
+    cosine = np.sum(features * reference, axis=1) / (
+        np.linalg.norm(features, axis=1) * np.linalg.norm(reference, axis=1)
+    )
+    assert cosine.min() >= 0.999
+    np.testing.assert_allclose(single, features[0], rtol=1e-4, atol=1e-4)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.utils.lru_cache import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(capacity=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_capacity_bounds_total_size():
+    cache = LRUCache(capacity=100, sizeof=lambda value: value.nbytes)
+    for i in range(5):
+        cache.put(i, np.zeros(10, dtype=np.float32))  # 40 bytes each
+
+    assert cache.stats()["entries"] == 2
+    assert cache.total_size == 80
+    assert cache.get(4) is not None and cache.get(2) is None
+
+    cache.put("big", np.zeros(100, dtype=np.float32))  # bigger than the whole cache
+    assert cache.get("big") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_replacing_a_key_updates_its_size():
+    cache = LRUCache(capacity=10, sizeof=len)
+    cache.put("a", "xxxx")
+    cache.put("a", "xx")
+    assert cache.total_size == 2
+    assert cache.get("a") == "xx"
+
+
+def test_stats_count_hits_and_misses():
+    cache = LRUCache(capacity=4)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+    cache.clear()
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 0)
+    assert stats["hit_rate"] == round(2 / 3, 4)
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from app.services.embedding_store import EmbeddingStore
+from app.services.quantization import ScalarQuantizer
+from app.services.similarity_search import SimilaritySearch
+
+
+@pytest.fixture
+def vectors():
+    vectors = np.random.default_rng(0).standard_normal((2000, 32)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_int8_round_trip_is_within_half_a_step(vectors):
+    quantizer = ScalarQuantizer("int8", block_size=256)
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    assert codes.dtype == np.uint8
+
+    # Values inside the learned range are off by at most half a step; the
+    # few clipped outliers beyond the 0.1/99.9 percentiles by a little more
+    error = np.abs(quantizer.decode(codes) - vectors)
+    inside = (vectors >= quantizer.offset) & (vectors <= quantizer.offset + 255 * quantizer.scale)
+    assert np.all((error <= quantizer.scale / 2 + 1e-6)[inside])
+    assert inside.mean() > 0.99
+
+
+def test_float16_round_trip(vectors):
+    quantizer = ScalarQuantizer("float16")
+    assert quantizer.is_trained and not quantizer.needs_training(len(vectors))
+    codes = quantizer.encode(vectors)
+    assert codes.dtype == np.float16
+    np.testing.assert_allclose(quantizer.decode(codes), vectors, atol=1e-3)
+
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_scores_match_the_decoded_vectors(vectors, kind):
+    quantizer = ScalarQuantizer(kind, block_size=300)
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    queries = vectors[:3]
+
+    expected = quantizer.decode(codes) @ queries.T
+    np.testing.assert_allclose(quantizer.score(codes, queries), expected, atol=1e-4)
+    np.testing.assert_allclose(quantizer.score(codes, queries[0]), expected[:, 0], atol=1e-4)
+
+
+def test_int8_retrains_when_the_catalog_doubles(vectors):
+    quantizer = ScalarQuantizer("int8")
+    assert not quantizer.needs_training(0)
+    assert quantizer.needs_training(10)
+    quantizer.train(vectors[:500])
+    assert not quantizer.needs_training(999)
+    assert quantizer.needs_training(1000)
+
+
+@pytest.mark.parametrize("kind, ratio", [("float16", 0.6), ("int8", 0.35)])
+def test_quantized_index_keeps_only_codes_in_memory(make_products, tmp_path, kind, ratio):
+    products = make_products(500, feature_size=64)
+    plain = SimilaritySearch(feature_size=64)
+    plain.sync_products(products)
+    quantized = SimilaritySearch(
+        feature_size=64, quantizer=ScalarQuantizer(kind), rerank_factor=4, store=EmbeddingStore(str(tmp_path))
+    )
+    quantized.sync_products(products)
+
+    usage = quantized.memory_usage()
+    assert usage["matrix"] == 0
+    assert usage["mapped"] == quantized.matrix.nbytes
+    assert usage["total"] < ratio * plain.memory_usage()["total"]
+
+    # Shortlists are re-ranked from the file-backed rows, so scores stay exact
+    for product in products[:20]:
+        expected = plain.search(product["feature_vector"], top_k=5)
+        found = quantized.search(product["feature_vector"], top_k=5)
+        assert [r["id"] for r in found][0] == product["id"]
+        np.testing.assert_allclose(
+            [r["similarity"] for r in found], [r["similarity"] for r in expected], atol=1e-5
+        )
+
+
+def test_quantized_index_stays_on_disk_when_loaded_and_grown(make_products, tmp_path):
+    products = make_products(100, feature_size=16)
+    store = EmbeddingStore(str(tmp_path))
+    source = SimilaritySearch(feature_size=16)
+    source.sync_products(products)
+    store.save(source.matrix[:source.size], source.product_ids, source.products, "model", "1")
+
+    index = SimilaritySearch(feature_size=16, quantizer=ScalarQuantizer("int8"), rerank_factor=4, store=store)
+    index.load_index(*store.load("model", "1", 16))
+    index.upsert_products(make_products(150, feature_size=16, seed=1)[100:])
+
+    assert index.size == 150
+    assert isinstance(index.matrix, np.memmap)
+    assert index.memory_usage()["matrix"] == 0
+    assert index.search(products[7]["feature_vector"], top_k=1)[0]["id"] == "7"
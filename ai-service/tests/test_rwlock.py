@@ -0,0 +1,35 @@
+import asyncio
+
+from app.utils.rwlock import ReadWriteLock
+
+
+def test_readers_share_and_writer_excludes():
+    async def run():
+        lock = ReadWriteLock()
+        events = []
+
+        async def reader(name, delay):
+            async with lock.read():
+                events.append(f"{name} in")
+                await asyncio.sleep(delay)
+                events.append(f"{name} out")
+
+        async def writer():
+            await asyncio.sleep(0.01)
+            async with lock.write():
+                events.append("writer")
+
+        async def late_reader():
+            await asyncio.sleep(0.02)
+            async with lock.read():
+                events.append("late reader")
+
+        await asyncio.gather(reader("a", 0.05), reader("b", 0.05), writer(), late_reader())
+        return events
+
+    events = asyncio.run(run())
+    # Both readers hold the lock at once; the writer waits for them, and a
+    # reader arriving while the writer waits goes after it
+    assert events[:2] == ["a in", "b in"]
+    assert events.index("writer") > max(events.index("a out"), events.index("b out"))
+    assert events.index("late reader") > events.index("writer")
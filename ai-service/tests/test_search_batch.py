@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from app.services.similarity_search import SimilaritySearch
+
+
+@pytest.fixture
+def products(make_products):
+    products = make_products(300, feature_size=16)
+    for i, product in enumerate(products):
+        product["categoryId"] = f"c{i % 3}"
+        product["price"] = float(i)
+    return products
+
+
+@pytest.fixture
+def index(products):
+    index = SimilaritySearch(feature_size=16)
+    index.similarity_threshold = 0.0
+    index.sync_products(products)
+    # Small tiles, so a batch spans several row tiles and query tiles
+    index.query_tile, index.row_tile = 4, 64
+    return index
+
+
+def ranking(results):
+    return [(r["id"], round(r["similarity"], 5)) for r in results]
+
+
+def test_batch_matches_single_searches(index, products):
+    queries = np.stack([product["feature_vector"] for product in products[:10]])
+    batch = index.search_batch(queries, top_k=5)
+
+    assert len(batch) == 10
+    for query, results in zip(queries, batch):
+        assert ranking(results) == ranking(index.search(query, top_k=5))
+
+
+def test_batch_matches_find_similar(index, products):
+    queries = np.stack([product["feature_vector"] for product in products[:5]])
+    for query, results in zip(queries, index.search_batch(queries, top_k=8)):
+        assert ranking(results) == ranking(index.find_similar(query, products, top_k=8))
+
+
+@pytest.mark.parametrize("filters", [
+    {"categories": ["c1"]},
+    {"min_price": 250.0},
+    {"categories": ["c0", "c2"], "max_price": 200.0},
+])
+def test_batch_applies_filters_like_search(index, products, filters):
+    queries = np.stack([product["feature_vector"] for product in products[20:26]])
+    for query, results in zip(queries, index.search_batch(queries, top_k=5, **filters)):
+        assert ranking(results) == ranking(index.search(query, top_k=5, **filters))
+
+
+def test_batch_excludes_the_query_product(index, products):
+    queries = np.stack([index.product_vector("7"), index.product_vector("8")])
+    results = index.search_batch(queries, top_k=3, exclude=["7", None])
+
+    assert "7" not in [r["id"] for r in results[0]]
+    assert len(results[0]) == 3
+    assert results[1][0]["id"] == "8"
@@ -0,0 +1,56 @@
+import os
+import signal
+
+import numpy as np
+import pytest
+
+from app.services.shard_pool import ShardPool
+from app.services.similarity_search import SimilaritySearch
+
+
+@pytest.fixture
+def indexes(make_products):
+    products = make_products(500, feature_size=32)
+    pool = ShardPool(2, timeout=1.0)
+    pool.start()
+    sharded = SimilaritySearch(feature_size=32, shards=pool)
+    local = SimilaritySearch(feature_size=32)
+    for index in (sharded, local):
+        index.similarity_threshold = -1
+        index.upsert_products(products)
+    yield sharded, local
+    pool.close()
+
+
+def ranked_ids(index, query):
+    return [result["id"] for result in index.search(query, top_k=10)]
+
+
+def test_search_survives_a_killed_worker(indexes):
+    sharded, local = indexes
+    query = np.random.default_rng(1).standard_normal(32)
+    expected = ranked_ids(local, query)
+    assert ranked_ids(sharded, query) == expected
+
+    worker = sharded.shards.processes[0]
+    worker.kill()
+    worker.join()
+
+    assert ranked_ids(sharded, query) == expected
+    assert all(process.is_alive() for process in sharded.shards.processes)
+    assert ranked_ids(sharded, query) == expected
+
+
+def test_stuck_worker_times_out_and_is_replaced(indexes):
+    sharded, local = indexes
+    query = np.random.default_rng(2).standard_normal(32)
+    expected = ranked_ids(local, query)
+
+    stuck = sharded.shards.processes[1]
+    os.kill(stuck.pid, signal.SIGSTOP)
+
+    # Answered in-process after the timeout; the stuck worker is replaced
+    assert ranked_ids(sharded, query) == expected
+    assert sharded.shards.processes[1] is not stuck
+    assert not stuck.is_alive()
+    assert ranked_ids(sharded, query) == expected
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from app.utils.vector_codec import (
+    RAW_MEDIA_TYPE, decode_vector, decode_vector_base64, encode_vector, encode_vector_base64, negotiate
+)
+
+
+@pytest.fixture
+def vector():
+    return np.random.default_rng(0).standard_normal(1280).astype(np.float32)
+
+
+def test_float32_round_trip_is_exact(vector):
+    data = encode_vector(vector)
+    assert len(data) == 1280 * 4
+    np.testing.assert_array_equal(decode_vector(data, dim=1280), vector)
+    np.testing.assert_array_equal(decode_vector_base64(encode_vector_base64(vector)), vector)
+
+
+def test_float16_round_trip_halves_the_size(vector):
+    data = encode_vector(vector, "float16")
+    assert len(data) == 1280 * 2
+    decoded = decode_vector_base64(encode_vector_base64(vector, "float16"), "float16")
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector, rtol=1e-3, atol=1e-3)
+
+
+def test_bytes_are_little_endian(vector):
+    assert encode_vector(vector[:2]) == vector[:2].astype("<f4").tobytes()
+
+
+def test_wrong_dimension_is_rejected(vector):
+    with pytest.raises(ValueError):
+        decode_vector(encode_vector(vector), dim=512)
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, ("json", "float32")),
+    ("application/json", ("json", "float32")),
+    (RAW_MEDIA_TYPE, ("raw", "float32")),
+    (f"{RAW_MEDIA_TYPE}; dtype=float16", ("raw", "float16")),
+    ("application/json; encoding=base64", ("base64", "float32")),
+    ("application/x-ndjson; encoding=base64; dtype=float16", ("base64", "float16")),
+    (f"{RAW_MEDIA_TYPE}; dtype=int8", ("raw", "float32")),
+    (f"text/html, {RAW_MEDIA_TYPE}", ("raw", "float32")),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "product_features" ADD COLUMN     "phash" TEXT;
@@ -0,0 +1,8 @@
+-- AlterTable
+ALTER TABLE "products" ADD COLUMN     "catalogUpdatedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Existing products start from their last update
+UPDATE "products" SET "catalogUpdatedAt" = "updatedAt";
+
+-- CreateIndex
+CREATE INDEX "products_catalogUpdatedAt_idx" ON "products"("catalogUpdatedAt");
@@ -0,0 +1,12 @@
+-- AlterTable
+ALTER TABLE "product_features" ADD COLUMN     "position" INTEGER NOT NULL DEFAULT 0;
+
+-- Existing rows take their image's position in the product's images
+UPDATE "product_features" AS pf
+SET "position" = array_position(p."images", pf."imageUrl") - 1
+FROM "products" AS p
+WHERE p."id" = pf."productId" AND array_position(p."images", pf."imageUrl") IS NOT NULL;
+
+-- Resend those products on the change feed, so the AI index picks up the new image order
+UPDATE "products" SET "catalogUpdatedAt" = CURRENT_TIMESTAMP
+WHERE "id" IN (SELECT DISTINCT "productId" FROM "product_features");
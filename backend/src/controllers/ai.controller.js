@@ -23,11 +23,14 @@ export const visualSearch = async (req, res) => {
       contentType: req.file.mimetype,
     })
 
-    // Add query parameters
-    const limit = req.query.limit || 10
-    const category = req.query.category || null
-
-    const url = `${AI_SERVICE_URL}/visual-search?limit=${limit}${category ? `&category=${category}` : ''}`
+    // Add query parameters (filters are applied inside the AI service's index)
+    const params = new URLSearchParams({ limit: req.query.limit || 10 })
+    if (req.query.category) params.append('category', req.query.category) // comma-separated IDs
+    if (req.query.minPrice) params.append('min_price', req.query.minPrice)
+    if (req.query.maxPrice) params.append('max_price', req.query.maxPrice)
+    if (req.query.inStock === 'true') params.append('in_stock', 'true')
+
+    const url = `${AI_SERVICE_URL}/visual-search?${params.toString()}`
     
     console.log('🔗 Calling:', url)
 
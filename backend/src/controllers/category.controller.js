@@ -107,6 +107,12 @@ export const updateCategory = async (req, res) => {
       }
     })
 
+    // Products carry the category in their AI index metadata
+    await prisma.product.updateMany({
+      where: { categoryId: id },
+      data: { catalogUpdatedAt: new Date() }
+    })
+
     console.log('✅ Category updated:', category.name)
 
     res.json({
@@ -151,7 +151,8 @@ export const createOrder = async (req, res) => {
       await prisma.product.update({
         where: { id: item.product.id },
         data: {
-          stock: { decrement: item.quantity }
+          stock: { decrement: item.quantity },
+          catalogUpdatedAt: new Date()
         }
       })
     }
@@ -209,7 +210,8 @@ export const cancelOrder = async (req, res) => {
       await prisma.product.update({
         where: { id: item.productId },
         data: {
-          stock: { increment: item.quantity }
+          stock: { increment: item.quantity },
+          catalogUpdatedAt: new Date()
         }
       })
     }
@@ -230,6 +230,7 @@ export const updateProduct = async (req, res) => {
         price: updateData.price ? parseFloat(updateData.price) : undefined,
         comparePrice: updateData.comparePrice ? parseFloat(updateData.comparePrice) : undefined,
         stock: updateData.stock ? parseInt(updateData.stock) : undefined,
+        catalogUpdatedAt: new Date(),
       },
       include: {
         category: true
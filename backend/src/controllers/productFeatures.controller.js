@@ -6,7 +6,155 @@ import path from 'path'
 
 const AI_SERVICE_URL = process.env.AI_SERVICE_URL || 'http://localhost:8000'
 
-// Extract and store features for a product
+// Feature vectors travel as base64 little-endian float32 instead of JSON float lists
+const BASE64_FEATURES = 'encoding=base64'
+
+const encodeFeatures = (features) =>
+  Buffer.from(new Float32Array(features).buffer).toString('base64')
+
+const wantsBase64Features = (req) => (req.get('Accept') || '').includes(BASE64_FEATURES)
+
+// Swap each product's feature lists for base64 payloads (in place)
+const encodeProductFeatures = (products) => {
+  for (const product of products) {
+    product.aiFeatures = product.aiFeatures.map(({ features, imageUrl, phash, colorHistogram }) => ({
+      imageUrl,
+      phash,
+      colorHistogram,
+      dtype: 'float32',
+      dim: features.length,
+      featuresB64: encodeFeatures(features)
+    }))
+  }
+}
+
+const decodeFeatures = (featuresB64) => {
+  const buffer = Buffer.from(featuresB64, 'base64')
+  const aligned = buffer.buffer.slice(buffer.byteOffset, buffer.byteOffset + buffer.length)
+  return Array.from(new Float32Array(aligned))
+}
+
+// Images sent to the AI service per batch request
+const AI_BATCH_SIZE = parseInt(process.env.AI_BATCH_SIZE || '32')
+
+// Every image of a product is embedded (up to this many), so any angle can match
+const MAX_IMAGES_PER_PRODUCT = parseInt(process.env.MAX_IMAGES_PER_PRODUCT || '10')
+
+// Load a product image from an external URL or the local uploads folder
+const loadProductImage = async (imagePath) => {
+  if (imagePath.startsWith('http://') || imagePath.startsWith('https://')) {
+    try {
+      const response = await axios.get(imagePath, {
+        responseType: 'arraybuffer',
+        timeout: 10000
+      })
+      return { imageBuffer: Buffer.from(response.data), imageName: path.basename(imagePath) }
+    } catch (downloadError) {
+      throw new Error(`Download failed: ${downloadError.message}`)
+    }
+  }
+  
+  const fullImagePath = path.join(process.cwd(), 'uploads', imagePath)
+  
+  if (!fs.existsSync(fullImagePath)) {
+    throw new Error('Image file not found')
+  }
+  
+  return { imageBuffer: await fs.promises.readFile(fullImagePath), imageName: path.basename(imagePath) }
+}
+
+// Load a product's images in parallel; each entry has its position in product.images
+// plus the buffer or the load error
+const loadProductImages = (product) =>
+  Promise.all(product.images.slice(0, MAX_IMAGES_PER_PRODUCT).map(async (imagePath, position) => {
+    try {
+      return { product, imagePath, position, ...(await loadProductImage(imagePath)) }
+    } catch (error) {
+      return { product, imagePath, position, error: error.message }
+    }
+  }))
+
+// Embed loaded images with the AI service's batch endpoint, AI_BATCH_SIZE per request.
+// Returns one result per image, in order: { features, phash, colorHistogram } or { error }
+const extractImageFeatures = async (images) => {
+  const results = []
+  
+  for (let start = 0; start < images.length; start += AI_BATCH_SIZE) {
+    const chunk = images.slice(start, start + AI_BATCH_SIZE)
+    
+    const formData = new FormData()
+    for (const { imageBuffer, imageName } of chunk) {
+      formData.append('files', imageBuffer, {
+        filename: imageName,
+        contentType: 'image/jpeg'
+      })
+    }
+    
+    let lines
+    try {
+      const response = await axios.post(
+        `${AI_SERVICE_URL}/extract-features/batch`,
+        formData,
+        {
+          headers: {
+            ...formData.getHeaders(),
+            Accept: `application/x-ndjson; ${BASE64_FEATURES}`
+          },
+          responseType: 'text',
+          maxBodyLength: Infinity,
+          maxContentLength: Infinity,
+          timeout: 300000
+        }
+      )
+      lines = response.data.split('\n').filter(Boolean).map(line => JSON.parse(line))
+    } catch (error) {
+      console.error(`❌ AI service batch failed:`, error.message)
+      const reason = error.response?.data?.detail || error.message
+      results.push(...chunk.map(() => ({ error: reason })))
+      continue
+    }
+    
+    // Results come back as NDJSON in upload order
+    const chunkResults = chunk.map(() => ({ error: 'No result from AI service' }))
+    for (const line of lines) {
+      if (line.done) continue
+      
+      const features = line.features_b64 ? decodeFeatures(line.features_b64) : line.features
+      chunkResults[line.index] = line.error || !Array.isArray(features) || features.length === 0
+        ? { error: line.error || 'Invalid features from AI service' }
+        : { features, phash: line.phash, colorHistogram: line.color_histogram }
+    }
+    results.push(...chunkResults)
+  }
+  
+  return results
+}
+
+// Replace a product's stored features with one row per embedded image.
+// Rows keep their image's position, so the primary image (position 0) reads back first
+const storeProductFeatures = (productId, imageFeatures) =>
+  prisma.$transaction([
+    prisma.productFeatures.deleteMany({
+      where: { productId }
+    }),
+    // Puts the product on the change feed
+    prisma.product.update({
+      where: { id: productId },
+      data: { catalogUpdatedAt: new Date() }
+    }),
+    prisma.productFeatures.createMany({
+      data: imageFeatures.map(({ imagePath, position, features, phash, colorHistogram }) => ({
+        productId,
+        imageUrl: imagePath,
+        position,
+        features,
+        phash: phash || null,
+        colorHistogram: colorHistogram || undefined
+      }))
+    })
+  ])
+
+// Extract and store features for a product (one vector per image)
 export const extractProductFeatures = async (req, res) => {
   try {
     const { productId } = req.params
@@ -24,101 +172,38 @@ export const extractProductFeatures = async (req, res) => {
       return res.status(400).json({ error: 'Product has no images' })
     }
     
-    console.log(`🔍 Extracting features for: ${product.name}`)
-    
-    // Get the first image path
-    const imagePath = product.images[0]
-    
-    // Check if it's an external URL or local path
-    let imageBuffer
-    let imageName
+    console.log(`🔍 Extracting features for: ${product.name} (${product.images.length} images)`)
     
-    if (imagePath.startsWith('http://') || imagePath.startsWith('https://')) {
-      // External URL - download it
-      console.log(`🌐 Downloading image from URL: ${imagePath}`)
-      
-      try {
-        const response = await axios.get(imagePath, {
-          responseType: 'arraybuffer',
-          timeout: 10000
-        })
-        imageBuffer = Buffer.from(response.data)
-        imageName = path.basename(imagePath)
-        console.log(`✅ Downloaded ${imageBuffer.length} bytes`)
-      } catch (downloadError) {
-        console.error('❌ Failed to download image:', downloadError.message)
-        return res.status(400).json({ 
-          error: 'Failed to download product image',
-          url: imagePath,
-          details: downloadError.message
-        })
-      }
-    } else {
-      // Local file path
-      const fullImagePath = path.join(process.cwd(), 'uploads', imagePath)
-      
-      if (!fs.existsSync(fullImagePath)) {
-        return res.status(400).json({ 
-          error: 'Image file not found',
-          path: imagePath 
-        })
-      }
-      
-      imageBuffer = fs.readFileSync(fullImagePath)
-      imageName = path.basename(imagePath)
-    }
+    const images = await loadProductImages(product)
+    const loaded = images.filter(image => !image.error)
+    const results = await extractImageFeatures(loaded)
     
-    // Call AI service to extract features
-    const formData = new FormData()
-    formData.append('file', imageBuffer, { 
-      filename: imageName,
-      contentType: 'image/jpeg' // Force image content type
-    })
+    const embedded = loaded
+      .map((image, i) => ({ imagePath: image.imagePath, position: image.position, ...results[i] }))
+      .filter(image => !image.error)
+    const errors = [
+      ...images.filter(image => image.error),
+      ...loaded.map((image, i) => ({ imagePath: image.imagePath, error: results[i].error })).filter(image => image.error)
+    ].map(({ imagePath, error }) => ({ image: imagePath, reason: error }))
     
-    let features
-    try {
-      const response = await axios.post(
-        `${AI_SERVICE_URL}/extract-features`,
-        formData,
-        {
-          headers: formData.getHeaders(),
-          timeout: 30000 // 30 second timeout
-        }
-      )
-      
-      features = response.data.features
-      console.log(`✅ AI service extracted ${response.data.feature_vector_size} features`)
-      
-    } catch (aiError) {
-      console.error('❌ AI service error:', aiError.message)
-      return res.status(500).json({ 
-        error: 'Failed to extract features from AI service',
-        details: aiError.message 
+    if (embedded.length === 0) {
+      return res.status(400).json({ 
+        error: 'Failed to extract features from any product image',
+        errors
       })
     }
     
-    // Delete old features if exist
-    await prisma.productFeatures.deleteMany({
-      where: { productId: product.id }
-    })
-    
-    // Store new features in database
-    const savedFeatures = await prisma.productFeatures.create({
-      data: {
-        productId: product.id,
-        imageUrl: imagePath,
-        features: features, // Store the real AI-extracted features
-      }
-    })
+    await storeProductFeatures(product.id, embedded)
     
-    console.log(`✅ Features stored in database for: ${product.name}`)
+    console.log(`✅ Features stored in database for: ${product.name} (${embedded.length} images)`)
     
     res.json({
       message: 'Features extracted and stored successfully',
       productId: product.id,
       productName: product.name,
-      featureVectorSize: features.length,
-      featuresId: savedFeatures.id
+      featureVectorSize: embedded[0].features.length,
+      imagesEmbedded: embedded.length,
+      errors: errors.length > 0 ? errors : undefined
     })
     
   } catch (error) {
@@ -137,128 +222,70 @@ export const extractAllProductFeatures = async (req, res) => {
       where: { isActive: true }
     })
     
-    console.log(`📦 Processing ${products.length} products...`)
+    console.log(`📦 Processing ${products.length} products, images in batches of ${AI_BATCH_SIZE}...`)
     
     let processed = 0
     let failed = 0
+    let imagesEmbedded = 0
     const errors = []
     
-    for (const product of products) {
-      try {
-        if (!product.images || product.images.length === 0) {
-          console.log(`⚠️  Skipping ${product.name} - no images`)
-          failed++
-          errors.push({ product: product.name, reason: 'No images' })
-          continue
-        }
-        
-        // Get image path
-        const imagePath = product.images[0]
-        
-        // Handle external URL or local path
-        let imageBuffer
-        let imageName
-        
-        if (imagePath.startsWith('http://') || imagePath.startsWith('https://')) {
-          // Download external image
-          try {
-            const response = await axios.get(imagePath, {
-              responseType: 'arraybuffer',
-              timeout: 10000
-            })
-            imageBuffer = Buffer.from(response.data)
-            imageName = path.basename(imagePath)
-          } catch (downloadError) {
-            console.log(`⚠️  Failed to download ${product.name}: ${downloadError.message}`)
-            failed++
-            errors.push({ 
-              product: product.name, 
-              reason: `Download failed: ${downloadError.message}` 
-            })
-            continue
-          }
+    const fail = (product, reason) => {
+      console.log(`⚠️  Skipping ${product.name} - ${reason}`)
+      failed++
+      errors.push({ product: product.name, reason })
+    }
+    
+    for (let start = 0; start < products.length; start += AI_BATCH_SIZE) {
+      const chunk = products.slice(start, start + AI_BATCH_SIZE)
+      
+      // Load all of this chunk's images in parallel
+      const withImages = chunk.filter(product => {
+        if (product.images && product.images.length > 0) return true
+        fail(product, 'No images')
+        return false
+      })
+      const images = (await Promise.all(withImages.map(loadProductImages))).flat()
+      const loaded = images.filter(image => !image.error)
+      const results = await extractImageFeatures(loaded)
+      
+      // Group embedded images back by product
+      const byProduct = new Map(withImages.map(product => [product.id, { product, embedded: [], reasons: [] }]))
+      for (const image of images.filter(image => image.error)) {
+        byProduct.get(image.product.id).reasons.push(image.error)
+      }
+      loaded.forEach((image, i) => {
+        const entry = byProduct.get(image.product.id)
+        if (results[i].error) {
+          entry.reasons.push(results[i].error)
         } else {
-          // Local file
-          const fullImagePath = path.join(process.cwd(), 'uploads', imagePath)
-          
-          if (!fs.existsSync(fullImagePath)) {
-            console.log(`⚠️  Skipping ${product.name} - image file not found`)
-            failed++
-            errors.push({ product: product.name, reason: 'Image file not found' })
-            continue
-          }
-          
-          imageBuffer = fs.readFileSync(fullImagePath)
-          imageName = path.basename(imagePath)
+          const { features, phash, colorHistogram } = results[i]
+          entry.embedded.push({ imagePath: image.imagePath, position: image.position, features, phash, colorHistogram })
         }
-        
-        // Call AI service
-        const formData = new FormData()
-        formData.append('file', imageBuffer, { 
-          filename: imageName,
-          contentType: 'image/jpeg'
-        })
-        
-        const response = await axios.post(
-          `${AI_SERVICE_URL}/extract-features`,
-          formData,
-          {
-            headers: formData.getHeaders(),
-            timeout: 30000
-          }
-        )
-        
-        const features = response.data.features
-        
-        if (!features || !Array.isArray(features) || features.length === 0) {
-          console.error(`❌ Invalid features received for ${product.name}`)
-          failed++
-          errors.push({ 
-            product: product.name, 
-            reason: 'Invalid features from AI service' 
-          })
+      })
+      
+      for (const { product, embedded, reasons } of byProduct.values()) {
+        if (embedded.length === 0) {
+          fail(product, reasons[0] || 'No images could be embedded')
           continue
         }
         
-        console.log(`✅ AI extracted ${features.length} features for ${product.name}`)
-        
-        // Delete old features
-        await prisma.productFeatures.deleteMany({
-          where: { productId: product.id }
-        })
-        
-        // Store new features
-        await prisma.productFeatures.create({
-          data: {
-            productId: product.id,
-            imageUrl: imagePath,
-            features: features,
-          }
-        })
-        
-        processed++
-        console.log(`✅ ${processed}/${products.length}: ${product.name}`)
-        
-        // Small delay to avoid overwhelming the AI service
-        await new Promise(resolve => setTimeout(resolve, 100))
-        
-      } catch (error) {
-        console.error(`❌ Failed for ${product.name}:`, error.message)
-        if (error.response) {
-          console.error(`   AI Service Response:`, error.response.status, error.response.data)
+        try {
+          await storeProductFeatures(product.id, embedded)
+          processed++
+          imagesEmbedded += embedded.length
+        } catch (error) {
+          fail(product, error.message)
         }
-        failed++
-        errors.push({ 
-          product: product.name, 
-          reason: error.response?.data?.detail || error.message 
-        })
       }
+      
+      console.log(`✅ ${processed}/${products.length} products processed`)
     }
     
     res.json({
       message: 'Batch feature extraction completed',
       total: products.length,
       processed,
+      imagesEmbedded,
       failed,
       errors: failed > 0 ? errors : undefined
     })
@@ -277,8 +304,10 @@ export const getProductFeatures = async (req, res) => {
   try {
     const { productId } = req.params
     
+    // The primary image's vector (position 0), like the feed and list endpoints
     const features = await prisma.productFeatures.findFirst({
       where: { productId },
+      orderBy: [{ position: 'asc' }, { id: 'asc' }],
       include: {
         product: {
           select: {
@@ -310,7 +339,7 @@ export const getProductFeatures = async (req, res) => {
 // Get all products with their features (for AI service)
 export const getAllProductsWithFeatures = async (req, res) => {
   try {
-    const { category, limit = 100 } = req.query
+    const { category, limit = 100, offset = 0, afterId, beforeId } = req.query
     
     const where = {
       isActive: true,
@@ -323,14 +352,96 @@ export const getAllProductsWithFeatures = async (req, res) => {
       where.categoryId = category
     }
     
-    const products = await prisma.product.findMany({
-      where,
-      take: parseInt(limit),
+    // Keyset paging (afterId/beforeId) doesn't skip rows when products are added
+    // or removed between pages, and lets callers fetch disjoint id ranges in parallel
+    const keyset = afterId !== undefined || beforeId !== undefined
+    if (keyset) {
+      where.id = {
+        ...(afterId ? { gt: afterId } : {}),
+        ...(beforeId ? { lt: beforeId } : {})
+      }
+    }
+    
+    const [products, total] = await Promise.all([
+      prisma.product.findMany({
+        where,
+        skip: keyset ? 0 : parseInt(offset),
+        take: parseInt(limit),
+        orderBy: { id: 'asc' },
+        include: {
+          aiFeatures: {
+            // Primary image first, in a stable order so unchanged vectors keep their index rows
+            orderBy: [{ position: 'asc' }, { id: 'asc' }],
+            select: {
+              features: true,
+              imageUrl: true,
+              phash: true,
+              colorHistogram: true
+            }
+          },
+          category: {
+            select: {
+              id: true,
+              name: true,
+              slug: true
+            }
+          }
+        }
+      }),
+      keyset ? null : prisma.product.count({ where })
+    ])
+    
+    // Binary-friendly clients (the AI service) get base64 vectors instead of float lists
+    if (wantsBase64Features(req)) encodeProductFeatures(products)
+    
+    res.json(keyset
+      ? { products, nextAfterId: products.length === parseInt(limit) ? products[products.length - 1].id : null }
+      : { products, total, offset: parseInt(offset) })
+    
+  } catch (error) {
+    console.error('Get products with features error:', error)
+    res.status(500).json({ 
+      error: 'Failed to get products with features',
+      details: error.message 
+    })
+  }
+}
+
+// Get products whose features or catalog data changed since a cursor (for AI service sync).
+// Keyed on catalogUpdatedAt, so view counts and rating updates don't resend vectors
+export const getProductFeatureChanges = async (req, res) => {
+  try {
+    const { since, limit = 1000 } = req.query
+    
+    // Captured before querying, so nothing committed after this point is missed next time
+    const cursor = new Date().toISOString()
+    
+    // No cursor yet: just hand one out; the caller does a full fetch first
+    if (!since) {
+      return res.json({ products: [], removed: [], cursor, hasMore: false })
+    }
+    
+    const sinceDate = new Date(since)
+    if (isNaN(sinceDate.getTime())) {
+      return res.status(400).json({ error: 'Invalid since timestamp' })
+    }
+    
+    const take = parseInt(limit)
+    const changed = await prisma.product.findMany({
+      where: {
+        catalogUpdatedAt: { gt: sinceDate }
+      },
+      orderBy: { catalogUpdatedAt: 'asc' },
+      take: take + 1,
       include: {
         aiFeatures: {
+          // Primary image first, in a stable order so unchanged vectors keep their index rows
+          orderBy: [{ position: 'asc' }, { id: 'asc' }],
           select: {
             features: true,
-            imageUrl: true
+            imageUrl: true,
+            phash: true,
+            colorHistogram: true
           }
         },
         category: {
@@ -343,16 +454,30 @@ export const getAllProductsWithFeatures = async (req, res) => {
       }
     })
     
+    // More changes than one response holds: caller should fall back to a full fetch
+    const hasMore = changed.length > take
+    const page = changed.slice(0, take)
+    
+    // Deactivated products and products that lost their features leave the index
+    const removed = page
+      .filter(product => !product.isActive || product.aiFeatures.length === 0)
+      .map(product => product.id)
+    const products = page.filter(product => product.isActive && product.aiFeatures.length > 0)
+    
+    if (wantsBase64Features(req)) encodeProductFeatures(products)
+    
     res.json({
       products,
-      total: products.length
+      removed,
+      cursor,
+      hasMore
     })
     
   } catch (error) {
-    console.error('Get products with features error:', error)
+    console.error('Get product feature changes error:', error)
     res.status(500).json({ 
-      error: 'Failed to get products with features',
+      error: 'Failed to get product feature changes',
       details: error.message 
     })
   }
-}
\ No newline at end of file
+}
@@ -3,7 +3,8 @@ import {
   extractProductFeatures,
   extractAllProductFeatures,
   getProductFeatures,
-  getAllProductsWithFeatures
+  getAllProductsWithFeatures,
+  getProductFeatureChanges
 } from '../controllers/productFeatures.controller.js'
 import { authenticate, requireAdmin } from '../middleware/auth.middleware.js'
 
@@ -13,6 +14,9 @@ const router = express.Router()
 // Get all products with features (public - for AI service)
 router.get('/all', getAllProductsWithFeatures)
 
+// Products changed since a cursor (public - for AI service incremental sync)
+router.get('/changes', getProductFeatureChanges)
+
 // Extract features for single product (admin only)
 router.post('/extract/:productId', authenticate, requireAdmin, extractProductFeatures)
 
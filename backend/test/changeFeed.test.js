@@ -0,0 +1,72 @@
+import { test, before, after } from 'node:test'
+import assert from 'node:assert/strict'
+
+// Needs a migrated database: DATABASE_URL=... npm test
+const skip = !process.env.DATABASE_URL && 'DATABASE_URL is not set'
+
+const call = async (handler, req) => {
+  const res = {
+    statusCode: 200,
+    body: undefined,
+    status (code) { this.statusCode = code; return this },
+    json (body) { this.body = body; return this }
+  }
+  await handler({ params: {}, query: {}, body: {}, ...req }, res)
+  return res
+}
+
+let prisma, getProduct, updateProduct, getProductFeatureChanges
+let category, product
+
+before(async () => {
+  if (skip) return
+  ;({ default: prisma } = await import('../src/utils/prisma.js'))
+  ;({ getProduct, updateProduct } = await import('../src/controllers/product.controller.js'))
+  ;({ getProductFeatureChanges } = await import('../src/controllers/productFeatures.controller.js'))
+
+  const suffix = Date.now()
+  category = await prisma.category.create({
+    data: { name: `Feed test ${suffix}`, slug: `feed-test-${suffix}` }
+  })
+  product = await prisma.product.create({
+    data: {
+      name: `Feed test ${suffix}`,
+      slug: `feed-test-${suffix}`,
+      description: 'Change feed test product',
+      price: 10,
+      categoryId: category.id
+    }
+  })
+})
+
+after(async () => {
+  if (skip) return
+  await prisma.product.deleteMany({ where: { categoryId: category.id } })
+  await prisma.category.delete({ where: { id: category.id } })
+  await prisma.$disconnect()
+})
+
+const changedIds = async (since) => {
+  const res = await call(getProductFeatureChanges, { query: { since } })
+  assert.equal(res.statusCode, 200)
+  // A product without features is reported as removed; either way it changed
+  return [...res.body.products.map(p => p.id), ...res.body.removed]
+}
+
+test('a product view does not put the product on the change feed', { skip }, async () => {
+  const { body: { cursor } } = await call(getProductFeatureChanges, {})
+
+  const view = await call(getProduct, { params: { id: product.id } })
+  assert.equal(view.statusCode, 200)
+
+  assert.ok(!(await changedIds(cursor)).includes(product.id))
+})
+
+test('a product edit puts the product on the change feed', { skip }, async () => {
+  const { body: { cursor } } = await call(getProductFeatureChanges, {})
+
+  const edit = await call(updateProduct, { params: { id: product.id }, body: { stock: '5' } })
+  assert.equal(edit.statusCode, 200)
+
+  assert.ok((await changedIds(cursor)).includes(product.id))
+})
@@ -7,7 +7,14 @@ export const aiAPI = {
     
     const params = new URLSearchParams()
     if (options.limit) params.append('limit', options.limit)
-    if (options.category) params.append('category', options.category)
+    if (options.category) {
+      // One ID or an array of IDs
+      const categories = Array.isArray(options.category) ? options.category : [options.category]
+      params.append('category', categories.join(','))
+    }
+    if (options.minPrice != null) params.append('minPrice', options.minPrice)
+    if (options.maxPrice != null) params.append('maxPrice', options.maxPrice)
+    if (options.inStock) params.append('inStock', 'true')
     
     const url = `/ai/visual-search${params.toString() ? '?' + params.toString() : ''}`
     